@@ -0,0 +1,112 @@
+"""Concurrency benchmark for getFeedSkeleton while feeds are being refreshed.
+
+Fires concurrent skeleton requests at the app (in-process, via ASGI) while
+synthetic refreshes continuously read feed configs and write the cache to
+SQLite, and reports request latency percentiles and refresh throughput.
+
+Usage:
+    python bench_skeleton.py --feeds 20 --requests 5000 --concurrency 64
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("HOSTNAME", "localhost")
+os.environ["FEEDS_DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bench_feeds.db")
+
+import httpx
+
+from server import repository
+from server.app import app
+from server.algos import algos, load_algos
+from server.algos.cache import skeleton_cache
+from server.algos.feed import make_handler
+from server.algos.refresh import refresh_scheduler
+from server.repository import Source
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+async def setup_feeds(count: int) -> list[str]:
+    uris = []
+    for i in range(count):
+        uri = f"at://did:plc:bench/app.bsky.feed.generator/bench-{i}"
+        data = {"handle": "bench.test", "record_name": f"bench-{i}", "display_name": f"Bench {i}"}
+        sources = [Source("topic_preference", f"topic {j}", 1.0) for j in range(5)]
+        sources += [Source("account_preference", f"did:plc:author{j}", 1.0) for j in range(10)]
+        await repository.save_feed(uri, data, sources)
+        algos[uri] = make_handler(uri)
+        uris.append(uri)
+    return uris
+
+
+def synthetic_build(feed_uri: str, build_ms: float, stats: dict):
+    async def build():
+        # Real storage work: config read + cache write; sleep stands in for network fetches
+        await repository.load_feed_config(feed_uri)
+        await asyncio.sleep(build_ms / 1000)
+        uris = [f"at://did:plc:author{i % 10}/app.bsky.feed.post/{random.getrandbits(48):x}" for i in range(1000)]
+        skeleton_cache.put(feed_uri, int(time.time() * 1000), uris)
+        await repository.run(skeleton_cache.flush)
+        stats["refreshes"] += 1
+    return build
+
+
+async def refresh_pressure(uris: list[str], stop: asyncio.Event):
+    while not stop.is_set():
+        refresh_scheduler.refresh(random.choice(uris))
+        await asyncio.sleep(0.005)
+
+
+async def main(args):
+    await repository.run(load_algos)
+    uris = await setup_feeds(args.feeds)
+    stats = {"refreshes": 0}
+    for uri in uris:
+        refresh_scheduler.builders[uri] = synthetic_build(uri, args.build_ms, stats)
+        await refresh_scheduler.refresh(uri)  # warm
+
+    stop = asyncio.Event()
+    pressure = asyncio.create_task(refresh_pressure(uris, stop))
+    latencies = []
+    queue = asyncio.Queue()
+    for _ in range(args.requests):
+        queue.put_nowait(random.choice(uris))
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def worker():
+            while not queue.empty():
+                feed = queue.get_nowait()
+                start = time.perf_counter()
+                r = await client.get("/xrpc/app.bsky.feed.getFeedSkeleton", params={"feed": feed, "limit": 30})
+                latencies.append((time.perf_counter() - start) * 1000)
+                assert r.status_code == 200, r.text
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    stop.set()
+    await pressure
+
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))]
+    print(f"requests:   {len(latencies)} in {elapsed:.2f}s ({len(latencies) / elapsed:.0f} req/s)")
+    print(f"latency ms: p50={pct(50):.2f} p95={pct(95):.2f} p99={pct(99):.2f} "
+          f"max={latencies[-1]:.2f} mean={statistics.mean(latencies):.2f}")
+    print(f"refreshes completed during run: {stats['refreshes']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--feeds", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--build-ms", type=float, default=50, help="simulated network time per refresh")
+    asyncio.run(main(parser.parse_args()))
@@ -10,6 +10,7 @@ set +a
 
 HOST="${HOST:-0.0.0.0}"
 PORT="${PORT:-8000}"
+WORKERS="${WORKERS:-1}"
 
 start() {
   if [ -f "$PID_FILE" ] && kill -0 $(cat "$PID_FILE") 2>/dev/null; then
@@ -17,7 +18,21 @@ start() {
     exit 1
   fi
 
-  nohup uvicorn "$SCRIPT" --host "$HOST" --port "$PORT" --reload > "$LOG_FILE" 2>&1 &
+  # The embedder reads tokenizer.json next to the model and never downloads it at runtime
+  TOKENIZER="${EMBEDDING_TOKENIZER_PATH:-server/algos/tokenizer.json}"
+  if [ ! -f "$TOKENIZER" ]; then
+    python3 -m bluesky_shared.embedding export-tokenizer "$TOKENIZER" || exit 1
+  fi
+
+  # --reload only works with a single process; with WORKERS > 1 skeleton serving
+  # is spread across processes that share feeds.db
+  if [ "$WORKERS" -gt 1 ]; then
+    RUN_OPTS="--workers $WORKERS"
+  else
+    RUN_OPTS="--reload"
+  fi
+
+  nohup uvicorn "$SCRIPT" --host "$HOST" --port "$PORT" $RUN_OPTS > "$LOG_FILE" 2>&1 &
   echo $! > "$PID_FILE"
   echo "Started Bluesky Feed Manager service (PID $(cat "$PID_FILE")). Logs: $LOG_FILE"
 }
@@ -1,17 +1,59 @@
+import asyncio
+
 from .feed import make_handler
-from server.models import db, Feed, FeedSource, FeedCache
+from .cache import skeleton_cache
+from .refresh import refresh_scheduler
+from server import repository
+from server.models import db, Feed, FeedSource, FeedCache, FeedLease, DidKey, migrate_columns
+
+REGISTRY_POLL_INTERVAL = 2  # seconds between checks for feeds created by other workers
 
 # Dictionary mapping feed URI to handler
 algos = {}
 
-# Connect to the database at startup
-db.connect(reuse_if_open=True)
 
-# Ensure tables exist
-db.create_tables([Feed, FeedSource, FeedCache], safe=True)
+def load_algos():
+    """Open the database and register a handler for every persisted feed.
+
+    Called from the app lifespan rather than at import time, so importing the
+    server (workers, scripts, tooling) doesn't touch SQLite.
+    """
+    db.connect(reuse_if_open=True)
+
+    # Ensure tables exist
+    db.create_tables([Feed, FeedSource, FeedCache, FeedLease, DidKey], safe=True)
+    migrate_columns([Feed, FeedSource, FeedCache])
+
+    # Load all persisted feeds into algos
+    for feed in Feed.select():
+        algos[feed.uri] = make_handler(feed.uri)
+
+    # Restore persisted skeletons into the in-memory cache
+    skeleton_cache.load()
+
+    # Do NOT close the DB here — leave it open for the lifetime of the server
+
+
+async def sync_algos():
+    """Make `algos` match the Feed table (feeds may be created by any worker)."""
+    uris = set(await repository.list_feed_uris())
+    for uri in uris - algos.keys():
+        algos[uri] = make_handler(uri)
+        await skeleton_cache.reload(uri)
+    for uri in algos.keys() - uris:
+        del algos[uri]
+        refresh_scheduler.unregister(uri)
 
-# Load all persisted feeds into algos
-for feed in Feed.select():
-    algos[feed.uri] = make_handler(feed.uri)
 
-# Do NOT close the DB here — leave it open for the lifetime of the server
+async def run_registry_sync():
+    """Poll the feed registry's version and resync `algos` when it changes, until cancelled."""
+    version = await repository.feed_registry_version()
+    while True:
+        await asyncio.sleep(REGISTRY_POLL_INTERVAL)
+        try:
+            current = await repository.feed_registry_version()
+            if current != version:
+                await sync_algos()
+                version = current
+        except Exception as e:
+            print("Feed registry sync failed:", e)
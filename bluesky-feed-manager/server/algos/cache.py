@@ -0,0 +1,118 @@
+import asyncio
+import json
+import time
+
+from server import repository
+from server.models import db, FeedCache
+from server.algos.pagination import CandidateLists, clamp_limit
+
+WRITE_BEHIND_INTERVAL = 5  # seconds between flushes of refreshed feeds to SQLite
+PAGE_CACHE_LIMIT = 64  # serialized pages kept per feed
+EMPTY_PAGE = b'{"feed":[]}'
+
+
+class CacheEntry:
+    """In-memory state of one feed: candidate lists plus pre-serialized pages."""
+
+    __slots__ = ("lists", "timestamp", "pages")
+
+    def __init__(self):
+        self.lists = CandidateLists()
+        self.timestamp = 0
+        self.pages = {}
+
+
+class SkeletonCache:
+    """Process-local feed skeleton cache.
+
+    Serving a page is a dict lookup that returns ready-to-send JSON bytes.
+    SQLite (the FeedCache table) is only a write-behind persistence layer,
+    read at startup so restarts don't begin with empty feeds, and by
+    `reload` when another worker may have rebuilt a feed.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.dirty = {}
+
+    def load(self):
+        """Restore every persisted feed from SQLite."""
+        for row in FeedCache.select():
+            self._install(row)
+
+    def _install(self, row):
+        uris = json.loads(row.response_json)
+        if isinstance(uris, dict):  # skeleton stored before candidate lists existed
+            uris = [item["post"] for item in uris.get("feed", [])]
+        entry = self.entries.setdefault(row.feed_uri, CacheEntry())
+        entry.lists.add(row.version, uris)
+        entry.timestamp = row.timestamp
+        entry.pages.clear()
+
+    async def reload(self, feed_uri: str) -> bool:
+        """Adopt the persisted skeleton if it is newer than ours (e.g. built by another worker)."""
+        entry = self.entries.get(feed_uri)
+        latest = entry.lists.latest if entry is not None else None
+        row = await repository.run(FeedCache.get_or_none, FeedCache.feed_uri == feed_uri)
+        if row is None or (latest is not None and row.version <= latest):
+            return False
+        self._install(row)
+        return True
+
+    def get(self, feed_uri: str):
+        return self.entries.get(feed_uri)
+
+    def put(self, feed_uri: str, version: int, uris: list[str]):
+        """Publish a new candidate list and queue it for persistence."""
+        entry = self.entries.setdefault(feed_uri, CacheEntry())
+        entry.lists.add(version, uris)
+        entry.timestamp = int(time.time())
+        entry.pages.clear()
+        self.dirty[feed_uri] = (version, uris, entry.timestamp)
+
+    def page(self, feed_uri: str, cursor: str = None, limit: int = 20) -> bytes:
+        """Return a serialized getFeedSkeleton page for a cached feed."""
+        entry = self.entries.get(feed_uri)
+        if entry is None:
+            return EMPTY_PAGE
+        key = (entry.lists.latest, cursor or "", clamp_limit(limit))
+        body = entry.pages.get(key)
+        if body is None:
+            body = json.dumps(entry.lists.page(cursor, limit), separators=(",", ":")).encode()
+            if len(entry.pages) >= PAGE_CACHE_LIMIT:
+                entry.pages.pop(next(iter(entry.pages)))
+            entry.pages[key] = body
+        return body
+
+    def flush(self):
+        """Write refreshed feeds to SQLite (runs on the repository's DB thread)."""
+        dirty, self.dirty = self.dirty, {}
+        if not dirty:
+            return
+        rows = [
+            {"feed_uri": feed_uri, "response_json": json.dumps(uris), "version": version, "timestamp": timestamp}
+            for feed_uri, (version, uris, timestamp) in dirty.items()
+        ]
+        try:
+            with db.atomic():
+                FeedCache.insert_many(rows).on_conflict_replace().execute()
+        except Exception:
+            # Keep the entries queued unless a newer refresh replaced them meanwhile
+            for feed_uri, item in dirty.items():
+                self.dirty.setdefault(feed_uri, item)
+            raise
+
+    async def run_write_behind(self):
+        """Periodically persist refreshed feeds until cancelled."""
+        try:
+            while True:
+                await asyncio.sleep(WRITE_BEHIND_INTERVAL)
+                try:
+                    await repository.run(self.flush)
+                except Exception as e:
+                    print("Feed cache flush failed:", e)
+        finally:
+            await repository.run(self.flush)
+
+
+skeleton_cache = SkeletonCache()
@@ -2,39 +2,58 @@ import os
 import json
 import httpx
 import numpy as np
-import onnxruntime as ort
-from transformers import AutoTokenizer
 import asyncio
 import time
-from server.models import Feed, FeedSource, FeedCache
+from functools import lru_cache
+from server import repository
+from bluesky_shared.bloom import BloomFilter
+from bluesky_shared.embedding import Embedder
+from bluesky_shared.upstream import UpstreamClient, UpstreamError
+from server.algos.ranking import Candidate, candidate_store, parse_ranking_weights, rank_candidates
+from server.algos.cache import skeleton_cache
+from server.algos.refresh import CACHE_TTL, refresh_scheduler
 
-CACHE_TTL = 60  # seconds
 RESPONSE_LIMIT = 20 # number of posts to be received from api response
-FEED_LIMIT = 50 # number of total posts in a feed
+CANDIDATE_LIMIT = 1000 # number of ranked posts stored per feed refresh
+POOL_LIMIT = 500 # number of pre-matched posts read from the ingester's candidate pool
+MATCH_THRESHOLD = float(os.environ.get("FEED_MATCH_THRESHOLD", 0.45)) # keep equal to the PDS ingester's FEED_MATCH_THRESHOLD
+GET_POSTS_BATCH = 25 # max uris accepted by app.bsky.feed.getPosts
+TOMBSTONE_REFRESH = 30 # seconds between downloads of the deleted-posts filter
+SEARCH_WINDOW_HOURS = float(os.environ.get("SEARCH_WINDOW_HOURS", 0)) # topic search only looks this far back (0 = all stored posts), at most the PDS HOT_INDEX_HOURS
 
 CUSTOM_API_URL = os.environ.get("CUSTOM_API_URL")
 
+# Bluesky's public AppView (BSKY_PUBLIC_API_URL overrides it): paced to its
+# rate limits, retried, hedged and circuit-broken; see bluesky_shared.upstream
+appview = UpstreamClient()
+
 # ONNX model setup
 MODEL_PATH = os.path.join(os.path.dirname(__file__), "all-MiniLM-L6-v2.onnx")
-TOKENIZER_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 
-tokenizer = AutoTokenizer.from_pretrained(TOKENIZER_NAME)
-session = ort.InferenceSession(MODEL_PATH, providers=["CPUExecutionProvider"])
+embedder = Embedder(MODEL_PATH)
+
+
+def embed_text(text: str) -> np.ndarray:
+    """Return a unit-length embedding comparable to those stored by the PDS."""
+    return embedder.encode(text)[0]
+
+
+@lru_cache(maxsize=1024)
+def topic_vector(topic: str) -> np.ndarray:
+    """Embedding of a topic name, shared by every feed that uses the topic."""
+    return embed_text(topic)
 
-def encode_onnx(texts):
-    """Return embedding vectors using the ONNX model."""
-    if isinstance(texts, str):
-        texts = [texts]
-    inputs = tokenizer(texts, padding=True, truncation=True, return_tensors="np")
-    outputs = session.run(None, dict(inputs))
-    embeddings = outputs[0]
-    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
-    norms[norms == 0] = 1
-    embeddings = embeddings / norms
-    return embeddings
 
+def parse_embedding(value):
+    """Decode an embedding returned by the custom API (JSON list or pgvector text)."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = json.loads(value)
+    return np.asarray(value, dtype=np.float32)
 
-async def fetch_post_by_identifier(repo: str, rkey: str) -> dict:
+
+def post_identifier(repo: str, rkey: str) -> dict:
     """Return minimal post info (just enough to build a URI)."""
     uri = f"at://{repo}/app.bsky.feed.post/{rkey}"
     return {"uri": uri, "repo": repo, "rkey": rkey}
@@ -42,13 +61,11 @@ async def fetch_post_by_identifier(repo: str, rkey: str) -> dict:
 
 async def fetch_full_post(uri: str) -> dict:
     """Fetch full post JSON so keyword filters can work."""
-    url = (
-        "https://public.api.bsky.app/xrpc/"
-        "app.bsky.feed.getPosts"
-        f"?uris={uri}"
-    )
-    async with httpx.AsyncClient(timeout=20.0) as client:
-        r = await client.get(url)
+    try:
+        r = await appview.get("/xrpc/app.bsky.feed.getPosts", params={"uris": uri})
+    except UpstreamError as e:
+        print("Post fetch failed:", e)
+        return {}
 
     if r.status_code != 200:
         return {}
@@ -57,15 +74,36 @@ async def fetch_full_post(uri: str) -> dict:
     return posts[0] if posts else {}
 
 
+async def fetch_full_posts(uris: list[str]) -> list[dict]:
+    """Fetch full post JSON for many URIs, batching getPosts calls."""
+    if not uris:
+        return []
+
+    chunks = [uris[i:i + GET_POSTS_BATCH] for i in range(0, len(uris), GET_POSTS_BATCH)]
+
+    async def fetch_chunk(chunk):
+        try:
+            r = await appview.get("/xrpc/app.bsky.feed.getPosts", params=[("uris", uri) for uri in chunk])
+        except UpstreamError as e:
+            print("Post hydration failed:", e)
+            return []
+        if r.status_code != 200:
+            print("Post hydration failed:", r.text)
+            return []
+        return r.json().get("posts", [])
+
+    responses = await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunks))
+
+    return [post for posts in responses for post in posts]
+
+
 async def fetch_author_posts(actor_did: str, limit: int = RESPONSE_LIMIT) -> list[dict]:
     """Fetch posts from a Bluesky author DID."""
-    url = (
-        "https://public.api.bsky.app/xrpc/"
-        "app.bsky.feed.getAuthorFeed"
-        f"?actor={actor_did}&limit={limit}"
-    )
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        r = await client.get(url)
+    try:
+        r = await appview.get("/xrpc/app.bsky.feed.getAuthorFeed", params={"actor": actor_did, "limit": limit})
+    except UpstreamError as e:
+        print("Author fetch failed:", e)
+        return []
 
     if r.status_code != 200:
         print("Author fetch failed:", r.text)
@@ -86,19 +124,110 @@ async def fetch_author_posts(actor_did: str, limit: int = RESPONSE_LIMIT) -> lis
         except ValueError:
             continue
 
-        results.append(await fetch_post_by_identifier(repo, rkey))
+        result = post_identifier(repo, rkey)
+        result["view"] = post  # already hydrated, no getPosts call needed
+        results.append(result)
 
     return results
 
 
+async def fetch_recent_posts(dids: list[str], limit: int = RESPONSE_LIMIT) -> dict[str, list[dict]]:
+    """Fetch recent posts for many authors from the local PDS in one request.
+
+    Returns a mapping of DID to its posts (newest first); authors the PDS
+    has no posts for are absent from the mapping.
+    """
+    if not dids:
+        return {}
+
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        r = await client.post(
+            f"{CUSTOM_API_URL}/posts/recent",
+            params={"limit": limit},
+            json=dids,
+        )
+
+    if r.status_code != 200:
+        print("Recent posts fetch failed:", r.text)
+        return {}
+
+    by_author = {}
+    for post in r.json():
+        repo = post.get("repo")
+        rkey = post.get("rkey")
+        if repo and rkey:
+            result = post_identifier(repo, rkey)
+            result["embedding"] = parse_embedding(post.get("embedding"))
+            by_author.setdefault(repo, []).append(result)
+
+    return by_author
+
+
+async def fetch_account_posts(dids: list[str], limit: int = RESPONSE_LIMIT) -> list[dict]:
+    """Fetch posts for preferred accounts, local PDS first, AppView for the rest."""
+    local = await fetch_recent_posts(dids, limit)
+    missing = [did for did in dids if did not in local]
+    remote = await asyncio.gather(*(fetch_author_posts(did, limit) for did in missing))
+
+    results = [post for posts in local.values() for post in posts]
+    results.extend(post for posts in remote for post in posts)
+    return results
+
+
+async def fetch_feed_candidates(feed_uri: str, limit: int = POOL_LIMIT) -> list[dict]:
+    """Read the candidate pool the PDS ingester pre-matched for this feed."""
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        r = await client.get(
+            f"{CUSTOM_API_URL}/feeds/candidates",
+            params={"feed": feed_uri, "limit": limit},
+        )
+
+    if r.status_code != 200:
+        print("Candidate pool fetch failed:", r.text)
+        return []
+
+    results = []
+    for post in r.json():
+        repo = post.get("repo")
+        rkey = post.get("rkey")
+        if repo and rkey:
+            result = post_identifier(repo, rkey)
+            result["embedding"] = parse_embedding(post.get("embedding"))
+            results.append(result)
+
+    return results
+
+
+_tombstones = {"bloom": None, "fetched_at": 0.0}
+
+
+async def fetch_tombstones():
+    """Bloom filter of recently deleted post URIs from the custom API (refreshed every TOMBSTONE_REFRESH)."""
+    if time.time() - _tombstones["fetched_at"] < TOMBSTONE_REFRESH:
+        return _tombstones["bloom"]
+    _tombstones["fetched_at"] = time.time()
+    try:
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            r = await client.get(f"{CUSTOM_API_URL}/tombstones/bloom")
+        if r.status_code == 200:
+            _tombstones["bloom"] = BloomFilter.from_dict(r.json())
+        else:
+            print("Tombstone filter fetch failed:", r.text)
+    except Exception as e:
+        # Keep using the previous filter
+        print("Tombstone filter fetch failed:", e)
+    return _tombstones["bloom"]
+
+
 async def search_topics(query: str, limit: int = RESPONSE_LIMIT) -> list[dict]:
     """Use vector search to find relevant posts, returning minimal identifiers."""
-    vector = encode_onnx(query).tolist()[0][0]
+    vector = (await asyncio.to_thread(topic_vector, query)).tolist()
     body = json.dumps(vector)
 
     async with httpx.AsyncClient(timeout=30.0) as client:
         r_vector = await client.post(
             f"{CUSTOM_API_URL}/vector/search/posts",
+            params={"hours": SEARCH_WINDOW_HOURS} if SEARCH_WINDOW_HOURS else None,
             content=body,
             headers={"Content-Type": "application/json"}
         )
@@ -112,22 +241,30 @@ async def search_topics(query: str, limit: int = RESPONSE_LIMIT) -> list[dict]:
         repo = post.get("repo")
         rkey = post.get("rkey")
         if repo and rkey:
-            results.append(await fetch_post_by_identifier(repo, rkey))
+            result = post_identifier(repo, rkey)
+            result["embedding"] = parse_embedding(post.get("embedding"))
+            results.append(result)
 
     return results
 
 
+def topics_without_hits(sources, pool: list[dict]) -> list:
+    """Topic preferences that none of the pooled posts would have matched."""
+    topics = [src for src in sources if src.source_type == "topic_preference"]
+    embeddings = [p["embedding"] for p in pool if p.get("embedding") is not None]
+    if not topics or not embeddings:
+        return topics
+    similarity = np.stack(embeddings) @ np.stack([topic_vector(src.identifier) for src in topics]).T
+    hit = (similarity >= MATCH_THRESHOLD).any(axis=0)
+    return [src for src, covered in zip(topics, hit) if not covered]
+
+
 # Filtering logic (blacklist plcs + keywords)
-def extract_filters(feed_uri: str):
+def extract_filters(sources):
     """Return sets for quick filtering."""
-    rows = (
-        FeedSource
-        .select()
-        .where(FeedSource.feed == Feed.get(Feed.uri == feed_uri))
-    )
     blocked_dids = set()
     banned_keywords = set()
-    for r in rows:
+    for r in sources:
         if r.source_type == "account_filter":
             blocked_dids.add(r.identifier)
         if r.source_type == "topic_filter":
@@ -135,16 +272,13 @@ def extract_filters(feed_uri: str):
 
     return blocked_dids, banned_keywords
 
-def should_block_post(full_post: dict, blocked_dids: set, banned_keywords: set) -> bool:
+def should_block_post(candidate: Candidate, blocked_dids: set, banned_keywords: set) -> bool:
     """Return True if post should be filtered out."""
     # Block authors
-    author = full_post.get("author")
-    if author:
-        if author.get("did") in blocked_dids:
-            return True
+    if candidate.author in blocked_dids:
+        return True
     # Block keyword-containing posts
-    record = full_post.get("record", {})
-    text = record.get("text", "").lower()
+    text = candidate.text.lower()
 
     for kw in banned_keywords:
         if kw in text:
@@ -153,103 +287,129 @@ def should_block_post(full_post: dict, blocked_dids: set, banned_keywords: set)
     return False
 
 
+def load_topics(sources) -> tuple[np.ndarray, np.ndarray]:
+    """Return (topic vectors, priorities) for a feed's topic preferences."""
+    topics = [src for src in sources if src.source_type == "topic_preference"]
+    if not topics:
+        return np.zeros((0, 384), dtype=np.float32), np.zeros(0, dtype=np.float32)
+    vectors = np.stack([topic_vector(src.identifier) for src in topics])
+    priorities = np.array([src.weight for src in topics], dtype=np.float32)
+    return vectors, priorities
+
+
+async def hydrate_candidates(collected: list[dict]) -> list[Candidate]:
+    """Turn fetched identifiers into deduplicated candidates with features.
+
+    Candidates already hydrated for another feed are reused from the shared
+    store; the rest are hydrated in batched getPosts calls and embedded once.
+    """
+    candidates = {}
+    missing = {}
+    for p in collected:
+        uri = p["uri"]
+        if uri in candidates or uri in missing:
+            continue
+        cached = candidate_store.get(uri)
+        if cached is not None:
+            candidates[uri] = cached
+        elif p.get("view"):
+            candidates[uri] = Candidate.from_post_view(p["view"], p.get("embedding"))
+            candidate_store.put(candidates[uri])
+        else:
+            missing[uri] = p
+
+    for post in await fetch_full_posts(list(missing)):
+        uri = post.get("uri")
+        if uri not in missing:
+            continue
+        candidates[uri] = Candidate.from_post_view(post, missing[uri].get("embedding"))
+        candidate_store.put(candidates[uri])
+
+    # Embed everything still missing a vector in one batched run, off the event loop
+    unembedded = [c for c in candidates.values() if c.embedding is None and c.text]
+    if unembedded:
+        embeddings = await asyncio.to_thread(embedder.encode, [c.text for c in unembedded])
+        for candidate, embedding in zip(unembedded, embeddings):
+            candidate.embedding = embedding
+
+    return list(candidates.values())
+
+
 # Feed handler factory
 def make_handler(feed_uri: str):
     async def build_feed(limit=RESPONSE_LIMIT):
-        """Build fresh feed skeleton by fetching sources + posts."""
-        sources = (
-            FeedSource
-            .select()
-            .join(Feed)
-            .where(Feed.uri == feed_uri)
-        )
+        """Build fresh feed skeleton by fetching sources, then scoring and ranking posts."""
+        # Load the feed's weights and sources in one query, off the event loop
+        config = await repository.load_feed_config(feed_uri)
+        sources = config.sources
 
         # Load blacklist rules
-        blocked_dids, banned_keywords = extract_filters(feed_uri)
+        blocked_dids, banned_keywords = extract_filters(sources)
 
         collected = []
 
-        for src in sources:
-            # Preferences
-            if src.source_type == "account_preference":
-                collected.extend(await fetch_author_posts(src.identifier, limit))
+        # Preferences: all accounts in one local query, topics one search each
+        accounts = [src.identifier for src in sources if src.source_type == "account_preference"]
+        collected.extend(await fetch_account_posts(accounts, limit))
 
-            elif src.source_type == "topic_preference":
-                collected.extend(await search_topics(src.identifier, limit))
+        # Topics: the ingester's pre-matched pool, falling back to KNN searches
+        # for topics it hasn't matched anything for yet (e.g. a new feed or topic)
+        pool = await fetch_feed_candidates(feed_uri)
+        collected.extend(pool)
 
-            # Filters NOT fetched here — they are applied to results below.
+        for src in await asyncio.to_thread(topics_without_hits, sources, pool):
+            collected.extend(await search_topics(src.identifier, limit))
 
-        # Deduplicate
-        seen = set()
-        filtered_posts = []
+        # Filters NOT fetched here — they are applied to results below.
 
-        # Apply filters
-        for p in collected:
-            uri = p["uri"]
-            if uri in seen:
-                continue
-            seen.add(uri)
-
-            full_post = await fetch_full_post(uri)
-            if not full_post:
-                continue
-
-            # apply filters
-            if should_block_post(full_post, blocked_dids, banned_keywords):
-                continue
-
-            filtered_posts.append(p)
-
-            if len(filtered_posts) >= FEED_LIMIT:
-                break
-
-        # Format for Bluesky
-        feed = {
-            "cursor": str(int(time.time())),
-            "feed": [{"post": p["uri"]} for p in filtered_posts[:FEED_LIMIT]]
-        }
-
-        # Save to SQLite
-        FeedCache.insert(
-            feed_uri=feed_uri,
-            response_json=json.dumps(feed),
-            timestamp=int(time.time())
-        ).on_conflict_replace().execute()
-
-        return feed
-
-    async def serve_from_cache(limit=10):
-        """Return cached feed if recent, otherwise None."""
-        row = FeedCache.get_or_none(FeedCache.feed_uri == feed_uri)
-        if row is None:
-            return None
-
-        age = time.time() - row.timestamp
-        if age < CACHE_TTL:
-            return json.loads(row.response_json)
-
-        return json.loads(row.response_json)  # stale but still valid
-
-    async def background_refresh(limit=RESPONSE_LIMIT):
-        """Refresh cache in the background (non-blocking)."""
-        try:
-            await build_feed(limit)
-        except Exception as e:
-            print("Background refresh failed:", e)
-
-    async def handler(cursor="", limit=RESPONSE_LIMIT):
-        # Try cached version first
-        cached = await serve_from_cache(limit)
+        # Drop posts deleted since they were fetched or matched, before hydrating them
+        tombstones = await fetch_tombstones()
+        if tombstones is not None:
+            collected = [p for p in collected if p["uri"] not in tombstones]
 
-        if cached:
-            # If cached but stale then refresh in background
-            row = FeedCache.get_or_none(FeedCache.feed_uri == feed_uri)
-            if time.time() - row.timestamp >= CACHE_TTL:
-                asyncio.create_task(background_refresh(limit))
-            return cached
+        # Deduplicate and hydrate (shared across feeds)
+        candidates = await hydrate_candidates(collected)
 
-        # If there's no cache build immediately
-        fresh = await build_feed(limit)
-        return fresh
+        # Apply filters
+        candidates = [
+            c for c in candidates
+            if not should_block_post(c, blocked_dids, banned_keywords)
+        ]
+
+        # Score and rank according to the blueprint
+        topic_vectors, topic_priorities = await asyncio.to_thread(load_topics, sources)
+        ranked = rank_candidates(
+            candidates,
+            topic_vectors,
+            topic_priorities,
+            parse_ranking_weights(config.ranking_weights),
+        )
 
+        # Publish the ordered candidate list; pages are served as slices of it
+        # and persisted to SQLite by the cache's write-behind task
+        uris = [c.uri for c in ranked[:CANDIDATE_LIMIT]]
+        version = int(time.time() * 1000)
+        skeleton_cache.put(feed_uri, version, uris)
+        return version
+
+    async def handler(cursor="", limit=RESPONSE_LIMIT, viewer=None) -> bytes:
+        """Return a serialized skeleton page from the in-memory cache.
+
+        `viewer` is the requester's DID when the request carried a valid
+        service token (None for anonymous requests); pages are not
+        personalized yet, so every viewer gets the same skeleton.
+        """
+        refresh_scheduler.record_request(feed_uri)
+        entry = skeleton_cache.get(feed_uri)
+
+        if entry is None:
+            # If there's no cache build immediately (joining any build in flight)
+            await asyncio.shield(refresh_scheduler.refresh(feed_uri))
+        elif time.time() - entry.timestamp >= CACHE_TTL:
+            # If cached but stale then refresh in background (single-flight)
+            refresh_scheduler.refresh(feed_uri)
+
+        return skeleton_cache.page(feed_uri, cursor, limit)
+
+    refresh_scheduler.register(feed_uri, build_feed)
     return handler
@@ -0,0 +1,67 @@
+import base64
+
+MAX_PAGE_LIMIT = 100  # max page size allowed by app.bsky.feed.getFeedSkeleton
+RETAINED_VERSIONS = 3  # candidate list versions kept so in-flight scrolls stay consistent
+
+
+def encode_cursor(version: int, offset: int) -> str:
+    """Return an opaque cursor pointing at `offset` in candidate list `version`."""
+    return base64.urlsafe_b64encode(f"{version}:{offset}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[int, int]:
+    """Return (version, offset) from a cursor.
+
+    Raises:
+        ValueError: If the cursor was not produced by `encode_cursor`.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        version, offset = base64.urlsafe_b64decode(padded.encode()).decode().split(":")
+        version, offset = int(version), int(offset)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Malformed cursor") from e
+    if offset < 0:
+        raise ValueError("Malformed cursor")
+    return version, offset
+
+
+def clamp_limit(limit) -> int:
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise ValueError("Malformed limit")
+    return max(1, min(limit, MAX_PAGE_LIMIT))
+
+
+class CandidateLists:
+    """The last few ordered candidate lists of one feed, keyed by version."""
+
+    def __init__(self, retained=RETAINED_VERSIONS):
+        self.retained = retained
+        self.versions = {}
+        self.latest = None
+
+    def add(self, version: int, uris: list[str]):
+        self.versions[version] = uris
+        if self.latest is None or version > self.latest:
+            self.latest = version
+        for old in sorted(self.versions)[:-self.retained]:
+            del self.versions[old]
+
+    def page(self, cursor: str = None, limit: int = 20) -> dict:
+        """Return one getFeedSkeleton page as an O(limit) slice of a stored list."""
+        limit = clamp_limit(limit)
+        version, offset = self.latest, 0
+        if cursor:
+            version, offset = decode_cursor(cursor)
+            if version not in self.versions:
+                # Unknown or expired version: continue from the same position in the newest list
+                version = self.latest
+
+        uris = self.versions.get(version, [])
+        end = offset + limit
+        body = {"feed": [{"post": uri} for uri in uris[offset:end]]}
+        if end < len(uris):
+            body["cursor"] = encode_cursor(version, end)
+        return body
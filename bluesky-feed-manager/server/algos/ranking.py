@@ -0,0 +1,176 @@
+import json
+import time
+from datetime import datetime
+
+import numpy as np
+
+# Ranking weights used when a blueprint does not provide its own
+DEFAULT_RANKING_WEIGHTS = {"focused": 1.0, "fresh": 0.5, "balanced": 0.5, "trending": 0.5}
+
+RECENCY_HALF_LIFE = 6 * 60 * 60  # seconds until a post's freshness score halves
+CANDIDATE_TTL = 5 * 60  # seconds a hydrated candidate is reused across feeds
+CANDIDATE_STORE_LIMIT = 20000  # max candidates kept in the shared store
+
+
+def parse_ranking_weights(raw) -> dict:
+    """Return a complete weights dict from a blueprint dict or stored JSON string."""
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except json.JSONDecodeError:
+            raw = None
+    weights = dict(DEFAULT_RANKING_WEIGHTS)
+    for key, value in (raw or {}).items():
+        if key in weights:
+            try:
+                weights[key] = max(0.0, float(value))
+            except (TypeError, ValueError):
+                continue
+    return weights
+
+
+def parse_timestamp(value: str) -> float:
+    """Parse an ATProto ISO timestamp into UNIX seconds (0 if missing/invalid)."""
+    if not value:
+        return 0.0
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return 0.0
+
+
+class Candidate:
+    """Hydrated, feed-independent features of a single post."""
+
+    __slots__ = ("uri", "author", "text", "created_at", "engagement", "embedding", "fetched_at")
+
+    def __init__(self, uri, author, text, created_at, engagement, embedding=None):
+        self.uri = uri
+        self.author = author
+        self.text = text
+        self.created_at = created_at
+        self.engagement = engagement
+        self.embedding = embedding
+        self.fetched_at = time.time()
+
+    @classmethod
+    def from_post_view(cls, post: dict, embedding=None):
+        """Build a candidate from an app.bsky.feed.defs#postView."""
+        record = post.get("record", {})
+        engagement = (
+            post.get("likeCount", 0)
+            + 2 * post.get("repostCount", 0)
+            + post.get("replyCount", 0)
+            + post.get("quoteCount", 0)
+        )
+        created_at = parse_timestamp(record.get("createdAt")) or parse_timestamp(post.get("indexedAt"))
+        return cls(
+            uri=post["uri"],
+            author=post.get("author", {}).get("did", ""),
+            text=record.get("text", ""),
+            created_at=created_at,
+            engagement=engagement,
+            embedding=embedding,
+        )
+
+
+class CandidateStore:
+    """Process-wide cache of hydrated candidates shared by every feed.
+
+    Feeds with overlapping topics or accounts see the same posts, so the
+    network hydration and embedding of a post is paid once and every other
+    feed only runs its own (cheap) vectorized scoring pass over it.
+    """
+
+    def __init__(self, ttl=CANDIDATE_TTL, limit=CANDIDATE_STORE_LIMIT):
+        self.ttl = ttl
+        self.limit = limit
+        self._items = {}
+
+    def get(self, uri):
+        candidate = self._items.get(uri)
+        if candidate is None:
+            return None
+        if time.time() - candidate.fetched_at >= self.ttl:
+            del self._items[uri]
+            return None
+        return candidate
+
+    def put(self, candidate: Candidate):
+        existing = self._items.get(candidate.uri)
+        if candidate.embedding is None and existing is not None:
+            candidate.embedding = existing.embedding
+        self._items[candidate.uri] = candidate
+        if len(self._items) > self.limit:
+            # Drop the oldest entries (dicts keep insertion order)
+            for uri in list(self._items)[: len(self._items) - self.limit]:
+                del self._items[uri]
+
+
+candidate_store = CandidateStore()
+
+
+def _author_occurrence(authors: np.ndarray, order: np.ndarray) -> np.ndarray:
+    """For each candidate, how many higher-ranked posts share its author."""
+    ranked = authors[order]
+    by_author = np.argsort(ranked, kind="stable")
+    grouped = ranked[by_author]
+    starts = np.flatnonzero(np.r_[True, grouped[1:] != grouped[:-1]])
+    sizes = np.diff(np.r_[starts, len(grouped)])
+    rank_in_group = np.arange(len(grouped)) - np.repeat(starts, sizes)
+
+    occurrence_ranked = np.empty(len(ranked), dtype=np.int64)
+    occurrence_ranked[by_author] = rank_in_group
+    occurrence = np.empty(len(ranked), dtype=np.int64)
+    occurrence[order] = occurrence_ranked
+    return occurrence
+
+
+def rank_candidates(candidates: list, topic_vectors: np.ndarray, topic_priorities: np.ndarray,
+                    weights: dict, now: float = None) -> list:
+    """Return candidates sorted by blueprint-weighted score, best first.
+
+    All four signals are computed in one vectorized pass:
+      - focused:  priority-weighted cosine similarity to the closest topic centroid
+      - fresh:    exponential recency decay
+      - trending: log-scaled engagement, normalized to the batch
+      - balanced: author diversity (repeat posts by an author decay by rank)
+    """
+    if not candidates:
+        return []
+
+    now = time.time() if now is None else now
+    n = len(candidates)
+
+    # Similarity to topic centroids
+    focused = np.zeros(n, dtype=np.float32)
+    has_embedding = np.array([c.embedding is not None for c in candidates])
+    if len(topic_vectors) and has_embedding.any():
+        matrix = np.stack([candidates[i].embedding for i in np.flatnonzero(has_embedding)])
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        similarity = matrix @ topic_vectors.T * topic_priorities
+        focused[has_embedding] = np.clip(similarity.max(axis=1), 0.0, None)
+
+    # Recency decay
+    created_at = np.array([c.created_at or 0.0 for c in candidates], dtype=np.float64)
+    age = np.clip(now - created_at, 0.0, None)
+    fresh = np.power(0.5, age / RECENCY_HALF_LIFE)
+
+    # Engagement
+    engagement = np.log1p(np.array([c.engagement for c in candidates], dtype=np.float64))
+    peak = engagement.max()
+    trending = engagement / peak if peak > 0 else engagement
+
+    base = (
+        weights["focused"] * focused
+        + weights["fresh"] * fresh
+        + weights["trending"] * trending
+    )
+
+    # Author diversity depends on the ranking without it
+    _, authors = np.unique([c.author for c in candidates], return_inverse=True)
+    order = np.argsort(-base, kind="stable")
+    balanced = 1.0 / (1.0 + _author_occurrence(authors, order))
+
+    score = base + weights["balanced"] * balanced
+    return [candidates[i] for i in np.argsort(-score, kind="stable")]
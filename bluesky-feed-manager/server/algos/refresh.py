@@ -0,0 +1,144 @@
+import asyncio
+import math
+import os
+import random
+import socket
+import time
+
+from server import repository
+from server.algos.cache import skeleton_cache
+
+CACHE_TTL = 60  # seconds before a cached feed is considered stale
+REFRESH_LEAD = 10  # seconds before expiry that the scheduler starts rebuilding a feed
+REFRESH_JITTER = 8  # max seconds of random spread added to each feed's refresh time
+REFRESH_CONCURRENCY = 2  # max feed builds running at once across the process
+SCHEDULER_INTERVAL = 1  # seconds between scheduler passes
+RATE_HALF_LIFE = 300  # seconds for a feed's request rate estimate to halve
+MIN_REQUEST_RATE = 1 / 600  # requests/sec below which feeds are only refreshed on demand
+LEASE_TTL = 120  # seconds a worker may hold a feed's rebuild lease before others can take over
+PEER_POLL_INTERVAL = 0.5  # seconds between checks for a skeleton another worker is building
+PEER_WAIT_TIMEOUT = 30  # max seconds to wait for another worker's build
+
+# Identifies this process in the FeedLease table (one per uvicorn worker)
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class RefreshScheduler:
+    """Single-flight feed refreshes plus proactive rebuilding of busy feeds.
+
+    Every refresh of a feed, whether triggered by a request or by the
+    scheduler, goes through `refresh`, so at most one build per feed is in
+    flight and at most `REFRESH_CONCURRENCY` builds run at all.
+
+    Across uvicorn workers, a lease row in SQLite decides which worker
+    rebuilds a feed; the others wait for its result and load it from the
+    FeedCache table instead of building the same feed again.
+    """
+
+    def __init__(self):
+        self.builders = {}
+        self.inflight = {}
+        self.rates = {}
+        self.jitter = {}
+        self._semaphore = None
+
+    @property
+    def semaphore(self):
+        # Created lazily so it binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(REFRESH_CONCURRENCY)
+        return self._semaphore
+
+    def register(self, feed_uri: str, build):
+        self.builders[feed_uri] = build
+        self.jitter[feed_uri] = random.uniform(0, REFRESH_JITTER)
+
+    def unregister(self, feed_uri: str):
+        self.builders.pop(feed_uri, None)
+        self.jitter.pop(feed_uri, None)
+        self.rates.pop(feed_uri, None)
+
+    def record_request(self, feed_uri: str):
+        """Update the feed's exponentially decayed request rate (requests/sec)."""
+        now = time.time()
+        rate, last = self.rates.get(feed_uri, (0.0, now))
+        decay = math.pow(0.5, (now - last) / RATE_HALF_LIFE)
+        self.rates[feed_uri] = (rate * decay + math.log(2) / RATE_HALF_LIFE, now)
+
+    def request_rate(self, feed_uri: str) -> float:
+        rate, last = self.rates.get(feed_uri, (0.0, time.time()))
+        return rate * math.pow(0.5, (time.time() - last) / RATE_HALF_LIFE)
+
+    def refresh(self, feed_uri: str) -> asyncio.Task:
+        """Start a rebuild of the feed, or join the one already in flight."""
+        task = self.inflight.get(feed_uri)
+        if task is None:
+            task = asyncio.create_task(self._run(feed_uri))
+            self.inflight[feed_uri] = task
+        return task
+
+    def is_fresh(self, feed_uri: str) -> bool:
+        entry = skeleton_cache.get(feed_uri)
+        return entry is not None and time.time() < entry.timestamp + CACHE_TTL - REFRESH_LEAD
+
+    async def _run(self, feed_uri: str):
+        try:
+            # Take a build slot before the lease, so the lease's TTL isn't spent
+            # queueing here while other workers wait for a build that hasn't started
+            async with self.semaphore:
+                leased = await repository.acquire_lease(feed_uri, WORKER_ID, LEASE_TTL)
+                if leased:
+                    try:
+                        # Skip the build if another worker already published a fresh skeleton
+                        if not (await skeleton_cache.reload(feed_uri) and self.is_fresh(feed_uri)):
+                            await self.builders[feed_uri]()
+                            # Publish right away so other workers can pick it up
+                            await repository.run(skeleton_cache.flush)
+                    finally:
+                        await repository.release_lease(feed_uri, WORKER_ID)
+            if not leased:
+                # Another worker is rebuilding this feed; adopt its result
+                await self._wait_for_peer(feed_uri)
+        except Exception as e:
+            print("Background refresh failed:", feed_uri, e)
+        finally:
+            self.inflight.pop(feed_uri, None)
+            # Don't bring back the schedule of a feed unregistered mid-build
+            if feed_uri in self.builders:
+                self.jitter[feed_uri] = random.uniform(0, REFRESH_JITTER)
+
+    async def _wait_for_peer(self, feed_uri: str):
+        deadline = time.time() + PEER_WAIT_TIMEOUT
+        while time.time() < deadline:
+            if await skeleton_cache.reload(feed_uri):
+                return
+            await asyncio.sleep(PEER_POLL_INTERVAL)
+
+    def due_feeds(self) -> list[str]:
+        """Busy feeds about to expire, busiest first."""
+        now = time.time()
+        due = []
+        for feed_uri in self.builders:
+            if feed_uri in self.inflight:
+                continue
+            entry = skeleton_cache.get(feed_uri)
+            if entry is None:
+                continue
+            if self.request_rate(feed_uri) < MIN_REQUEST_RATE:
+                continue
+            refresh_at = entry.timestamp + CACHE_TTL - REFRESH_LEAD - self.jitter[feed_uri]
+            if now >= refresh_at:
+                due.append(feed_uri)
+        due.sort(key=self.request_rate, reverse=True)
+        return due
+
+    async def run(self):
+        """Proactively rebuild feeds before their cache expires, until cancelled."""
+        while True:
+            await asyncio.sleep(SCHEDULER_INTERVAL)
+            free = REFRESH_CONCURRENCY - len(self.inflight)
+            for feed_uri in self.due_feeds()[:max(free, 0)]:
+                self.refresh(feed_uri)
+
+
+refresh_scheduler = RefreshScheduler()
@@ -1,18 +1,46 @@
 import os
+import asyncio
 import logging
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 
-from server import config
-from server.algos import algos
-from server.algos.feed import make_handler
+from server import config, repository
+from server.auth import AuthorizationError, validate_auth
+from server.algos import algos, load_algos, run_registry_sync
+from server.algos.feed import appview, embedder
+from server.algos.cache import skeleton_cache
+from server.algos.refresh import refresh_scheduler
 from server.create_feed import create_feed
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await repository.run(load_algos)
+
+    # Load the embedding model off the event loop; requests that need it before
+    # it's ready simply wait for it inside Embedder.encode
+    warmup = asyncio.create_task(asyncio.to_thread(embedder.load))
+
+    # Persist refreshed skeletons to SQLite, rebuild busy feeds before they expire
+    # and pick up feeds created through other workers
+    tasks = [
+        asyncio.create_task(skeleton_cache.run_write_behind()),
+        asyncio.create_task(refresh_scheduler.run()),
+        asyncio.create_task(run_registry_sync()),
+    ]
+    yield
+    tasks.append(warmup)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await appview.aclose()
+
+
 # App setup
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # CORS configuration
 allowed_origins = [
@@ -87,17 +115,51 @@ async def describe_feed_generator():
     }
 
 @app.get("/xrpc/app.bsky.feed.getFeedSkeleton")
-async def get_feed_skeleton(feed: str, cursor: str = None, limit: int = 20):
+async def get_feed_skeleton(request: Request, feed: str, cursor: str = None, limit: int = 20):
     algo = algos.get(feed)
     if not algo:
         raise HTTPException(status_code=400, detail="Unsupported algorithm")
-    
+
+    # Logged-in viewers send a service token; anonymous requests are still served
+    viewer = None
+    if request.headers.get("Authorization"):
+        try:
+            viewer = await validate_auth(request, config.SERVICE_DID)
+        except AuthorizationError as e:
+            raise HTTPException(status_code=401, detail=str(e))
+        except Exception as e:
+            # DID resolution failed: serve the unpersonalized feed rather than an error
+            logging.warning("Could not verify viewer token: %s", e)
+
     try:
-        body = await algo(cursor, limit)
+        body = await algo(cursor, limit, viewer=viewer)
     except ValueError:
         raise HTTPException(status_code=400, detail="Malformed cursor")
     
-    return body
+    return Response(content=body, media_type="application/json")
+
+@app.get("/feed-topics")
+async def feed_topics(request: Request):
+    """Topic preferences of every feed, used by the PDS ingester to pre-match posts."""
+    key = request.headers.get("x-api-key")
+    if key != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+
+    return await repository.list_feed_topics()
+
+@app.get("/stats/upstream")
+async def upstream_stats(request: Request):
+    """Counters, latency and circuit state of this worker's AppView client."""
+    key = request.headers.get("x-api-key")
+    if key != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+
+    return appview.stats()
+
+# These fields are the only ones recognized as parameters for create_feed()
+# You can extend as needed but must update in both places
+MANAGE_FEED_KEYS = ["handle","password","hostname","record_name","display_name","description","blueprint"]
+MANAGE_FEEDS_CONCURRENCY = 8  # feeds /manage-feeds provisions at once
 
 @app.post("/manage-feed")
 async def create_feed_endpoint(request: Request, data: dict):
@@ -107,14 +169,9 @@ async def create_feed_endpoint(request: Request, data: dict):
     
     try:
         # Create feed via ATProto API
-        # These fields are the only ones recognized as parameters for create_feed()
-        # You can extend as needed but must update in both places
-        allowed_keys = ["handle","password","hostname","record_name","display_name","description","blueprint"]
-        feed_data = {k: v for k, v in data.items() if k in allowed_keys}
-        uri = create_feed(**feed_data)
-
-        # Dynamically add handler for this new feed
-        algos[uri] = make_handler(uri)
+        feed_data = {k: v for k, v in data.items() if k in MANAGE_FEED_KEYS}
+        # Also registers the feed's handler and starts warming its cache
+        uri = await create_feed(**feed_data)
         logging.info("Feed and handler added for URI: %s", uri)
 
     except Exception as e:
@@ -122,3 +179,32 @@ async def create_feed_endpoint(request: Request, data: dict):
         raise HTTPException(status_code=400, detail=str(e))
 
     return {"uri": uri}
+
+@app.post("/manage-feeds")
+async def create_feeds_endpoint(request: Request, data: dict):
+    """Provision many feeds in one call: {"feeds": [<manage-feed body>, ...]}.
+
+    Feeds of the same handle share one login and one avatar upload. Results
+    are returned in request order, each {"uri": ...} or {"error": ...}.
+    """
+    key = request.headers.get("x-api-key")
+    if key != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+
+    feeds = data.get("feeds")
+    if not isinstance(feeds, list):
+        raise HTTPException(status_code=400, detail="Expected {\"feeds\": [...]}")
+
+    semaphore = asyncio.Semaphore(MANAGE_FEEDS_CONCURRENCY)
+
+    async def provision(item):
+        async with semaphore:
+            try:
+                uri = await create_feed(**{k: v for k, v in item.items() if k in MANAGE_FEED_KEYS})
+                logging.info("Feed and handler added for URI: %s", uri)
+                return {"uri": uri}
+            except Exception as e:
+                logging.error("Error in /manage-feeds: %s", e, exc_info=True)
+                return {"error": str(e)}
+
+    return {"results": await asyncio.gather(*(provision(item) for item in feeds))}
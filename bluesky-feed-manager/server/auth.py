@@ -1,24 +1,96 @@
-from atproto import DidInMemoryCache, IdResolver, verify_jwt
-from atproto.exceptions import TokenInvalidSignatureError
+import asyncio
+import hashlib
+import os
+import time
+
+from atproto import AsyncIdResolver, verify_jwt_async
+from atproto.exceptions import InvalidTokenError, TokenInvalidSignatureError
 from fastapi import Request
 
+from server import repository
+
 
-_CACHE = DidInMemoryCache()
-_ID_RESOLVER = IdResolver(cache=_CACHE)
+_ID_RESOLVER = AsyncIdResolver()
 
 _AUTHORIZATION_HEADER_NAME = 'Authorization'
 _AUTHORIZATION_HEADER_VALUE_PREFIX = 'Bearer '
 
+DID_KEY_TTL = float(os.environ.get("DID_KEY_TTL", 24 * 3600))  # seconds a resolved signing key is trusted
+DID_KEY_REFRESH_AFTER = float(os.environ.get("DID_KEY_REFRESH_AFTER", 3600))  # age at which it is re-resolved in the background
+TOKEN_CACHE_SIZE = 10000  # verified tokens remembered per worker
+
+# sha256(jwt) -> (requester DID, exp); a token is only cached after its signature checked out
+_verified_tokens = {}
+# DID -> (signing key, fetched_at); backed by the did_key table shared by all workers
+_did_keys = {}
+_refreshing = {}  # DID -> background refresh task
+
 
 class AuthorizationError(Exception):
     ...
 
 
-def validate_auth(request: Request) -> str:
+async def _resolve_key(did: str) -> str:
+    signing_key = await _ID_RESOLVER.did.resolve_atproto_key(did, True)
+    fetched_at = time.time()
+    _did_keys[did] = (signing_key, fetched_at)
+    await repository.save_did_key(did, signing_key, fetched_at)
+    return signing_key
+
+
+async def _refresh_key(did: str):
+    try:
+        await _resolve_key(did)
+    except Exception as e:
+        print(f"Background refresh of {did} signing key failed:", e)
+    finally:
+        _refreshing.pop(did, None)
+
+
+async def get_signing_key(did: str, force_refresh: bool = False) -> str:
+    """Signing key for a DID: memory, then the shared table, then the network.
+
+    Keys older than DID_KEY_REFRESH_AFTER are still served while a background
+    task re-resolves them; keys older than DID_KEY_TTL are resolved inline.
+    `force_refresh` (a signature that didn't verify, e.g. after key rotation)
+    always goes to the network.
+    """
+    if not force_refresh:
+        cached = _did_keys.get(did)
+        if cached is None:
+            cached = await repository.get_did_key(did)
+            if cached is not None:
+                _did_keys[did] = cached
+        if cached is not None:
+            signing_key, fetched_at = cached
+            age = time.time() - fetched_at
+            if age < DID_KEY_TTL:
+                if age >= DID_KEY_REFRESH_AFTER and did not in _refreshing:
+                    _refreshing[did] = asyncio.create_task(_refresh_key(did))
+                return signing_key
+    return await _resolve_key(did)
+
+
+def _remember_token(token_hash: str, iss: str, exp: int):
+    now = time.time()
+    if len(_verified_tokens) >= TOKEN_CACHE_SIZE:
+        for key in [key for key, (_, expires) in _verified_tokens.items() if expires <= now]:
+            del _verified_tokens[key]
+        # Still full of live tokens: drop the oldest insertions
+        while len(_verified_tokens) >= TOKEN_CACHE_SIZE:
+            del _verified_tokens[next(iter(_verified_tokens))]
+    _verified_tokens[token_hash] = (iss, exp)
+
+
+async def validate_auth(request: Request, own_did: str = None) -> str:
     """Validate authorization header.
 
+    A token whose signature was already verified is accepted from memory
+    until its `exp`, so repeat requests cost a hash and a dict lookup.
+
     Args:
         request: The request to validate.
+        own_did: This service's DID, required as the token's audience if given.
 
     Returns:
         str: Requester DID.
@@ -35,7 +107,21 @@ def validate_auth(request: Request) -> str:
 
     jwt = auth_header[len(_AUTHORIZATION_HEADER_VALUE_PREFIX):].strip()
 
+    token_hash = hashlib.sha256(jwt.encode()).hexdigest()
+    cached = _verified_tokens.get(token_hash)
+    if cached is not None:
+        iss, exp = cached
+        if exp > time.time():
+            return iss
+        del _verified_tokens[token_hash]
+
     try:
-        return verify_jwt(jwt, _ID_RESOLVER.did.resolve_atproto_key).iss
+        payload = await verify_jwt_async(jwt, get_signing_key, own_did)
     except TokenInvalidSignatureError as e:
         raise AuthorizationError('Invalid signature') from e
+    except InvalidTokenError as e:
+        raise AuthorizationError(f'Invalid token: {e}') from e
+
+    if payload.exp is not None:
+        _remember_token(token_hash, payload.iss, payload.exp)
+    return payload.iss
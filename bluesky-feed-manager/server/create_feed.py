@@ -1,30 +1,85 @@
-from atproto import Client, models
-from server.models import Feed, FeedSource
+from atproto import AsyncClient, models
+from atproto.exceptions import BadRequestError, UnauthorizedError
+from server import repository
+from server.repository import Source
 from server.algos import algos
 from server.algos.feed import make_handler
+from server.algos.refresh import refresh_scheduler
+import asyncio
+import hashlib
+import hmac
+import json
 import os
 
-def create_feed(handle, password, hostname, record_name, display_name="", description="",
-                avatar_path=os.path.join(os.path.dirname(__file__), "avatar.png"),
-                blueprint=None):
-    client = Client()
-    client.login(handle, password)
+# handle -> logged-in session, reused across /manage-feed calls. AsyncClient refreshes
+# the access token itself; a session the PDS rejects is dropped and logged in again.
+_sessions = {}
+_session_locks = {}
+
+
+class _Session:
+    def __init__(self, client: AsyncClient, password_digest: bytes):
+        self.client = client
+        self.password_digest = password_digest
+        self.blobs = {}  # sha256 of uploaded bytes -> BlobRef already stored in this repo
+
+
+def _digest(password: str) -> bytes:
+    return hashlib.sha256(password.encode()).digest()
+
+
+async def get_session(handle: str, password: str) -> _Session:
+    """Logged-in session for `handle`, logging in only if there's no cached one for this password."""
+    digest = _digest(password)
+    async with _session_locks.setdefault(handle, asyncio.Lock()):
+        session = _sessions.get(handle)
+        if session is None or not hmac.compare_digest(session.password_digest, digest):
+            client = AsyncClient()
+            await client.login(handle, password)
+            session = _sessions[handle] = _Session(client, digest)
+        return session
+
+
+def _drop_session(handle: str, session: _Session):
+    if _sessions.get(handle) is session:
+        del _sessions[handle]
+
+
+def _session_expired(error: Exception) -> bool:
+    if isinstance(error, UnauthorizedError):
+        return True
+    content = getattr(error.response, "content", None) if isinstance(error, BadRequestError) else None
+    return getattr(content, "error", None) in ("ExpiredToken", "InvalidToken")
+
+
+def _read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+async def upload_avatar(session: _Session, avatar_path):
+    """Upload the avatar, or reuse the blob of an identical earlier upload to the same account."""
+    if not avatar_path or not os.path.exists(avatar_path):
+        return None
+    data = await asyncio.to_thread(_read_file, avatar_path)
+    key = hashlib.sha256(data).hexdigest()
+    if key not in session.blobs:
+        session.blobs[key] = (await session.client.upload_blob(data)).blob
+    return session.blobs[key]
 
-    feed_did = client.me.did
 
-    avatar_blob = None
-    if avatar_path and os.path.exists(avatar_path):
-        with open(avatar_path, 'rb') as f:
-            avatar_blob = client.upload_blob(f.read()).blob
+async def put_feed_record(session: _Session, record_name, display_name, description, avatar_path):
+    client = session.client
+    avatar_blob = await upload_avatar(session, avatar_path)
 
     # Create or update record on Bluesky
-    response = client.com.atproto.repo.put_record(
+    response = await client.com.atproto.repo.put_record(
         models.ComAtprotoRepoPutRecord.Data(
             repo=client.me.did,
             collection=models.ids.AppBskyFeedGenerator,
             rkey=record_name,
             record=models.AppBskyFeedGenerator.Record(
-                did=feed_did,
+                did=client.me.did,
                 display_name=display_name,
                 description=description,
                 avatar=avatar_blob,
@@ -34,8 +89,22 @@ def create_feed(handle, password, hostname, record_name, display_name="", descri
             )
         )
     )
+    return response.uri
 
-    feed_uri = response.uri
+
+async def create_feed(handle, password, hostname, record_name, display_name="", description="",
+                avatar_path=os.path.join(os.path.dirname(__file__), "avatar.png"),
+                blueprint=None):
+    session = await get_session(handle, password)
+    try:
+        feed_uri = await put_feed_record(session, record_name, display_name, description, avatar_path)
+    except (UnauthorizedError, BadRequestError) as e:
+        if not _session_expired(e):
+            raise
+        # Session revoked or refresh token expired: log in again once
+        _drop_session(handle, session)
+        session = await get_session(handle, password)
+        feed_uri = await put_feed_record(session, record_name, display_name, description, avatar_path)
 
     # Save feed metadata locally
     data = {
@@ -45,70 +114,36 @@ def create_feed(handle, password, hostname, record_name, display_name="", descri
         "description": description,
         "avatar_path": avatar_path,
     }
-
-    feed, created = Feed.get_or_create(
-        uri=feed_uri,
-        defaults=data
-    )
-
-    if not created:
-        updated = False
-        for field in ["handle", "record_name", "display_name", "description", "avatar_path"]:
-            value = data.get(field)
-            if value and getattr(feed, field) != value:
-                setattr(feed, field, value)
-                updated = True
-        if updated:
-            feed.save()
+    if blueprint and blueprint.get("ranking_weights"):
+        data["ranking_weights"] = json.dumps(blueprint["ranking_weights"])
 
     # Feed blueprint processing
+    sources = None
     if blueprint:
-        # Delete old sources for this feed
-        FeedSource.delete().where(FeedSource.feed == feed).execute()
+        sources = []
 
         # Preferences (positive)
         for topic in blueprint.get('topics', []):
-            FeedSource.create(
-                feed=feed,
-                source_type='topic_preference',
-                identifier=topic['name']
-            )
+            sources.append(Source('topic_preference', topic['name'], float(topic.get('priority') or 1.0)))
         for account_did in blueprint.get('suggested_accounts', []):
-            FeedSource.create(
-                feed=feed,
-                source_type='account_preference',
-                identifier=account_did
-            )
+            sources.append(Source('account_preference', account_did, 1.0))
 
         # Filters (negative)
         filters = blueprint.get("filters", {})
 
         for keyword in filters.get("limit_posts_about", []):
-            FeedSource.create(
-                feed=feed,
-                source_type='topic_filter',
-                identifier=keyword
-            )
+            sources.append(Source('topic_filter', keyword, 1.0))
         for blocked_did in filters.get("limit_posts_from", []):
-            FeedSource.create(
-                feed=feed,
-                source_type='account_filter',
-                identifier=blocked_did
-            )
+            sources.append(Source('account_filter', blocked_did, 1.0))
+
+    await repository.save_feed(feed_uri, data, sources)
 
     # Dynamically add handler to algos
     algos[feed_uri] = make_handler(feed_uri)
 
-    # Warm the cache of dynamically collected posts immediately
-    try:
-        handler = algos[feed_uri]
-        import asyncio
-
-        # Trigger handler in the background
-        asyncio.get_event_loop().create_task(handler())
-        print(f"[Cache Warm] Started background warm for {feed_uri}")
-
-    except Exception as e:
-        print(f"[Cache Warm Error] Could not warm cache for {feed_uri}: {e}")
+    # Warm the cache of dynamically collected posts immediately; the scheduler
+    # keeps the task until it finishes and logs a failed build itself
+    refresh_scheduler.refresh(feed_uri)
+    print(f"[Cache Warm] Started background warm for {feed_uri}")
 
     return feed_uri
@@ -1,6 +1,12 @@
-from peewee import Model, SqliteDatabase, TextField, ForeignKeyField, IntegerField
+import os
+from peewee import Model, SqliteDatabase, TextField, ForeignKeyField, IntegerField, FloatField
+from playhouse.migrate import SqliteMigrator, migrate
 
-db = SqliteDatabase('feeds.db')
+# WAL lets skeleton reads proceed while the repository thread writes
+db = SqliteDatabase(
+    os.environ.get("FEEDS_DB_PATH", "feeds.db"),
+    pragmas={"journal_mode": "wal", "synchronous": "normal"},
+)
 
 class Feed(Model):
     uri = TextField(unique=True)
@@ -9,6 +15,7 @@ class Feed(Model):
     display_name = TextField()
     description = TextField(null=True)
     avatar_path = TextField(null=True)
+    ranking_weights = TextField(null=True)  # JSON string of {"focused":..., "fresh":..., "balanced":..., "trending":...}
 
     class Meta:
         database = db
@@ -18,6 +25,7 @@ class FeedSource(Model):
     feed = ForeignKeyField(Feed, backref='sources', on_delete='CASCADE')
     source_type = TextField()   # 'account_preference', 'topic_preference', 'account_filter', 'topic_filter'
     identifier = TextField()    # e.g., 'did:plc:example.bsky.social' or 'sports'
+    weight = FloatField(default=1.0)  # topic priority from the blueprint (1.0 for other sources)
 
     class Meta:
         database = db
@@ -27,8 +35,42 @@ class FeedSource(Model):
 
 class FeedCache(Model):
     feed_uri = TextField(unique=True)
-    response_json = TextField()  # JSON string of {"cursor":..., "feed":[...]}
+    response_json = TextField()  # JSON list of ranked post URIs (the candidate list)
+    version = IntegerField(default=0)  # candidate list version (ms timestamp of the refresh)
     timestamp = IntegerField()   # UNIX timestamp
 
     class Meta:
-        database = db
\ No newline at end of file
+        database = db
+
+
+class FeedLease(Model):
+    feed_uri = TextField(unique=True)
+    owner = TextField()  # worker id currently rebuilding the feed
+    expires_at = FloatField()  # UNIX timestamp after which another worker may take over
+
+    class Meta:
+        database = db
+
+
+class DidKey(Model):
+    did = TextField(unique=True)
+    signing_key = TextField()  # multibase atproto signing key from the DID document
+    fetched_at = FloatField()  # UNIX timestamp of the resolution
+
+    class Meta:
+        database = db
+
+
+def migrate_columns(models):
+    """Add columns introduced after a table was first created.
+
+    `create_tables(safe=True)` never alters existing tables, so databases
+    created by older versions are patched here column by column.
+    """
+    migrator = SqliteMigrator(db)
+    for model in models:
+        table = model._meta.table_name
+        existing = {column.name for column in db.get_columns(table)}
+        for field in model._meta.sorted_fields:
+            if field.column_name not in existing and not isinstance(field, ForeignKeyField):
+                migrate(migrator.add_column(table, field.column_name, field))
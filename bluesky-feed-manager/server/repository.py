@@ -0,0 +1,178 @@
+import asyncio
+import functools
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from peewee import JOIN, chunked, fn
+
+from server.models import db, Feed, FeedSource, FeedLease, DidKey
+
+# A single thread owns every SQLite call made while serving, so a slow
+# write never blocks the event loop and writes never contend with each other.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="feeds-db")
+
+Source = namedtuple("Source", ["source_type", "identifier", "weight"])
+FeedConfig = namedtuple("FeedConfig", ["uri", "ranking_weights", "sources"])
+
+
+async def run(fn, *args, **kwargs):
+    """Run a blocking peewee call on the database thread."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
+
+def _load_feed_config(feed_uri: str) -> FeedConfig:
+    rows = list(
+        Feed
+        .select(Feed.ranking_weights, FeedSource.source_type, FeedSource.identifier, FeedSource.weight)
+        .join(FeedSource, JOIN.LEFT_OUTER, on=(FeedSource.feed == Feed.id))
+        .where(Feed.uri == feed_uri)
+        .dicts()
+    )
+    if not rows:
+        raise Feed.DoesNotExist(feed_uri)
+
+    sources = [
+        Source(row["source_type"], row["identifier"], row["weight"])
+        for row in rows
+        if row["source_type"] is not None
+    ]
+    return FeedConfig(feed_uri, rows[0]["ranking_weights"], sources)
+
+
+async def load_feed_config(feed_uri: str) -> FeedConfig:
+    """Return a feed's ranking weights and all of its sources in one query."""
+    return await run(_load_feed_config, feed_uri)
+
+
+SOURCE_INSERT_BATCH = 200  # rows per INSERT, well under SQLite's bound-variable limit
+
+
+def _save_feed(feed_uri: str, data: dict, sources) -> Feed:
+    # One transaction: readers never see a feed with half of its sources
+    with db.atomic():
+        feed, created = Feed.get_or_create(
+            uri=feed_uri,
+            defaults=data
+        )
+
+        if not created:
+            updated = False
+            for field in ["handle", "record_name", "display_name", "description", "avatar_path", "ranking_weights"]:
+                value = data.get(field)
+                if value and getattr(feed, field) != value:
+                    setattr(feed, field, value)
+                    updated = True
+            if updated:
+                feed.save()
+
+        if sources is not None:
+            # Replace old sources for this feed
+            FeedSource.delete().where(FeedSource.feed == feed).execute()
+            rows = [
+                {"feed": feed.id, "source_type": source.source_type,
+                 "identifier": source.identifier, "weight": source.weight}
+                for source in sources
+            ]
+            for batch in chunked(rows, SOURCE_INSERT_BATCH):
+                FeedSource.insert_many(batch).execute()
+
+    return feed
+
+
+async def save_feed(feed_uri: str, data: dict, sources=None) -> Feed:
+    """Create or update a feed's metadata, replacing its sources if given."""
+    return await run(_save_feed, feed_uri, data, sources)
+
+
+def _list_feed_topics() -> list[dict]:
+    rows = (
+        FeedSource
+        .select(Feed.uri, FeedSource.identifier, FeedSource.weight)
+        .join(Feed)
+        .where(FeedSource.source_type == "topic_preference")
+        .order_by(Feed.uri)
+        .dicts()
+    )
+    feeds = {}
+    for row in rows:
+        feeds.setdefault(row["uri"], []).append({"name": row["identifier"], "priority": row["weight"]})
+    return [{"feed": uri, "topics": topics} for uri, topics in feeds.items()]
+
+
+async def list_feed_topics() -> list[dict]:
+    """Return every feed's topic preferences as [{"feed": uri, "topics": [...]}]."""
+    return await run(_list_feed_topics)
+
+
+def _acquire_lease(feed_uri: str, owner: str, ttl: float) -> bool:
+    now = time.time()
+    # Atomic upsert: take the lease if nobody holds it, it expired, or we already own it
+    (FeedLease
+     .insert(feed_uri=feed_uri, owner=owner, expires_at=now + ttl)
+     .on_conflict(
+         conflict_target=[FeedLease.feed_uri],
+         update={FeedLease.owner: owner, FeedLease.expires_at: now + ttl},
+         where=(FeedLease.expires_at < now) | (FeedLease.owner == owner),
+     )
+     .execute())
+    lease = FeedLease.get_or_none(FeedLease.feed_uri == feed_uri)
+    return lease is not None and lease.owner == owner
+
+
+async def acquire_lease(feed_uri: str, owner: str, ttl: float) -> bool:
+    """Claim the right to rebuild a feed for `ttl` seconds; False if another worker holds it."""
+    return await run(_acquire_lease, feed_uri, owner, ttl)
+
+
+def _release_lease(feed_uri: str, owner: str):
+    FeedLease.delete().where((FeedLease.feed_uri == feed_uri) & (FeedLease.owner == owner)).execute()
+
+
+async def release_lease(feed_uri: str, owner: str):
+    """Give up a feed's rebuild lease if we still hold it."""
+    await run(_release_lease, feed_uri, owner)
+
+
+def _feed_registry_version() -> tuple:
+    return Feed.select(fn.COUNT(Feed.id), fn.MAX(Feed.id)).scalar(as_tuple=True)
+
+
+async def feed_registry_version() -> tuple:
+    """Cheap fingerprint of the set of feeds; changes whenever one is added or removed."""
+    return await run(_feed_registry_version)
+
+
+def _list_feed_uris() -> list[str]:
+    return [feed.uri for feed in Feed.select(Feed.uri)]
+
+
+async def list_feed_uris() -> list[str]:
+    """URIs of every persisted feed."""
+    return await run(_list_feed_uris)
+
+
+def _get_did_key(did: str):
+    row = DidKey.get_or_none(DidKey.did == did)
+    return None if row is None else (row.signing_key, row.fetched_at)
+
+
+async def get_did_key(did: str):
+    """Return a persisted (signing_key, fetched_at) for a DID, or None."""
+    return await run(_get_did_key, did)
+
+
+def _save_did_key(did: str, signing_key: str, fetched_at: float):
+    (DidKey
+     .insert(did=did, signing_key=signing_key, fetched_at=fetched_at)
+     .on_conflict(
+         conflict_target=[DidKey.did],
+         update={DidKey.signing_key: signing_key, DidKey.fetched_at: fetched_at},
+     )
+     .execute())
+
+
+async def save_did_key(did: str, signing_key: str, fetched_at: float):
+    """Persist a freshly resolved signing key so every worker (and the next restart) can reuse it."""
+    await run(_save_did_key, did, signing_key, fetched_at)
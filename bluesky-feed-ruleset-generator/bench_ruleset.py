@@ -0,0 +1,66 @@
+"""Fire concurrent ruleset requests at the generator and report latency.
+
+Usage:
+    python bench_ruleset.py --url http://localhost:8080 --users 20 --prompts 5
+
+Sends `--users` concurrent requests per round for `--rounds` rounds, cycling
+through `--prompts` distinct prompts, so later rounds exercise the ruleset
+cache and shared topics exercise the author cache. Run it against the app
+backed by stub_llm.py; with `--stub-url` it also prints the stub's call
+counts (LLM calls and author lookups actually made).
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+import httpx
+
+PROMPTS = [
+    "I want to see stuff about LeBron and updates on the crypto markets.",
+    "Webcomic artists and people who draw comics, no politics please.",
+    "NBA trade rumors and basketball analysis.",
+    "Bitcoin, ethereum and the crypto economy.",
+    "Cozy comic art and indie illustrators.",
+    "Lakers games and LeBron highlights.",
+    "Anything about crypto regulation.",
+    "Basketball memes and comic strips.",
+]
+
+
+async def one_request(client, url, api_key, prompt):
+    start = time.perf_counter()
+    r = await client.post(f"{url}/api/generate-feed-ruleset", json={"query": prompt}, headers={"x-api-key": api_key})
+    r.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def main(args):
+    api_key = os.getenv("API_KEY", "")
+    prompts = [PROMPTS[i % len(PROMPTS)] + ("" if i < len(PROMPTS) else f" ({i})") for i in range(args.prompts)]
+    async with httpx.AsyncClient(timeout=120) as client:
+        for round_number in range(1, args.rounds + 1):
+            start = time.perf_counter()
+            latencies = await asyncio.gather(*(
+                one_request(client, args.url, api_key, prompts[i % len(prompts)]) for i in range(args.users)
+            ))
+            wall = time.perf_counter() - start
+            latencies.sort()
+            print(f"round {round_number}: {args.users} requests in {wall:.2f}s, "
+                  f"p50 {statistics.median(latencies) * 1000:.0f} ms, "
+                  f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.0f} ms, "
+                  f"max {latencies[-1] * 1000:.0f} ms")
+
+        if args.stub_url:
+            print("stub calls:", (await client.get(f"{args.stub_url}/stats")).json())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8080")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--prompts", type=int, default=5)
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--stub-url")
+    asyncio.run(main(parser.parse_args()))
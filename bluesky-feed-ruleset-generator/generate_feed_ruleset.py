@@ -1,83 +1,207 @@
 import os
+import re
+import copy
 import json
+import time
 import datetime
 import asyncio
 import httpx
-import numpy as np
-import onnxruntime as ort
 import openai
-from transformers import AutoTokenizer
+from bluesky_shared.embedding import Embedder
+from bluesky_shared.upstream import UpstreamClient
 
 # Configuration
-openai.api_key = os.getenv("OPENAI_API_KEY")
 CUSTOM_API_URL = os.getenv("CUSTOM_API_URL")
+PUBLIC_API_URL = os.getenv("BSKY_PUBLIC_API_URL", "https://public.api.bsky.app")
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4.1-mini")
+
+AUTHOR_CACHE_TTL = 6 * 3600  # seconds a topic's suggested authors are reused
+AUTHOR_RETRY_TTL = 60  # seconds an empty or partly failed author lookup is reused
+RULESET_CACHE_TTL = 3600  # seconds a prompt's generated ruleset is reused
+AUTHOR_CACHE_SIZE = 2048
+RULESET_CACHE_SIZE = 512
+HYBRID_AUTHOR_LIMIT = 4  # authors taken from the custom API's hybrid search per topic
+HYBRID_FAME_WEIGHT = 0.5  # how much follower counts lift authors in that ranking
 
 # Load ONNX model setup
 MODEL_PATH = os.path.join(os.path.dirname(__file__), "all-MiniLM-L6-v2.onnx")
-TOKENIZER_NAME = "sentence-transformers/all-MiniLM-L6-v2"
-
-tokenizer = AutoTokenizer.from_pretrained(TOKENIZER_NAME)
-session = ort.InferenceSession(MODEL_PATH, providers=["CPUExecutionProvider"])
-
-def encode_onnx(texts):
-    """Return normalized embedding vectors using ONNX model."""
-    if isinstance(texts, str):
-        texts = [texts]
-    inputs = tokenizer(
-        texts,
-        padding=True,
-        truncation=True,
-        return_tensors="np",
-    )
-    outputs = session.run(None, dict(inputs))
-    embeddings = outputs[0]
-    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
-    norms[norms == 0] = 1
-    embeddings = embeddings / norms
-    return embeddings
 
-async def fetch_top_authors(query: str) -> list[str]:
-    """Query the custom API for top authors using both text and embedding search."""
+embedder = Embedder(MODEL_PATH)
+
+# A completed {"name": ..., "priority": ...} topic object in the partially streamed JSON
+TOPIC_PATTERN = re.compile(r'\{\s*"name"\s*:\s*"((?:[^"\\]|\\.)*)"\s*,\s*"priority"\s*:\s*[-+0-9.eE]+\s*\}')
+
+
+class TTLCache:
+    """Small async cache with expiry that also shares in-flight computations.
+
+    Concurrent callers asking for the same key await one task instead of
+    each starting their own LLM call or author lookup. `ttl_for(value)`, if
+    given, picks each value's lifetime instead (0 keeps it out of the cache).
+    """
+
+    def __init__(self, ttl: float, max_size: int, ttl_for=None):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.ttl_for = ttl_for
+        self.values = {}  # key -> (expires_at, value)
+        self.inflight = {}
+
+    async def get_or_compute(self, key, compute):
+        item = self.values.get(key)
+        if item is not None and item[0] > time.time():
+            return item[1]
+
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(compute())
+            self.inflight[key] = task
+            task.add_done_callback(lambda t: self._store(key, t))
+        return await asyncio.shield(task)
+
+    def _store(self, key, task: asyncio.Task):
+        self.inflight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        ttl = self.ttl_for(task.result()) if self.ttl_for else self.ttl
+        if ttl <= 0:
+            return
+        if len(self.values) >= self.max_size:
+            # Drop the entry closest to expiry
+            self.values.pop(min(self.values, key=lambda k: self.values[k][0]))
+        self.values[key] = (time.time() + ttl, task.result())
+
+
+def author_ttl(result) -> float:
+    # Don't pin an empty or degraded lookup for hours; retry it soon instead
+    dids, complete = result
+    return AUTHOR_CACHE_TTL if dids and complete else AUTHOR_RETRY_TTL
+
+
+author_cache = TTLCache(AUTHOR_CACHE_TTL, AUTHOR_CACHE_SIZE, ttl_for=author_ttl)
+ruleset_cache = TTLCache(RULESET_CACHE_TTL, RULESET_CACHE_SIZE)
+
+# Shared clients, created on first use so importing this module needs no credentials
+_clients = {}
+
+
+def http_client() -> httpx.AsyncClient:
+    """One pooled HTTP client for the custom API's author lookups."""
+    if "http" not in _clients:
+        _clients["http"] = httpx.AsyncClient(
+            timeout=30.0,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        )
+    return _clients["http"]
+
+
+def appview_client() -> UpstreamClient:
+    """Rate-limit-aware client for Bluesky's public AppView (searchActors)."""
+    if "appview" not in _clients:
+        _clients["appview"] = UpstreamClient(PUBLIC_API_URL)
+    return _clients["appview"]
+
+
+def llm_client() -> openai.AsyncOpenAI:
+    """Async OpenAI client (OPENAI_BASE_URL points it at a stub for local testing)."""
+    if "llm" not in _clients:
+        _clients["llm"] = openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _clients["llm"]
+
+
+async def close_clients():
+    if "http" in _clients:
+        await _clients.pop("http").aclose()
+    if "appview" in _clients:
+        await _clients.pop("appview").aclose()
+    if "llm" in _clients:
+        await _clients.pop("llm").close()
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+async def search_top_authors(query: str) -> tuple[list[str], bool]:
+    """Query Bluesky and the custom API (hybrid text + embedding search) for top authors.
+
+    Returns the DIDs found and whether both searches answered successfully.
+    """
     suggested_dids = set()
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        async def bluesky_search():
-            url = "https://public.api.bsky.app/xrpc/app.bsky.actor.searchActors"
-            params = {"q": query, "limit": 4}
-            r = await client.get(url, params=params)
-            if r.status_code == 200:
-                data = r.json()
-                for actor in data.get("actors", []):
-                    did = actor.get("did")
-                    if did:
-                        suggested_dids.add(did)
-
-        async def text_search():
-            r = await client.get(f"{CUSTOM_API_URL}/search/authors", params={"q": query})
-            if r.status_code == 200:
-                for author in r.json()[:2]:
-                    did = author.get("id") or author.get("did")
-                    if did:
-                        suggested_dids.add(did)
-
-        async def vector_search():
-            vector = encode_onnx(query).tolist()[0]
-            body = json.dumps(vector)
-            r = await client.post(
-                f"{CUSTOM_API_URL}/vector/search/authors",
-                content=body,
-                headers={"Content-Type": "application/json"}
-            )
-            if r.status_code == 200:
-                for author in r.json()[:1]:
-                    did = author.get("id") or author.get("did")
-                    if did:
-                        suggested_dids.add(did)
-
-        await asyncio.gather(bluesky_search(), text_search(), vector_search())
-
-    return list(suggested_dids)
+    client = http_client()
 
-async def generate_feed_ruleset(query: str) -> dict:
+    async def bluesky_search():
+        params = {"q": query, "limit": 4}
+        r = await appview_client().get("/xrpc/app.bsky.actor.searchActors", params=params)
+        r.raise_for_status()
+        for actor in r.json().get("actors", []):
+            did = actor.get("did")
+            if did:
+                suggested_dids.add(did)
+
+    async def hybrid_search():
+        # Text, vector and author-cluster matches fused by the custom API in one round trip
+        vector = (await asyncio.to_thread(embedder.encode, query))[0].tolist()
+        r = await client.post(
+            f"{CUSTOM_API_URL}/hybrid/search/authors",
+            params={"limit": HYBRID_AUTHOR_LIMIT, "fame_weight": HYBRID_FAME_WEIGHT},
+            json={"q": query, "vector": vector},
+        )
+        r.raise_for_status()
+        if isinstance(r.json(), list):
+            for author in r.json():
+                did = author.get("id") or author.get("did")
+                if did:
+                    suggested_dids.add(did)
+
+    results = await asyncio.gather(bluesky_search(), hybrid_search(), return_exceptions=True)
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors and not suggested_dids:
+        raise errors[0]
+    for error in errors:
+        print(f"Author search for {query!r} partly failed:", error)
+
+    return list(suggested_dids), not errors
+
+
+async def fetch_top_authors(query: str) -> list[str]:
+    """Suggested authors for a topic, cached per normalized topic for AUTHOR_CACHE_TTL
+    (AUTHOR_RETRY_TTL if nothing was found or a search failed)."""
+    dids, _ = await author_cache.get_or_compute(normalize(query), lambda: search_top_authors(query))
+    return dids
+
+
+async def stream_feed_fields(llm_prompt: str, on_topic) -> dict:
+    """Stream the LLM's JSON answer, calling `on_topic(name)` as soon as each topic is complete."""
+    stream = await llm_client().chat.completions.create(
+        model=LLM_MODEL,
+        messages=[{"role": "user", "content": llm_prompt}],
+        temperature=0.3,
+        stream=True,
+    )
+
+    raw_text = ""
+    scanned = 0
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        raw_text += chunk.choices[0].delta.content or ""
+
+        # Start author lookups while the rest of the JSON is still being generated
+        topics_at = raw_text.find('"topics"')
+        if topics_at != -1:
+            for match in TOPIC_PATTERN.finditer(raw_text, max(scanned, topics_at)):
+                on_topic(json.loads(f'"{match.group(1)}"'))
+                scanned = match.end()
+
+    raw_text = raw_text.strip()
+    try:
+        return json.loads(raw_text)
+    except json.JSONDecodeError:
+        raise ValueError("GPT did not return valid JSON:\n" + raw_text)
+
+
+async def build_feed_ruleset(query: str) -> dict:
     """Generates the feed ruleset JSON including suggested authors."""
     # LLM prompt
     llm_prompt = f"""
@@ -114,26 +238,35 @@ async def generate_feed_ruleset(query: str) -> dict:
     - Output ONLY valid JSON.
     """
 
-    response = openai.chat.completions.create(
-        model="gpt-4.1-mini",
-        messages=[{"role": "user", "content": llm_prompt}],
-        temperature=0.3
-    )
+    # Look up authors for each topic as soon as the stream has produced it
+    author_tasks = {}
+
+    def start_author_lookup(name):
+        if name not in author_tasks:
+            author_tasks[name] = asyncio.ensure_future(fetch_top_authors(name))
 
-    raw_text = response.choices[0].message.content.strip()
     try:
-        feed_fields = json.loads(raw_text)
-    except json.JSONDecodeError:
-        raise ValueError("GPT did not return valid JSON:\n" + raw_text)
+        feed_fields = await stream_feed_fields(llm_prompt, start_author_lookup)
+        for topic in feed_fields.get("topics", []):
+            start_author_lookup(topic["name"])
+    except BaseException:
+        for task in author_tasks.values():
+            task.cancel()
+        raise
 
     # Add metadata
     feed_fields["original_prompt"] = query
     feed_fields["generated_at"] = datetime.datetime.utcnow().isoformat()
 
-    # Fetch suggested accounts in parallel
+    # Only topics in the final JSON count; one topic's failed lookup doesn't fail the ruleset
     topic_queries = [t["name"] for t in feed_fields.get("topics", [])]
-    results = await asyncio.gather(*(fetch_top_authors(q) for q in topic_queries))
-    suggested_accounts = set(did for sublist in results for did in sublist)
+    results = await asyncio.gather(*author_tasks.values(), return_exceptions=True)
+    suggested_accounts = set()
+    for name, result in zip(author_tasks, results):
+        if isinstance(result, Exception):
+            print(f"Author lookup for topic {name!r} failed:", result)
+        elif name in topic_queries:
+            suggested_accounts.update(result)
     feed_fields["suggested_accounts"] = list(suggested_accounts)
 
     # Remove name/description from blueprint
@@ -152,6 +285,12 @@ async def generate_feed_ruleset(query: str) -> dict:
 
     return final_output
 
+
+async def generate_feed_ruleset(query: str) -> dict:
+    """Cached build_feed_ruleset: the same prompt within RULESET_CACHE_TTL reuses its ruleset."""
+    ruleset = await ruleset_cache.get_or_compute(normalize(query), lambda: build_feed_ruleset(query))
+    return copy.deepcopy(ruleset)
+
 # Example usage
 async def main():
     prompt = (
@@ -160,6 +299,7 @@ async def main():
     )
     result = await generate_feed_ruleset(query=prompt)
     print(json.dumps(result, indent=4))
+    await close_clients()
 
 
 if __name__ == "__main__":
@@ -1,12 +1,26 @@
 from fastapi import FastAPI, Request, HTTPException
 from pydantic import BaseModel
+from contextlib import asynccontextmanager
+import asyncio
 import os
 
-from generate_feed_ruleset import generate_feed_ruleset
+from generate_feed_ruleset import close_clients, embedder, generate_feed_ruleset
 from fastapi.middleware.cors import CORSMiddleware
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the embedding model in the background so the container accepts
+    # traffic right away; the first request that needs it waits for it
+    warmup = asyncio.create_task(asyncio.to_thread(embedder.load))
+    yield
+    warmup.cancel()
+    await asyncio.gather(warmup, return_exceptions=True)
+    await close_clients()
+
+
 # App setup
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # CORS configuration
 allowed_origins = [ # Set your allowed origins here
@@ -0,0 +1,101 @@
+"""Local stand-in for the OpenAI API and the author search endpoints.
+
+Usage:
+    uvicorn stub_llm:app --port 9000
+    export OPENAI_BASE_URL=http://localhost:9000/v1 OPENAI_API_KEY=stub
+    export CUSTOM_API_URL=http://localhost:9000 BSKY_PUBLIC_API_URL=http://localhost:9000
+    uvicorn main:app --port 8080
+
+`/v1/chat/completions` streams a fixed ruleset as server-sent events (or
+returns it whole without `stream`), spreading the answer over
+STUB_LLM_SECONDS (default 2) like a real model would. The author search
+endpoints answer after STUB_SEARCH_SECONDS (default 0.2) with made-up DIDs
+derived from the query. Every call is counted at `/stats`, so a load test
+can check how many LLM calls and lookups the caches saved.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import Counter
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+LLM_SECONDS = float(os.getenv("STUB_LLM_SECONDS", 2))
+SEARCH_SECONDS = float(os.getenv("STUB_SEARCH_SECONDS", 0.2))
+CHUNK_CHARS = 12
+
+TOPICS = ["basketball", "crypto", "webcomics", "nba trades", "bitcoin", "comic art", "lebron"]
+
+app = FastAPI()
+calls = Counter()
+
+
+def fake_dids(query: str, count: int) -> list[str]:
+    digest = hashlib.sha1(query.lower().encode()).hexdigest()
+    return [f"did:plc:stub{digest[i * 6:i * 6 + 6]}" for i in range(count)]
+
+
+def ruleset_for(prompt: str) -> str:
+    # Pick topics from the prompt's hash so different prompts share some topics
+    digest = hashlib.sha1(prompt.encode()).digest()
+    topics = [TOPICS[(digest[i] + i) % len(TOPICS)] for i in range(5)]
+    return json.dumps({
+        "record_name": "stub-feed",
+        "display_name": "Stub Feed",
+        "description": "A feed generated by the stub LLM.",
+        "topics": [{"name": name, "priority": round(1.0 - i * 0.1, 1)} for i, name in enumerate(dict.fromkeys(topics))],
+        "filters": {"limit_posts_about": ["politics"]},
+        "ranking_weights": {"focused": 0.4, "fresh": 0.3, "balanced": 0.2, "trending": 0.1},
+    }, indent=2)
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    calls["llm"] += 1
+    content = ruleset_for(body["messages"][-1]["content"])
+    chunks = [content[i:i + CHUNK_CHARS] for i in range(0, len(content), CHUNK_CHARS)]
+    base = {"id": "chatcmpl-stub", "created": int(time.time()), "model": body.get("model", "stub")}
+
+    if not body.get("stream"):
+        await asyncio.sleep(LLM_SECONDS)
+        return {
+            **base, "object": "chat.completion",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        }
+
+    async def events():
+        for chunk in chunks:
+            await asyncio.sleep(LLM_SECONDS / len(chunks))
+            delta = {**base, "object": "chat.completion.chunk",
+                     "choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": None}]}
+            yield f"data: {json.dumps(delta)}\n\n"
+        done = {**base, "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        yield f"data: {json.dumps(done)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/xrpc/app.bsky.actor.searchActors")
+async def search_actors(q: str, limit: int = 25):
+    calls["searchActors"] += 1
+    await asyncio.sleep(SEARCH_SECONDS)
+    return {"actors": [{"did": did} for did in fake_dids("bsky " + q, min(limit, 4))]}
+
+
+@app.post("/hybrid/search/authors")
+async def hybrid_search_authors(request: Request, limit: int = 10):
+    body = await request.json()
+    calls["hybrid/search/authors"] += 1
+    await asyncio.sleep(SEARCH_SECONDS)
+    return [{"id": did} for did in fake_dids("hybrid " + body["q"], min(limit, 6))]
+
+
+@app.get("/stats")
+async def stats():
+    return dict(calls)
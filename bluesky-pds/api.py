@@ -1,10 +1,21 @@
-from fastapi import FastAPI, Query
+from fastapi import FastAPI, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from asyncpg import create_pool
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from asyncpg import create_pool, QueryCanceledError, UndefinedTableError
+import asyncio
+import math
+import statistics
 import uvicorn
 import os
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timedelta
 from contextlib import asynccontextmanager
 import logging
+from bluesky_shared.bloom import BloomFilter
+from hot_posts import HotPostIndex
 
 # Configure logging
 logging.basicConfig(
@@ -22,16 +33,265 @@ DB_PASSWORD = os.getenv("DB_PASSWORD")
 
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
+# Optional read replica (same credentials); every endpoint here only reads, so all of them use it
+DB_READ_HOST = os.getenv("DB_READ_HOST")
+DB_READ_PORT = int(os.getenv("DB_READ_PORT", DB_PORT))
+READ_DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_READ_HOST}:{DB_READ_PORT}/{DB_NAME}" if DB_READ_HOST else None
+
+# Connection pool tuning
+POOL_MIN_SIZE = int(os.getenv("API_POOL_MIN_SIZE", 2))
+POOL_MAX_SIZE = int(os.getenv("API_POOL_MAX_SIZE", 10))
+STATEMENT_TIMEOUT_MS = int(os.getenv("API_STATEMENT_TIMEOUT_MS", 5000))
+# Behind PgBouncer in transaction mode, named prepared statements and startup
+# settings don't survive between transactions: the statement cache defaults to
+# off (PgBouncer >= 1.21 with max_prepared_statements can re-enable it via
+# API_STATEMENT_CACHE_SIZE) and timeouts are enforced by the client only
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "").lower() in ("1", "true", "yes")
+STATEMENT_CACHE_SIZE = int(os.getenv("API_STATEMENT_CACHE_SIZE", 0 if DB_PGBOUNCER else 100))
+
+DB_TIMING_WINDOW = 1000  # recent acquisitions kept for /stats/db
+db_timings = {"wait": deque(maxlen=DB_TIMING_WINDOW), "query": deque(maxlen=DB_TIMING_WINDOW)}
+request_timings = ContextVar("request_timings", default=None)
+
+# Post embedding storage (see migrate_embeddings.py): column type "vector" or "halfvec",
+# and whether post search goes through the binary-quantized (bit) index first
+POST_EMBEDDING_TYPE = os.getenv("POST_EMBEDDING_TYPE", "vector")
+POST_SEARCH_BINARY = os.getenv("POST_SEARCH_BINARY", "").lower() in ("1", "true", "yes")
+BINARY_OVERFETCH = int(os.getenv("POST_SEARCH_OVERFETCH", 10))  # Hamming candidates per result kept
+VECTOR_SEARCH_LIMIT = 25
+HOT_OVERFETCH = 2  # hot index hits per result kept, covering posts deleted, edited or pruned since indexing
+
+# Recent posts answered in-process when they fall inside its window (HOT_INDEX_HOURS)
+hot_index = HotPostIndex()
+
+TOMBSTONE_BLOOM_TTL = 30  # seconds a built tombstone filter is served before rebuilding
+TOMBSTONE_ERROR_RATE = 0.001  # false positive rate (live posts wrongly treated as deleted)
+tombstone_bloom = {"built_at": 0.0, "body": None, "task": None}
+
+if POST_EMBEDDING_TYPE not in ("vector", "halfvec"):
+    raise ValueError(f"POST_EMBEDDING_TYPE must be 'vector' or 'halfvec', not {POST_EMBEDDING_TYPE!r}")
+
+# Columns returned for posts; the full record (raw) is left out of responses
+POST_COLUMNS = "id, repo, rkey, cid, text, created_at, embedding, langs, reply_parent, reply_root, embed_type, mentions, links"
+JOINED_POST_COLUMNS = ", ".join(f"p.{column}" for column in POST_COLUMNS.split(", "))
+
+HYBRID_RRF_K = 60  # reciprocal rank fusion constant: score = sum of 1 / (k + rank)
+HYBRID_CANDIDATES = 50  # rows fetched from each ranked list before fusing
+RECENCY_HALF_LIFE_HOURS = 24  # post age at which the recency boost halves
+FAME_SATURATION = 1_000_000  # followers + posts at which the fame boost is full
+
+# Text match, newest first
+LEXICAL_SEARCH_POSTS_SQL = f"""
+SELECT {POST_COLUMNS} FROM posts
+WHERE text ILIKE $1
+ORDER BY created_at DESC
+LIMIT $2
+"""
+
+# Text match on any profile field, most famous first
+LEXICAL_SEARCH_AUTHORS_SQL = """
+SELECT *,
+       (followers_count + posts_count) AS fame_score
+FROM authors
+WHERE
+    display_name ILIKE $1
+    OR handle ILIKE $1
+    OR description ILIKE $1
+    OR posts_text ILIKE $1
+ORDER BY fame_score DESC, updated_at DESC
+LIMIT $2
+"""
+
+VECTOR_SEARCH_AUTHORS_SQL = """
+SELECT *,
+       1 - (posts_embedding <=> $1) AS similarity
+FROM authors
+WHERE posts_embedding IS NOT NULL
+ORDER BY posts_embedding <=> $1
+LIMIT $2
+"""
+
+AUTHOR_EMBEDDING_FIELDS = ["display_name", "handle", "description", "posts"]
+AUTHOR_FIELD_CANDIDATES = 100  # ANN candidates fetched per weighted field before reranking
+
+
+def per_field_candidates(field: str, weight_param: str) -> str:
+    # <-> (L2) so the per-field ivfflat vector_l2_ops index is used; for unit-length
+    # embeddings it ranks exactly like cosine distance
+    return f"""(
+        SELECT id FROM authors
+        WHERE {weight_param} > 0 AND {field}_embedding IS NOT NULL
+        ORDER BY {field}_embedding <-> $1::vector
+        LIMIT $6
+    )"""
+
+
+# $2..$5 are the field weights, in AUTHOR_EMBEDDING_FIELDS order
+WEIGHTED_AUTHOR_SIMILARITY = "\n       + ".join(
+    f"${i}::real * coalesce(1 - (a.{field}_embedding <=> $1::vector), 0)"
+    for i, field in enumerate(AUTHOR_EMBEDDING_FIELDS, start=2)
+)
+
+# Per-field ANN candidates, reranked by the weighted sum of per-field cosine similarities
+MULTI_FIELD_SEARCH_AUTHORS_SQL = f"""
+WITH candidates AS (
+    {" UNION ".join(per_field_candidates(field, f"${i}::real") for i, field in enumerate(AUTHOR_EMBEDDING_FIELDS, start=2))}
+)
+SELECT a.*,
+       {WEIGHTED_AUTHOR_SIMILARITY} AS similarity
+FROM authors a
+JOIN candidates c ON c.id = a.id
+ORDER BY similarity DESC
+LIMIT $7
+"""
+
+# Exact cosine KNN over posts.embedding
+VECTOR_SEARCH_POSTS_SQL = f"""
+SELECT {POST_COLUMNS},
+       1 - (embedding <=> $1::{POST_EMBEDDING_TYPE}) AS similarity
+FROM posts
+WHERE embedding IS NOT NULL
+ORDER BY embedding <=> $1::{POST_EMBEDDING_TYPE}
+LIMIT $2
+"""
+
+# Exact cosine KNN over posts newer than $3 (windows the hot index doesn't cover)
+VECTOR_SEARCH_RECENT_POSTS_SQL = f"""
+SELECT {POST_COLUMNS},
+       1 - (embedding <=> $1::{POST_EMBEDDING_TYPE}) AS similarity
+FROM posts
+WHERE embedding IS NOT NULL AND created_at >= $3
+ORDER BY embedding <=> $1::{POST_EMBEDDING_TYPE}
+LIMIT $2
+"""
+
+# Hot index hits re-scored against the stored embeddings: deleted or pruned posts
+# drop out, and posts edited (re-embedded) since they were indexed get their current score
+HOT_HITS_SQL = f"""
+SELECT {POST_COLUMNS},
+       1 - (embedding <=> $2::{POST_EMBEDDING_TYPE}) AS similarity
+FROM posts
+WHERE id = ANY($1::integer[]) AND embedding IS NOT NULL
+"""
+
+# Over-fetch by Hamming distance on the bit index, then rerank those exactly
+BINARY_SEARCH_POSTS_SQL = f"""
+WITH candidates AS (
+    SELECT id
+    FROM posts
+    WHERE embedding IS NOT NULL
+    ORDER BY binary_quantize(embedding)::bit(384) <~> binary_quantize($1::{POST_EMBEDDING_TYPE})
+    LIMIT $3
+)
+SELECT {JOINED_POST_COLUMNS},
+       1 - (p.embedding <=> $1::{POST_EMBEDDING_TYPE}) AS similarity
+FROM posts p
+JOIN candidates c ON c.id = p.id
+ORDER BY p.embedding <=> $1::{POST_EMBEDDING_TYPE}
+LIMIT $2
+"""
+
+# Nearest author clusters (built by author_clusters.py), then each cluster's top-ranked members
+CLUSTER_AUTHORS_SQL = """
+WITH nearest AS (
+    SELECT id, 1 - (centroid <=> $1) AS cluster_similarity
+    FROM author_clusters
+    ORDER BY centroid <=> $1
+    LIMIT $2
+)
+SELECT a.id, a.handle, a.display_name, a.description, a.followers_count, a.posts_count,
+       m.cluster_id, n.cluster_similarity, m.similarity, m.score
+FROM nearest n
+CROSS JOIN LATERAL (
+    SELECT author_id, cluster_id, similarity, score
+    FROM author_cluster_members
+    WHERE cluster_id = n.id
+    ORDER BY score DESC
+    LIMIT $3
+) m
+JOIN authors a ON a.id = m.author_id
+ORDER BY n.cluster_similarity * m.score DESC
+LIMIT $3
+"""
+
+async def open_pool(dsn: str):
+    server_settings = {"application_name": "bluesky-pds-api"}
+    if not DB_PGBOUNCER:
+        server_settings["statement_timeout"] = str(STATEMENT_TIMEOUT_MS)
+    return await create_pool(
+        dsn=dsn,
+        min_size=POOL_MIN_SIZE,
+        max_size=POOL_MAX_SIZE,
+        # Client-side per-statement timeout (also cancels the query on the server)
+        command_timeout=STATEMENT_TIMEOUT_MS / 1000,
+        statement_cache_size=STATEMENT_CACHE_SIZE,
+        server_settings=server_settings,
+    )
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    logger.info("Starting up: creating DB connection pool...")
-    app.state.pool = await create_pool(dsn=DATABASE_URL)
+    logger.info(f"Starting up: creating DB connection pool ({POOL_MIN_SIZE}-{POOL_MAX_SIZE} connections)...")
+    app.state.pool = None
+    app.state.replica = None
+    if READ_DATABASE_URL:
+        try:
+            app.state.pool = await open_pool(READ_DATABASE_URL)
+            app.state.replica = DB_READ_HOST
+            logger.info(f"Reading from replica {DB_READ_HOST}")
+        except Exception as e:
+            logger.error(f"Read replica {DB_READ_HOST} unavailable ({e}); reading from the primary")
+    if app.state.pool is None:
+        app.state.pool = await open_pool(DATABASE_URL)
+    hot_index_task = asyncio.create_task(hot_index.run(app.state.pool)) if hot_index.enabled else None
     yield
+    if hot_index_task is not None:
+        hot_index_task.cancel()
+        await asyncio.gather(hot_index_task, return_exceptions=True)
     logger.info("Shutting down: closing DB connection pool...")
     await app.state.pool.close()
 
+
+@asynccontextmanager
+async def acquire():
+    """Pooled connection, timing the wait for it separately from its use."""
+    start = time.perf_counter()
+    async with app.state.pool.acquire() as conn:
+        acquired = time.perf_counter()
+        try:
+            yield conn
+        finally:
+            wait, query = acquired - start, time.perf_counter() - acquired
+            db_timings["wait"].append(wait)
+            db_timings["query"].append(query)
+            timings = request_timings.get()
+            if timings is not None:
+                timings["wait"] += wait
+                timings["query"] += query
+
 app = FastAPI(lifespan=lifespan)
 
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    """Report per-request pool wait and query time in a Server-Timing header."""
+    timings = {"wait": 0.0, "query": 0.0}
+    token = request_timings.set(timings)
+    try:
+        response = await call_next(request)
+    finally:
+        request_timings.reset(token)
+    response.headers["Server-Timing"] = (
+        f"db-wait;dur={timings['wait'] * 1000:.1f}, db-query;dur={timings['query'] * 1000:.1f}"
+    )
+    return response
+
+
+@app.exception_handler(asyncio.TimeoutError)
+@app.exception_handler(QueryCanceledError)
+async def query_timeout(request: Request, exc: Exception):
+    logger.warning(f"Query timed out after {STATEMENT_TIMEOUT_MS} ms: {request.url.path}")
+    return JSONResponse(status_code=503, content={"error": "Query timed out."})
+
 # Enable CORS
 app.add_middleware(
     CORSMiddleware,
@@ -48,16 +308,8 @@ async def search_posts(q: str = Query(...)):
     Search for posts by text (ILIKE).
     """
     logger.info(f"Received post search query: {q}")
-    async with app.state.pool.acquire() as conn:
-        rows = await conn.fetch(
-            """
-            SELECT * FROM posts
-            WHERE text ILIKE $1
-            ORDER BY created_at DESC
-            LIMIT 50
-            """,
-            f"%{q}%",
-        )
+    async with acquire() as conn:
+        rows = await conn.fetch(LEXICAL_SEARCH_POSTS_SQL, f"%{q}%", 50)
     return [dict(row) for row in rows]
 
 
@@ -69,7 +321,7 @@ async def search_authors(q: str = Query(...), use_embedding: bool = Query(False)
     Optional: use_embedding=True will rank by embedding similarity first.
     """
     logger.info(f"Received author search query: {q} (use_embedding={use_embedding})")
-    async with app.state.pool.acquire() as conn:
+    async with acquire() as conn:
         if use_embedding:
             # Use embedding similarity if requested
             rows = await conn.fetch(
@@ -86,75 +338,344 @@ async def search_authors(q: str = Query(...), use_embedding: bool = Query(False)
             )
         else:
             # Text-based search
-            rows = await conn.fetch(
-                """
-                SELECT *,
-                       (followers_count + posts_count) AS fame_score
-                FROM authors
-                WHERE
-                    display_name ILIKE $1
-                    OR handle ILIKE $1
-                    OR description ILIKE $1
-                    OR posts_text ILIKE $1
-                ORDER BY fame_score DESC, updated_at DESC
-                LIMIT 50
-                """,
-                f"%{q}%",
-            )
+            rows = await conn.fetch(LEXICAL_SEARCH_AUTHORS_SQL, f"%{q}%", 50)
     return [dict(row) for row in rows]
 
+# Author timeline endpoints
+@app.post("/posts/recent")
+async def recent_posts(dids: list[str], limit: int = Query(20, ge=1, le=100)):
+    """
+    Return up to `limit` most recent posts for each of the given author DIDs.
+    One query; each author is an index range scan on (repo, created_at DESC).
+    """
+    logger.info(f"Received recent posts query for {len(dids)} authors (limit={limit})")
+    async with acquire() as conn:
+        rows = await conn.fetch(
+            f"""
+            SELECT p.*
+            FROM unnest($1::text[]) AS d(repo)
+            CROSS JOIN LATERAL (
+                SELECT {POST_COLUMNS} FROM posts
+                WHERE posts.repo = d.repo
+                ORDER BY created_at DESC
+                LIMIT $2
+            ) AS p
+            """,
+            list(set(dids)),
+            limit,
+        )
+    return [dict(row) for row in rows]
+
+# Feed candidate pool endpoints
+@app.get("/feeds/candidates")
+async def feed_candidates(feed: str = Query(...), limit: int = Query(500, ge=1, le=2000)):
+    """
+    Return the newest posts the ingester matched to a feed, with their match score.
+    """
+    logger.info(f"Received candidate pool query for {feed} (limit={limit})")
+    async with acquire() as conn:
+        rows = await conn.fetch(
+            f"""
+            SELECT {JOINED_POST_COLUMNS}, fc.score
+            FROM feed_candidates fc
+            JOIN posts p ON p.id = fc.post_id
+            WHERE fc.feed_uri = $1
+            ORDER BY fc.created_at DESC
+            LIMIT $2
+            """,
+            feed,
+            limit,
+        )
+    return [dict(row) for row in rows]
+
+# Deleted post endpoints
+@app.get("/tombstones/bloom")
+async def tombstones_bloom():
+    """
+    Bloom filter of recently deleted post URIs (see bluesky_shared.bloom),
+    so feeds can drop dead candidates without fetching them.
+    """
+    if tombstone_bloom["body"] is None or time.time() - tombstone_bloom["built_at"] >= TOMBSTONE_BLOOM_TTL:
+        # One rebuild at a time; callers keep getting the previous filter meanwhile
+        task = tombstone_bloom["task"]
+        if task is None:
+            task = tombstone_bloom["task"] = asyncio.create_task(rebuild_tombstone_bloom())
+        if tombstone_bloom["body"] is None:
+            await asyncio.shield(task)
+    return tombstone_bloom["body"]
+
+
+def build_tombstone_bloom(uris: list[str]) -> dict:
+    bloom = BloomFilter.for_capacity(max(len(uris), 1000), TOMBSTONE_ERROR_RATE)
+    bloom.update(uris)
+    return bloom.to_dict()
+
+
+async def rebuild_tombstone_bloom():
+    try:
+        async with acquire() as conn:
+            rows = await conn.fetch("SELECT uri FROM post_tombstones")
+        # Hashing every URI takes a while; keep it off the event loop
+        tombstone_bloom["body"] = await asyncio.to_thread(build_tombstone_bloom, [row["uri"] for row in rows])
+        tombstone_bloom["built_at"] = time.time()
+        logger.info(f"Built tombstone filter with {len(rows)} URIs")
+    except Exception as e:
+        if tombstone_bloom["body"] is None:
+            raise  # nothing to serve; the waiting request fails with it
+        logger.error(f"Rebuilding tombstone filter failed, serving the previous one: {e}")
+    finally:
+        tombstone_bloom["task"] = None
+
 # Vector search endpoints
+async def fetch_similar_posts(conn, vector_str: str, limit: int):
+    """Nearest posts by cosine, through the binary index when POST_SEARCH_BINARY is on."""
+    if not POST_SEARCH_BINARY:
+        return await conn.fetch(VECTOR_SEARCH_POSTS_SQL, vector_str, limit)
+    overfetch = limit * BINARY_OVERFETCH
+    async with conn.transaction():
+        # HNSW returns at most ef_search rows, so it has to cover the over-fetch
+        await conn.execute(f"SET LOCAL hnsw.ef_search = {overfetch}")
+        return await conn.fetch(BINARY_SEARCH_POSTS_SQL, vector_str, limit, overfetch)
+
+
+async def similar_posts(vector: list[float], limit: int, hours: float = None) -> list[dict]:
+    """Nearest posts, optionally only those from the last `hours`.
+
+    Windows inside the hot index are ranked in-process and only the winning
+    rows are read from Postgres, where they are scored again on the stored
+    embedding (the index only tails new posts, so it never sees deletes or
+    edits); anything else goes to pgvector.
+    """
+    vector_str = f"[{','.join(map(str, vector))}]"
+    if hot_index.covers(hours):
+        hits = await asyncio.to_thread(hot_index.search, vector, limit * HOT_OVERFETCH, hours)
+        async with acquire() as conn:
+            rows = await conn.fetch(HOT_HITS_SQL, [post_id for post_id, _ in hits], vector_str)
+        posts = [dict(row) for row in rows]
+        posts.sort(key=lambda post: post["similarity"], reverse=True)
+        return posts[:limit]
+
+    async with acquire() as conn:
+        if hours:
+            since = datetime.utcnow() - timedelta(hours=hours)
+            rows = await conn.fetch(VECTOR_SEARCH_RECENT_POSTS_SQL, vector_str, limit, since)
+        else:
+            rows = await fetch_similar_posts(conn, vector_str, limit)
+    return [dict(row) for row in rows]
+
 @app.post("/vector/search/posts")
-async def vector_search_posts(vector: list[float]):
+async def vector_search_posts(vector: list[float], hours: float = Query(None, gt=0)):
     """
     Find posts whose embeddings are most similar to the provided 384-dim vector.
+    With `hours`, only posts created in that many recent hours are searched.
+    """
+    if len(vector) != 384:
+        return {"error": "Vector must be 384-dimensional."}
+
+    return await similar_posts(vector, VECTOR_SEARCH_LIMIT, hours)
+
+
+@app.post("/vector/search/authors")
+async def vector_search_authors(
+    vector: list[float],
+    display_name_weight: float = Query(0.0, ge=0),
+    handle_weight: float = Query(0.0, ge=0),
+    description_weight: float = Query(0.0, ge=0),
+    posts_weight: float = Query(1.0, ge=0),
+):
+    """
+    Find authors most similar to the provided 384-dim vector.
+    By default only posts_embedding is ranked; with other field weights set,
+    similarity is the weighted mean of the per-field cosine similarities.
     """
     if len(vector) != 384:
         return {"error": "Vector must be 384-dimensional."}
 
     vector_str = f"[{','.join(map(str, vector))}]"
+    weights = [display_name_weight, handle_weight, description_weight, posts_weight]
+    if not sum(weights):
+        return {"error": "At least one field weight must be positive."}
 
-    async with app.state.pool.acquire() as conn:
-        rows = await conn.fetch(
-            """
-            SELECT *,
-                   1 - (embedding <=> $1) AS similarity
-            FROM posts
-            WHERE embedding IS NOT NULL
-            ORDER BY embedding <=> $1
-            LIMIT 25
-            """,
-            vector_str,
-        )
+    async with acquire() as conn:
+        if weights[:3] == [0, 0, 0]:
+            rows = await conn.fetch(VECTOR_SEARCH_AUTHORS_SQL, vector_str, 25)
+        else:
+            weights = [weight / sum(weights) for weight in weights]
+            rows = await conn.fetch(
+                MULTI_FIELD_SEARCH_AUTHORS_SQL, vector_str, *weights, AUTHOR_FIELD_CANDIDATES, 25
+            )
 
     return [dict(row) for row in rows]
 
-
-@app.post("/vector/search/authors")
-async def vector_search_authors(vector: list[float]):
+# Author cluster endpoints
+@app.post("/clusters/authors")
+async def cluster_authors(
+    vector: list[float],
+    clusters: int = Query(3, ge=1, le=20),
+    limit: int = Query(10, ge=1, le=100),
+):
     """
-    Find authors whose posts_embedding are most similar to the provided 384-dim vector.
+    Suggest authors for a topic vector: the top-ranked members (similarity
+    weighted by followers) of the nearest precomputed author clusters.
     """
     if len(vector) != 384:
         return {"error": "Vector must be 384-dimensional."}
 
     vector_str = f"[{','.join(map(str, vector))}]"
 
-    async with app.state.pool.acquire() as conn:
-        rows = await conn.fetch(
-            """
-            SELECT *,
-                   1 - (posts_embedding <=> $1) AS similarity
-            FROM authors
-            WHERE posts_embedding IS NOT NULL
-            ORDER BY posts_embedding <=> $1
-            LIMIT 25
-            """,
-            vector_str,
-        )
+    async with acquire() as conn:
+        rows = await conn.fetch(CLUSTER_AUTHORS_SQL, vector_str, clusters, limit)
 
     return [dict(row) for row in rows]
 
+# Hybrid search endpoints
+class HybridQuery(BaseModel):
+    q: str
+    vector: list[float] | None = None  # 384-dim embedding of q; lexical only when omitted
+
+
+async def fetch_ranked(sql: str, *args):
+    """Run one ranked query on its own pooled connection (so legs run concurrently)."""
+    async with acquire() as conn:
+        try:
+            return await conn.fetch(sql, *args)
+        except UndefinedTableError:
+            # e.g. author_clusters before author_clusters.py has been run
+            return []
+
+
+def fuse(ranked_lists: dict, key: str, limit: int, boost=None):
+    """Reciprocal rank fusion of named ranked lists, plus an optional per-row boost.
+
+    A boost of 1.0 is worth as much as ranking first in one list.
+    """
+    fused = {}
+    for name, rows in ranked_lists.items():
+        for rank, row in enumerate(rows, start=1):
+            item = fused.setdefault(row[key], {"row": dict(row), "score": 0.0, "ranks": {}})
+            item["row"].update((k, v) for k, v in row.items() if k not in item["row"])
+            item["score"] += 1 / (HYBRID_RRF_K + rank)
+            item["ranks"][name] = rank
+
+    results = []
+    for item in fused.values():
+        row = item["row"]
+        row["rrf_score"] = item["score"]
+        if boost is not None:
+            row["rrf_score"] += boost(row) / (HYBRID_RRF_K + 1)
+        row["ranks"] = item["ranks"]
+        results.append(row)
+    results.sort(key=lambda row: row["rrf_score"], reverse=True)
+    return results[:limit]
+
+
+def recency_boost(created_at) -> float:
+    if created_at is None:
+        return 0.0
+    age_hours = max((datetime.utcnow() - created_at).total_seconds() / 3600, 0)
+    return 0.5 ** (age_hours / RECENCY_HALF_LIFE_HOURS)
+
+
+def fame_boost(row) -> float:
+    fame = (row.get("followers_count") or 0) + (row.get("posts_count") or 0)
+    return min(math.log1p(fame) / math.log1p(FAME_SATURATION), 1.0)
+
+
+def hybrid_vector(body: HybridQuery):
+    if body.vector is None:
+        return None
+    if len(body.vector) != 384:
+        raise ValueError("Vector must be 384-dimensional.")
+    return f"[{','.join(map(str, body.vector))}]"
+
+
+@app.post("/hybrid/search/posts")
+async def hybrid_search_posts(
+    body: HybridQuery,
+    limit: int = Query(25, ge=1, le=100),
+    recency_weight: float = Query(0.0, ge=0),
+    hours: float = Query(None, gt=0),
+):
+    """
+    Text (ILIKE) and vector search over posts in one call, fused with
+    reciprocal rank fusion. recency_weight boosts newer posts (halving
+    every RECENCY_HALF_LIFE_HOURS); `hours` limits the vector search to
+    recent posts.
+    """
+    try:
+        vector_str = hybrid_vector(body)
+    except ValueError as e:
+        return {"error": str(e)}
+
+    legs = {"lexical": fetch_ranked(LEXICAL_SEARCH_POSTS_SQL, f"%{body.q}%", HYBRID_CANDIDATES)}
+    if vector_str is not None:
+        legs["vector"] = similar_posts(body.vector, HYBRID_CANDIDATES, hours)
+    ranked = dict(zip(legs, await asyncio.gather(*legs.values())))
+
+    boost = (lambda row: recency_weight * recency_boost(row["created_at"])) if recency_weight else None
+    return fuse(ranked, "id", limit, boost)
+
+
+@app.post("/hybrid/search/authors")
+async def hybrid_search_authors(
+    body: HybridQuery,
+    limit: int = Query(10, ge=1, le=100),
+    fame_weight: float = Query(0.0, ge=0),
+    recency_weight: float = Query(0.0, ge=0),
+    clusters: int = Query(3, ge=0, le=20),
+):
+    """
+    Text (ILIKE), vector and author-cluster search over authors in one call,
+    fused with reciprocal rank fusion. fame_weight boosts authors by
+    followers + posts (log scale), recency_weight by updated_at.
+    """
+    try:
+        vector_str = hybrid_vector(body)
+    except ValueError as e:
+        return {"error": str(e)}
+
+    legs = {"lexical": fetch_ranked(LEXICAL_SEARCH_AUTHORS_SQL, f"%{body.q}%", HYBRID_CANDIDATES)}
+    if vector_str is not None:
+        legs["vector"] = fetch_ranked(VECTOR_SEARCH_AUTHORS_SQL, vector_str, HYBRID_CANDIDATES)
+        if clusters:
+            legs["cluster"] = fetch_ranked(CLUSTER_AUTHORS_SQL, vector_str, clusters, HYBRID_CANDIDATES)
+    ranked = dict(zip(legs, await asyncio.gather(*legs.values())))
+
+    boost = None
+    if fame_weight or recency_weight:
+        boost = lambda row: fame_weight * fame_boost(row) + recency_weight * recency_boost(row.get("updated_at"))
+    return fuse(ranked, "id", limit, boost)
+
+# Database stats endpoints
+@app.get("/stats/db")
+async def db_stats():
+    """
+    Pool occupancy and recent pool wait vs query times (ms), so waiting for
+    a connection can be told apart from slow queries.
+    """
+    def summary(values):
+        if not values:
+            return None
+        ordered = sorted(values)
+        return {
+            "p50": round(statistics.median(ordered) * 1000, 2),
+            "p95": round(ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)] * 1000, 2),
+            "max": round(ordered[-1] * 1000, 2),
+        }
+
+    pool = app.state.pool
+    return {
+        "replica": app.state.replica,
+        "pool": {"size": pool.get_size(), "idle": pool.get_idle_size(), "min": POOL_MIN_SIZE, "max": POOL_MAX_SIZE},
+        "hot_index": {
+            "hours": hot_index.hours, "ready": hot_index.ready,
+            "posts": hot_index.view[3] if hot_index.view else 0, "last_id": hot_index.last_id,
+        } if hot_index.enabled else None,
+        "samples": len(db_timings["wait"]),
+        "wait_ms": summary(db_timings["wait"]),
+        "query_ms": summary(db_timings["query"]),
+    }
+
 # Root endpoint
 @app.get("/")
 async def root():
@@ -163,8 +684,15 @@ async def root():
         "endpoints": [
             "/search/posts",
             "/search/authors",
+            "/posts/recent",
+            "/feeds/candidates",
+            "/tombstones/bloom",
             "/vector/search/posts",
-            "/vector/search/authors"
+            "/vector/search/authors",
+            "/clusters/authors",
+            "/hybrid/search/posts",
+            "/hybrid/search/authors",
+            "/stats/db"
         ]
     }
 
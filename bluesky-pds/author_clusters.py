@@ -0,0 +1,267 @@
+"""Cluster authors by their posts_embedding for instant account suggestions.
+
+Usage:
+    python author_clusters.py build [--k 256] [--epochs 3]   # full rebuild
+    python author_clusters.py refresh                         # fold in authors updated since the last run
+    python author_clusters.py refresh --interval 600          # keep refreshing every 10 minutes
+
+`build` runs mini-batch k-means (spherical: unit-length vectors, cosine
+similarity) over a server-side cursor, so the authors table is never loaded
+into memory at once. Centroids go to `author_clusters`, and every author's
+nearest cluster goes to `author_cluster_members` with a score of
+similarity * (1 + ln(1 + followers_count)), indexed so each cluster's
+members can be read already ranked.
+
+`refresh` reads only the authors ingest.py has re-embedded since the last
+run (`authors.embedding_updated_at`), nudges the centroids with them as one
+more mini-batch step and re-assigns them. api.py serves the result at
+`/clusters/authors`.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+import asyncpg
+import numpy as np
+from dotenv import load_dotenv
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+DB_HOST = os.getenv("DB_HOST")
+DB_PORT = int(os.getenv("DB_PORT", 5432))
+DB_NAME = os.getenv("DB_NAME")
+DB_USER = os.getenv("DB_USER")
+DB_PASSWORD = os.getenv("DB_PASSWORD")
+
+DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+DEFAULT_CLUSTERS = 256
+DEFAULT_EPOCHS = 3
+BATCH_SIZE = 2048  # authors per cursor fetch / mini-batch step
+INIT_SAMPLE = 20000  # authors sampled for k-means++ seeding
+
+CREATE_AUTHOR_CLUSTER_TABLES_SQL = """
+ALTER TABLE authors ADD COLUMN IF NOT EXISTS embedding_updated_at TIMESTAMP;
+CREATE INDEX IF NOT EXISTS authors_embedding_updated_at_idx ON authors (embedding_updated_at);
+CREATE TABLE IF NOT EXISTS author_clusters (
+    id INTEGER PRIMARY KEY,
+    centroid VECTOR(384) NOT NULL,
+    weight BIGINT NOT NULL DEFAULT 0,
+    size INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS author_cluster_members (
+    author_id TEXT PRIMARY KEY,
+    cluster_id INTEGER NOT NULL,
+    similarity REAL NOT NULL,
+    score REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS author_cluster_members_rank_idx
+    ON author_cluster_members (cluster_id, score DESC);
+CREATE TABLE IF NOT EXISTS author_cluster_state (
+    id BOOLEAN PRIMARY KEY DEFAULT true CHECK (id),
+    watermark TIMESTAMP NOT NULL,
+    built_at TIMESTAMP NOT NULL
+);
+"""
+
+AUTHOR_VECTORS_SQL = """
+SELECT id, posts_embedding::real[] AS embedding, followers_count
+FROM authors
+WHERE posts_embedding IS NOT NULL
+"""
+
+UPSERT_MEMBERS_SQL = """
+INSERT INTO author_cluster_members (author_id, cluster_id, similarity, score)
+SELECT * FROM unnest($1::text[], $2::integer[], $3::real[], $4::real[])
+ON CONFLICT (author_id) DO UPDATE
+SET cluster_id = EXCLUDED.cluster_id, similarity = EXCLUDED.similarity, score = EXCLUDED.score;
+"""
+
+UPDATE_CLUSTER_SIZES_SQL = """
+UPDATE author_clusters c
+SET size = (SELECT count(*) FROM author_cluster_members m WHERE m.cluster_id = c.id);
+"""
+
+
+def to_vector(values) -> str:
+    return f"[{','.join(map(str, values))}]"
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def decode(rows):
+    ids = [row["id"] for row in rows]
+    vectors = normalize_rows(np.array([row["embedding"] for row in rows], dtype=np.float32))
+    followers = np.array([row["followers_count"] or 0 for row in rows], dtype=np.float32)
+    return ids, vectors, followers
+
+
+def seed_centroids(sample: np.ndarray, k: int, rng) -> np.ndarray:
+    """k-means++ seeding on cosine distance."""
+    centroids = [sample[rng.integers(len(sample))]]
+    distance = 1 - sample @ centroids[0]
+    for _ in range(1, k):
+        weights = np.maximum(distance, 0) ** 2
+        total = weights.sum()
+        index = rng.choice(len(sample), p=weights / total) if total > 0 else rng.integers(len(sample))
+        centroids.append(sample[index])
+        distance = np.minimum(distance, 1 - sample @ sample[index])
+    return np.array(centroids, dtype=np.float32)
+
+
+def assign(centroids: np.ndarray, vectors: np.ndarray):
+    similarities = vectors @ centroids.T
+    labels = similarities.argmax(axis=1)
+    return labels, similarities[np.arange(len(vectors)), labels]
+
+
+def minibatch_step(centroids: np.ndarray, weights: np.ndarray, vectors: np.ndarray, labels: np.ndarray):
+    """Move each centroid toward its batch members with a per-centroid 1/count learning rate."""
+    for cluster in np.unique(labels):
+        members = vectors[labels == cluster]
+        weights[cluster] += len(members)
+        centroids[cluster] += (members.sum(axis=0) - len(members) * centroids[cluster]) / weights[cluster]
+    centroids[:] = normalize_rows(centroids)
+
+
+def member_scores(similarities: np.ndarray, followers: np.ndarray) -> np.ndarray:
+    return similarities * (1 + np.log1p(followers))
+
+
+async def iterate_authors(conn, where: str = "", *args):
+    """Yield (ids, unit vectors, followers) batches from a server-side cursor."""
+    async with conn.transaction():
+        cursor = await conn.cursor(AUTHOR_VECTORS_SQL + where, *args)
+        while True:
+            rows = await cursor.fetch(BATCH_SIZE)
+            if not rows:
+                break
+            yield decode(rows)
+
+
+async def build(conn, k: int, epochs: int):
+    start = time.time()
+    watermark = await conn.fetchval("SELECT now() AT TIME ZONE 'utc'")
+    rng = np.random.default_rng(0)
+
+    sample_rows = await conn.fetch(AUTHOR_VECTORS_SQL + f" ORDER BY random() LIMIT {max(INIT_SAMPLE, k)}")
+    if len(sample_rows) < k:
+        logger.warning(f"Only {len(sample_rows)} embedded authors; need at least {k} to build {k} clusters")
+        return
+    _, sample, _ = decode(sample_rows)
+    centroids = seed_centroids(sample, k, rng)
+    weights = np.zeros(k, dtype=np.int64)
+    logger.info(f"Seeded {k} centroids from {len(sample)} authors")
+
+    for epoch in range(1, epochs + 1):
+        seen = 0
+        async for _, vectors, _ in iterate_authors(conn):
+            labels, _ = assign(centroids, vectors)
+            minibatch_step(centroids, weights, vectors, labels)
+            seen += len(vectors)
+        logger.info(f"Epoch {epoch}/{epochs}: {seen} authors")
+
+    # Final assignment into a staging table, then swap it in atomically
+    await conn.execute("""
+        CREATE TEMP TABLE staged_members (
+            author_id TEXT, cluster_id INTEGER, similarity REAL, score REAL
+        )
+    """)
+    async for ids, vectors, followers in iterate_authors(conn):
+        labels, similarities = assign(centroids, vectors)
+        scores = member_scores(similarities, followers)
+        await conn.copy_records_to_table("staged_members", records=[
+            (author_id, int(label), float(similarity), float(score))
+            for author_id, label, similarity, score in zip(ids, labels, similarities, scores)
+        ])
+
+    async with conn.transaction():
+        await conn.execute("TRUNCATE author_clusters, author_cluster_members")
+        await conn.executemany(
+            "INSERT INTO author_clusters (id, centroid, weight) VALUES ($1, $2::vector, $3)",
+            [(i, to_vector(centroid), int(weight)) for i, (centroid, weight) in enumerate(zip(centroids.tolist(), weights))],
+        )
+        await conn.execute("INSERT INTO author_cluster_members SELECT * FROM staged_members")
+        await conn.execute(UPDATE_CLUSTER_SIZES_SQL)
+        await conn.execute("""
+            INSERT INTO author_cluster_state (id, watermark, built_at) VALUES (true, $1, $1)
+            ON CONFLICT (id) DO UPDATE SET watermark = EXCLUDED.watermark, built_at = EXCLUDED.built_at
+        """, watermark)
+    await conn.execute("DROP TABLE staged_members")
+    logger.info(f"Built {k} author clusters in {time.time() - start:.1f}s")
+
+
+async def refresh(conn):
+    state = await conn.fetchrow("SELECT watermark FROM author_cluster_state")
+    if state is None:
+        logger.warning("No author clusters yet; run `python author_clusters.py build` first")
+        return
+    watermark = await conn.fetchval("SELECT now() AT TIME ZONE 'utc'")
+
+    rows = await conn.fetch("SELECT id, centroid::real[] AS centroid, weight FROM author_clusters ORDER BY id")
+    centroids = normalize_rows(np.array([row["centroid"] for row in rows], dtype=np.float32))
+    weights = np.array([row["weight"] for row in rows], dtype=np.int64)
+
+    updated = 0
+    async for ids, vectors, followers in iterate_authors(
+        conn, " AND embedding_updated_at > $1", state["watermark"]
+    ):
+        labels, _ = assign(centroids, vectors)
+        minibatch_step(centroids, weights, vectors, labels)
+        labels, similarities = assign(centroids, vectors)
+        await conn.execute(
+            UPSERT_MEMBERS_SQL, ids, labels.tolist(), similarities.tolist(),
+            member_scores(similarities, followers).tolist(),
+        )
+        updated += len(ids)
+
+    async with conn.transaction():
+        if updated:
+            await conn.executemany(
+                "UPDATE author_clusters SET centroid = $2::vector, weight = $3 WHERE id = $1",
+                [(i, to_vector(centroid), int(weight)) for i, (centroid, weight) in enumerate(zip(centroids.tolist(), weights))],
+            )
+            await conn.execute(UPDATE_CLUSTER_SIZES_SQL)
+        await conn.execute("UPDATE author_cluster_state SET watermark = $1", watermark)
+    logger.info(f"Refreshed author clusters with {updated} updated authors")
+
+
+async def main(args):
+    conn = await asyncpg.connect(DATABASE_URL, command_timeout=None)
+    try:
+        await conn.execute(CREATE_AUTHOR_CLUSTER_TABLES_SQL)
+        if args.command == "build":
+            await build(conn, args.k, args.epochs)
+            return
+        while True:
+            try:
+                await refresh(conn)
+            except Exception as e:
+                if not args.interval:
+                    raise
+                logger.error(f"Error refreshing author clusters: {e}", exc_info=True)
+            if not args.interval:
+                break
+            await asyncio.sleep(args.interval)
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["build", "refresh"])
+    parser.add_argument("--k", type=int, default=DEFAULT_CLUSTERS, help="number of clusters (build)")
+    parser.add_argument("--epochs", type=int, default=DEFAULT_EPOCHS, help="passes over the authors (build)")
+    parser.add_argument("--interval", type=float, default=0, help="seconds between refreshes; 0 runs once")
+    asyncio.run(main(parser.parse_args()))
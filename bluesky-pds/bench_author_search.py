@@ -0,0 +1,112 @@
+"""Compare multi-field author search against four sequential per-field searches.
+
+Usage:
+    python bench_author_search.py [--queries 50] [--weights 0.2,0.1,0.3,0.4] [--probes 10]
+
+Query vectors are the posts_embedding of randomly chosen authors. For each
+query it times:
+
+- sequential: one `ORDER BY <field>_embedding <=> q LIMIT 25` search per field
+  (display_name, handle, description, posts), merged by weighted similarity
+  in Python, as a caller without the multi-field endpoint would do
+- combined:   api.py's MULTI_FIELD_SEARCH_AUTHORS_SQL, per-field ANN
+  candidates reranked by weighted similarity in one statement
+
+and reports p50/p95 latency plus recall@25 of both against an exact
+weighted scan of the whole table. `--probes` sets ivfflat.probes.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+import asyncpg
+from dotenv import load_dotenv
+
+from api import AUTHOR_EMBEDDING_FIELDS, AUTHOR_FIELD_CANDIDATES, MULTI_FIELD_SEARCH_AUTHORS_SQL, WEIGHTED_AUTHOR_SIMILARITY
+
+load_dotenv()
+
+DB_HOST = os.getenv("DB_HOST")
+DB_PORT = int(os.getenv("DB_PORT", 5432))
+DB_NAME = os.getenv("DB_NAME")
+DB_USER = os.getenv("DB_USER")
+DB_PASSWORD = os.getenv("DB_PASSWORD")
+
+DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+LIMIT = 25
+
+EXACT_SQL = f"""
+SELECT a.id, {WEIGHTED_AUTHOR_SIMILARITY} AS similarity
+FROM authors a
+ORDER BY similarity DESC
+LIMIT {LIMIT}
+"""
+
+
+def field_sql(field: str) -> str:
+    return f"""
+        SELECT id, 1 - ({field}_embedding <=> $1::vector) AS similarity
+        FROM authors
+        WHERE {field}_embedding IS NOT NULL
+        ORDER BY {field}_embedding <=> $1::vector
+        LIMIT {LIMIT}
+    """
+
+
+async def sequential(conn, vector, weights):
+    combined = {}
+    for field, weight in zip(AUTHOR_EMBEDDING_FIELDS, weights):
+        if weight:
+            for row in await conn.fetch(field_sql(field), vector):
+                combined[row["id"]] = combined.get(row["id"], 0.0) + weight * row["similarity"]
+    return sorted(combined, key=combined.get, reverse=True)[:LIMIT]
+
+
+async def combined(conn, vector, weights):
+    rows = await conn.fetch(MULTI_FIELD_SEARCH_AUTHORS_SQL, vector, *weights, AUTHOR_FIELD_CANDIDATES, LIMIT)
+    return [row["id"] for row in rows]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+async def main(args):
+    weights = [float(w) for w in args.weights.split(",")]
+    weights = [w / sum(weights) for w in weights]
+    conn = await asyncpg.connect(DATABASE_URL, command_timeout=None)
+    try:
+        await conn.execute(f"SET ivfflat.probes = {args.probes}")
+        queries = [row["v"] for row in await conn.fetch(
+            "SELECT posts_embedding::text AS v FROM authors WHERE posts_embedding IS NOT NULL "
+            f"ORDER BY random() LIMIT {args.queries}"
+        )]
+        print(f"{len(queries)} queries, weights {dict(zip(AUTHOR_EMBEDDING_FIELDS, [round(w, 2) for w in weights]))}\n")
+
+        results = {"sequential": ([], []), "combined": ([], [])}
+        for vector in queries:
+            exact = {row["id"] for row in await conn.fetch(EXACT_SQL, vector, *weights)}
+            for name, search in (("sequential", sequential), ("combined", combined)):
+                start = time.perf_counter()
+                ids = await search(conn, vector, weights)
+                results[name][0].append((time.perf_counter() - start) * 1000)
+                results[name][1].append(len(exact & set(ids)) / max(len(exact), 1))
+
+        print(f"{'method':<12} {'p50 ms':>8} {'p95 ms':>8} {'recall@25':>10}")
+        for name, (latencies, recalls) in results.items():
+            print(f"{name:<12} {statistics.median(latencies):8.1f} {percentile(latencies, 0.95):8.1f} "
+                  f"{statistics.mean(recalls):10.3f}")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--weights", default="0.2,0.1,0.3,0.4", help="display_name,handle,description,posts")
+    parser.add_argument("--probes", type=int, default=10)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,145 @@
+"""Compare post embedding storage options on a sample of real posts.
+
+Usage:
+    python bench_embedding_storage.py [--sample 50000] [--queries 100] [--overfetch 10]
+
+Copies the newest `--sample` post embeddings into temporary tables, one per
+variant (float32 vector + HNSW, halfvec + HNSW, halfvec + bit(384) Hamming
+index with exact rerank), and reports for each:
+
+- table and index size, and bytes per post
+- how many posts fit under prune.py's size limit with that storage
+  (the rest of the row, text and raw JSON, is taken from the live table)
+- recall@25 against exact cosine search, and mean query latency
+
+Queries are embeddings of posts just older than the sample. Nothing in the
+live tables is modified.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import asyncpg
+import numpy as np
+from dotenv import load_dotenv
+
+from prune import SIZE_LIMIT_BYTES
+
+load_dotenv()
+
+DB_HOST = os.getenv("DB_HOST")
+DB_PORT = int(os.getenv("DB_PORT", 5432))
+DB_NAME = os.getenv("DB_NAME")
+DB_USER = os.getenv("DB_USER")
+DB_PASSWORD = os.getenv("DB_PASSWORD")
+
+DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+K = 25
+
+# name -> (column type, index definition, binary over-fetch search)
+VARIANTS = {
+    "vector": ("vector(384)", "USING hnsw (embedding vector_cosine_ops)", False),
+    "halfvec": ("halfvec(384)", "USING hnsw (embedding halfvec_cosine_ops)", False),
+    "halfvec+bit": ("halfvec(384)", "USING hnsw ((binary_quantize(embedding)::bit(384)) bit_hamming_ops)", True),
+}
+
+
+def parse_vector(text: str) -> np.ndarray:
+    return np.asarray(json.loads(text), dtype=np.float32)
+
+
+async def live_row_bytes(conn) -> float:
+    """Average bytes per live post excluding the embedding and its indexes."""
+    row = await conn.fetchrow("""
+        SELECT pg_table_size('posts') + coalesce((
+                   SELECT sum(pg_relation_size(indexrelid)) FROM pg_index
+                   WHERE indrelid = 'posts'::regclass AND pg_get_indexdef(indexrelid) NOT LIKE '%embedding%'
+               ), 0) AS total_bytes,
+               (SELECT reltuples FROM pg_class WHERE oid = 'posts'::regclass) AS rows,
+               (SELECT avg(pg_column_size(embedding)) FROM (SELECT embedding FROM posts LIMIT 10000) s) AS embedding_bytes
+    """)
+    return row["total_bytes"] / max(row["rows"], 1) - float(row["embedding_bytes"] or 0)
+
+
+async def search(conn, table: str, column_type: str, binary: bool, query: str, overfetch: int) -> list[int]:
+    if not binary:
+        rows = await conn.fetch(
+            f"SELECT id FROM {table} ORDER BY embedding <=> $1::{column_type} LIMIT {K}", query
+        )
+        return [r["id"] for r in rows]
+    rows = await conn.fetch(f"""
+        WITH candidates AS (
+            SELECT id, embedding FROM {table}
+            ORDER BY binary_quantize(embedding)::bit(384) <~> binary_quantize($1::{column_type})
+            LIMIT {K * overfetch}
+        )
+        SELECT id FROM candidates ORDER BY embedding <=> $1::{column_type} LIMIT {K}
+    """, query)
+    return [r["id"] for r in rows]
+
+
+async def main(args):
+    conn = await asyncpg.connect(DATABASE_URL, command_timeout=None)
+    try:
+        print(f"Sampling {args.sample} posts...")
+        await conn.execute(f"""
+            CREATE TEMP TABLE bench_sample AS
+            SELECT id, embedding::vector(384) AS embedding
+            FROM posts WHERE embedding IS NOT NULL
+            ORDER BY id DESC LIMIT {args.sample}
+        """)
+        sample = await conn.fetch("SELECT id, embedding::text AS embedding FROM bench_sample")
+        ids = np.array([r["id"] for r in sample])
+        matrix = np.stack([parse_vector(r["embedding"]) for r in sample])
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+        queries = await conn.fetch(f"""
+            SELECT embedding::vector(384)::text AS embedding
+            FROM posts WHERE embedding IS NOT NULL AND id < {int(ids.min())}
+            ORDER BY id DESC LIMIT {args.queries}
+        """)
+        queries = [q["embedding"] for q in queries]
+
+        # Exact cosine neighbours as ground truth
+        truth = []
+        for q in queries:
+            vector = parse_vector(q)
+            scores = matrix @ (vector / max(np.linalg.norm(vector), 1e-12))
+            truth.append(set(ids[np.argsort(-scores)[:K]].tolist()))
+
+        base_bytes = await live_row_bytes(conn)
+        print(f"Live posts: ~{base_bytes:.0f} B/post besides the embedding; size limit {SIZE_LIMIT_BYTES / 1024 ** 3:.1f} GB\n")
+        print(f"{'variant':<12} {'table MB':>9} {'index MB':>9} {'B/post':>7} {'posts kept':>12} {'recall@25':>10} {'ms/query':>9}")
+
+        for name, (column_type, index, binary) in VARIANTS.items():
+            table = "bench_" + name.replace("+", "_")
+            await conn.execute(f"CREATE TEMP TABLE {table} AS SELECT id, embedding::{column_type} AS embedding FROM bench_sample")
+            await conn.execute(f"CREATE INDEX ON {table} {index}")
+            await conn.execute(f"ANALYZE {table}")
+            sizes = await conn.fetchrow(f"SELECT pg_table_size('{table}') AS t, pg_indexes_size('{table}') AS i")
+
+            await conn.execute(f"SET hnsw.ef_search = {max(40, K * args.overfetch if binary else 40)}")
+            hits, start = 0, time.perf_counter()
+            for q, expected in zip(queries, truth):
+                hits += len(expected & set(await search(conn, table, column_type, binary, q, args.overfetch)))
+            elapsed = time.perf_counter() - start
+
+            per_post = (sizes["t"] + sizes["i"]) / len(sample)
+            kept = SIZE_LIMIT_BYTES / (base_bytes + per_post)
+            recall = hits / (K * max(len(queries), 1))
+            print(f"{name:<12} {sizes['t'] / 1024 ** 2:9.1f} {sizes['i'] / 1024 ** 2:9.1f} {per_post:7.0f} "
+                  f"{kept:12,.0f} {recall:10.3f} {elapsed / max(len(queries), 1) * 1000:9.2f}")
+            await conn.execute(f"DROP TABLE {table}")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sample", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--overfetch", type=int, default=10, help="Hamming candidates per result for the bit index")
+    asyncio.run(main(parser.parse_args()))
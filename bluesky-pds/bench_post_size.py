@@ -0,0 +1,114 @@
+"""Measure bytes per post for the posts table layouts.
+
+Usage:
+    python bench_post_size.py [--sample 20000]
+
+Copies the newest `--sample` posts that still have their raw record into
+temporary tables and compares:
+
+- inline:     the old layout, full record in posts.raw (JSONB)
+- slim:       typed columns (langs, reply, embed type, mentions, links), no raw
+- compressed: slim plus the zlib-compressed record in a post_raw side table
+
+For each it prints bytes per post and how many posts fit under prune.py's
+size limit (indexes and other per-post overhead of the live table are added
+back). Nothing in the live tables is modified.
+"""
+import argparse
+import asyncio
+import json
+import os
+
+import asyncpg
+from dotenv import load_dotenv
+
+from post_record import compress_record, extract_fields
+from prune import SIZE_LIMIT_BYTES
+
+load_dotenv()
+
+DB_HOST = os.getenv("DB_HOST")
+DB_PORT = int(os.getenv("DB_PORT", 5432))
+DB_NAME = os.getenv("DB_NAME")
+DB_USER = os.getenv("DB_USER")
+DB_PASSWORD = os.getenv("DB_PASSWORD")
+
+DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+FIELD_COLUMNS = ["langs", "reply_parent", "reply_root", "embed_type", "mentions", "links"]
+
+
+async def relation_bytes(conn, *tables) -> int:
+    return sum([await conn.fetchval("SELECT pg_total_relation_size($1)", table) for table in tables])
+
+
+async def main(args):
+    conn = await asyncpg.connect(DATABASE_URL, command_timeout=None)
+    try:
+        print(f"Sampling {args.sample} posts with a raw record...")
+        await conn.execute(f"""
+            CREATE TEMP TABLE bench_inline AS
+            SELECT id, repo, rkey, cid, text, created_at, embedding, raw
+            FROM posts WHERE raw IS NOT NULL
+            ORDER BY id DESC LIMIT {args.sample}
+        """)
+        await conn.execute("ALTER TABLE bench_inline ADD PRIMARY KEY (id)")
+        count = await conn.fetchval("SELECT count(*) FROM bench_inline")
+        if not count:
+            print("No posts with a raw record to sample.")
+            return
+
+        records = [(r["id"], json.loads(r["raw"])) for r in await conn.fetch("SELECT id, raw::text AS raw FROM bench_inline")]
+
+        # Typed columns extracted exactly as ingest.py does
+        await conn.execute("""
+            CREATE TEMP TABLE bench_fields (
+                id INTEGER, langs TEXT[], reply_parent TEXT, reply_root TEXT,
+                embed_type TEXT, mentions TEXT[], links TEXT[]
+            )
+        """)
+        fields = [(post_id, extract_fields(record)) for post_id, record in records]
+        await conn.copy_records_to_table("bench_fields", records=[
+            (post_id, *(values[c] for c in FIELD_COLUMNS)) for post_id, values in fields
+        ])
+        await conn.execute(f"""
+            CREATE TEMP TABLE bench_slim AS
+            SELECT i.id, i.repo, i.rkey, i.cid, i.text, i.created_at, i.embedding, {", ".join("f." + c for c in FIELD_COLUMNS)}
+            FROM bench_inline i JOIN bench_fields f USING (id)
+        """)
+        await conn.execute("ALTER TABLE bench_slim ADD PRIMARY KEY (id)")
+
+        await conn.execute("CREATE TEMP TABLE bench_raw (post_id INTEGER PRIMARY KEY, raw BYTEA NOT NULL)")
+        compressed = [(post_id, compress_record(record)) for post_id, record in records]
+        await conn.copy_records_to_table("bench_raw", records=compressed)
+
+        live = await conn.fetchrow("""
+            SELECT pg_total_relation_size('posts') AS bytes,
+                   (SELECT reltuples FROM pg_class WHERE oid = 'posts'::regclass) AS rows
+        """)
+        layouts = {
+            "inline": await relation_bytes(conn, "bench_inline"),
+            "slim": await relation_bytes(conn, "bench_slim"),
+            "compressed": await relation_bytes(conn, "bench_slim", "bench_raw"),
+        }
+        # Per-post bytes of the live table not captured by the copies (extra indexes etc.)
+        overhead = max(live["bytes"] / max(live["rows"], 1) - layouts["inline"] / count, 0)
+
+        json_bytes = sum(len(json.dumps(record, separators=(",", ":"))) for _, record in records) / count
+        zlib_bytes = sum(len(data) for _, data in compressed) / count
+        print(f"raw record: {json_bytes:.0f} B as JSON, {zlib_bytes:.0f} B compressed; "
+              f"other per-post overhead {overhead:.0f} B\n")
+
+        print(f"{'layout':<12} {'B/post':>8} {'vs inline':>10} {'posts kept':>14}")
+        for name, total in layouts.items():
+            per_post = total / count
+            kept = SIZE_LIMIT_BYTES / (per_post + overhead)
+            print(f"{name:<12} {per_post:8.0f} {per_post / (layouts['inline'] / count):9.0%} {kept:14,.0f}")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sample", type=int, default=20000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,172 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_SIZE = 20000  # in-memory entries (~1.5 KB each)
+DEFAULT_PERSIST_LIMIT = 500000  # rows kept in the on-disk tier
+PERSIST_TRIM_EVERY = 1000  # writes between trims of the on-disk tier
+STATS_INTERVAL = 60  # seconds between cache stats log lines
+
+
+def normalize(text: str) -> str:
+    """Text as the model sees it: all-MiniLM-L6-v2's tokenizer is uncased and
+    splits on whitespace, so case and spacing never change the embedding."""
+    return " ".join((text or "").lower().split())
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.blake2b(normalize(text).encode(), digest_size=16).digest()
+
+
+class EmbeddingCache:
+    """Content-hash cache in front of an Embedder.
+
+    Keys are a hash of the normalized text, so duplicate posts, repeated alt
+    texts and recurring handles/display names are embedded once. A bounded
+    in-memory LRU serves most hits; with EMBEDDING_CACHE_PATH set, a SQLite
+    file keeps embeddings across restarts. That file records the embedder's
+    identity (model contents, quantization, pooling) and is emptied when it
+    was filled by a different one.
+
+    Environment overrides:
+        EMBEDDING_CACHE_SIZE=N            in-memory entries (0 disables the cache)
+        EMBEDDING_CACHE_PATH=file.db      enable the persistent tier
+        EMBEDDING_CACHE_PERSIST_LIMIT=N   rows kept on disk
+    """
+
+    def __init__(self, embedder):
+        self.embedder = embedder
+        self.size = int(os.getenv("EMBEDDING_CACHE_SIZE", DEFAULT_CACHE_SIZE))
+        self.persist_limit = int(os.getenv("EMBEDDING_CACHE_PERSIST_LIMIT", DEFAULT_PERSIST_LIMIT))
+        self.entries = OrderedDict()
+
+        self.db = None
+        path = os.getenv("EMBEDDING_CACHE_PATH")
+        if path and self.size:
+            self.db = sqlite3.connect(path)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL, used_at REAL NOT NULL)"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS embeddings_used_at_idx ON embeddings (used_at)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self._check_identity()
+            self.db.commit()
+        self.writes = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.inference_seconds = 0.0
+        self.logged_at = time.time()
+
+    def _check_identity(self):
+        identity = self.embedder.identity()
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'embedder'").fetchone()
+        if row is not None and row[0] == identity:
+            return
+        if row is not None:
+            deleted = self.db.execute("DELETE FROM embeddings").rowcount
+            logger.info(f"Embedding cache: embedder changed ({row[0]} -> {identity}); dropped {deleted} stored vectors")
+        elif self.db.execute("SELECT 1 FROM embeddings LIMIT 1").fetchone():
+            # Filled before identities were recorded: its model is unknown
+            self.db.execute("DELETE FROM embeddings")
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('embedder', ?)", (identity,))
+
+    def _remember(self, key: bytes, vector: np.ndarray):
+        self.entries[key] = vector
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def _load_from_disk(self, keys: list[bytes]) -> dict:
+        found = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = self.db.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def _save_to_disk(self, items: dict):
+        now = time.time()
+        self.db.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector, used_at) VALUES (?, ?, ?)",
+            [(key, vector.astype(np.float32).tobytes(), now) for key, vector in items.items()],
+        )
+        self.writes += len(items)
+        if self.writes >= PERSIST_TRIM_EVERY:
+            self.writes = 0
+            self.db.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (self.persist_limit,),
+            )
+        self.db.commit()
+
+    def encode(self, texts) -> np.ndarray:
+        """Same contract as Embedder.encode, served from the cache where possible."""
+        if isinstance(texts, str):
+            texts = [texts]
+        if not self.size:
+            return self.embedder.encode(texts)
+
+        keys = [text_key(text) for text in texts]
+        vectors = {}
+        for key in keys:
+            if key in self.entries and key not in vectors:
+                self.entries.move_to_end(key)
+                vectors[key] = self.entries[key]
+                self.memory_hits += 1
+
+        missing = list(dict.fromkeys(key for key in keys if key not in vectors))
+        if missing and self.db is not None:
+            found = self._load_from_disk(missing)
+            for key, vector in found.items():
+                self._remember(key, vector)
+                vectors[key] = vector
+            self.disk_hits += len(found)
+            missing = [key for key in missing if key not in found]
+
+        if missing:
+            first_text = {}
+            for key, text in zip(keys, texts):
+                first_text.setdefault(key, text)
+            start = time.perf_counter()
+            embedded = self.embedder.encode([first_text[key] for key in missing])
+            self.inference_seconds += time.perf_counter() - start
+            self.misses += len(missing)
+            new = dict(zip(missing, embedded))
+            for key, vector in new.items():
+                self._remember(key, vector)
+                vectors[key] = vector
+            if self.db is not None:
+                self._save_to_disk(new)
+
+        self.log_stats()
+        return np.stack([vectors[key] for key in keys])
+
+    def log_stats(self, force: bool = False):
+        """Log hit rates and inference time saved every STATS_INTERVAL seconds."""
+        if not force and time.time() - self.logged_at < STATS_INTERVAL:
+            return
+        self.logged_at = time.time()
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        if not lookups:
+            return
+        per_text = self.inference_seconds / self.misses if self.misses else 0.0
+        logger.info(
+            f"Embedding cache: {hits}/{lookups} hits ({hits / lookups:.1%}; memory {self.memory_hits}, "
+            f"disk {self.disk_hits}), {len(self.entries)} cached, ~{hits * per_text:.1f}s inference saved"
+        )
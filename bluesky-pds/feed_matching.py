@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import os
+import time
+
+import aiohttp
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MATCH_THRESHOLD = 0.45  # min raw cosine similarity to one of a feed's topics
+MATCH_BATCH_SIZE = 64  # posts scored per matrix multiply
+MATCH_BATCH_TIMEOUT = 2.0  # seconds a partial batch may wait before scoring
+TOPICS_REFRESH_INTERVAL = 60  # seconds between feed topic reloads
+FEED_CANDIDATE_LIMIT = 2000  # max pooled posts kept per feed
+TRIM_EVERY = 50  # batches between trims of oversized pools
+
+CREATE_FEED_CANDIDATES_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS feed_candidates (
+    feed_uri TEXT NOT NULL,
+    post_id INTEGER NOT NULL,
+    score REAL NOT NULL,
+    created_at TIMESTAMP,
+    PRIMARY KEY (feed_uri, post_id)
+);
+CREATE INDEX IF NOT EXISTS feed_candidates_feed_created_at_idx
+    ON feed_candidates (feed_uri, created_at DESC);
+"""
+
+INSERT_FEED_CANDIDATES_SQL = """
+INSERT INTO feed_candidates (feed_uri, post_id, score, created_at)
+SELECT * FROM unnest($1::text[], $2::integer[], $3::real[], $4::timestamp[])
+ON CONFLICT (feed_uri, post_id) DO UPDATE SET score = EXCLUDED.score;
+"""
+
+# Pools of feeds that were deleted (not in $1) or whose topics changed ($2)
+PURGE_FEED_CANDIDATES_SQL = """
+DELETE FROM feed_candidates
+WHERE NOT (feed_uri = ANY($1::text[])) OR feed_uri = ANY($2::text[]);
+"""
+
+TRIM_FEED_CANDIDATES_SQL = """
+DELETE FROM feed_candidates fc
+USING (
+    SELECT feed_uri, post_id
+    FROM (
+        SELECT feed_uri, post_id,
+               row_number() OVER (PARTITION BY feed_uri ORDER BY created_at DESC) AS rn
+        FROM feed_candidates
+        WHERE feed_uri = ANY($1::text[])
+    ) ranked
+    WHERE rn > $2
+) stale
+WHERE fc.feed_uri = stale.feed_uri AND fc.post_id = stale.post_id;
+"""
+
+
+class FeedMatcher:
+    """Scores ingested posts against every active feed's topics.
+
+    All feeds' topic embeddings live in one (topics x 384) matrix, so a
+    micro-batch of posts is matched against every feed with a single matrix
+    multiply. Matches are appended to the bounded `feed_candidates` table,
+    which the feed manager reads instead of running per-topic KNN searches.
+    Pools of deleted feeds, and of feeds whose topics changed, are dropped
+    after the topic reload that notices it.
+    """
+
+    def __init__(self, encode):
+        self.encode = encode  # text -> unit-length 384-dim vector
+        # Feed manager endpoint listing every feed's topic preferences (read after load_dotenv)
+        self.feed_manager_url = os.getenv("FEED_MANAGER_URL")
+        self.feed_manager_api_key = os.getenv("FEED_MANAGER_API_KEY", "")
+        self.threshold = float(os.getenv("FEED_MATCH_THRESHOLD", DEFAULT_MATCH_THRESHOLD))
+        self.topic_vectors = {}  # topic name -> embedding, reused across reloads
+        self.matrix = np.zeros((0, 384), dtype=np.float32)
+        self.priorities = np.zeros(0, dtype=np.float32)
+        self.feed_uris = []
+        self.feed_starts = np.zeros(0, dtype=np.int64)  # first matrix row of each feed
+        self.feed_topics = None  # feed uri -> topic names at the last load (None before the first)
+        self.changed_feeds = None  # feeds whose pools must be dropped, set on reload
+        self.pending = []
+        self.pending_since = None
+        self.batches = 0
+        self.loaded_at = 0.0
+
+    def load_topics(self, feeds: list[dict]):
+        """Rebuild the topic matrix from [{"feed": uri, "topics": [{"name", "priority"}]}]."""
+        rows, priorities, feed_uris, starts = [], [], [], []
+        feed_topics = {}
+        for feed in feeds:
+            topics = feed.get("topics") or []
+            if not topics:
+                continue
+            feed_uris.append(feed["feed"])
+            feed_topics[feed["feed"]] = sorted(topic["name"] for topic in topics)
+            starts.append(len(rows))
+            for topic in topics:
+                name = topic["name"]
+                if name not in self.topic_vectors:
+                    self.topic_vectors[name] = np.asarray(self.encode(name), dtype=np.float32)
+                rows.append(self.topic_vectors[name])
+                priorities.append(float(topic.get("priority", 1.0)))
+
+        self.matrix = np.stack(rows) if rows else np.zeros((0, 384), dtype=np.float32)
+        self.priorities = np.array(priorities, dtype=np.float32)
+        self.feed_uris = feed_uris
+        self.feed_starts = np.array(starts, dtype=np.int64)
+        self.loaded_at = time.time()
+
+        # Pools of removed feeds are purged on the first load (feeds may have been
+        # deleted while the ingester was down) and whenever the feed set changes
+        previous = self.feed_topics
+        if previous is None or previous != feed_topics:
+            self.changed_feeds = [
+                uri for uri, names in feed_topics.items()
+                if previous is not None and uri in previous and previous[uri] != names
+            ]
+        self.feed_topics = feed_topics
+        logger.info(f"Loaded {len(rows)} topics for {len(feed_uris)} feeds into the matcher")
+
+    async def refresh_topics(self, session: aiohttp.ClientSession):
+        """Reload feed topics from the feed manager if the matrix is stale."""
+        if not self.feed_manager_url or time.time() - self.loaded_at < TOPICS_REFRESH_INTERVAL:
+            return
+        self.loaded_at = time.time()
+        try:
+            async with session.get(
+                f"{self.feed_manager_url}/feed-topics",
+                headers={"x-api-key": self.feed_manager_api_key},
+                timeout=10,
+            ) as resp:
+                if resp.status != 200:
+                    logger.warning(f"Failed to load feed topics: {resp.status}")
+                    return
+                feeds = await resp.json()
+            self.load_topics(feeds)
+        except Exception as e:
+            logger.error(f"Error loading feed topics: {e}")
+
+    def score(self, embeddings: np.ndarray) -> np.ndarray:
+        """Return a (posts x feeds) matrix of each feed's best priority-weighted topic score.
+
+        A topic only counts if its raw cosine similarity reaches the threshold,
+        so priority ranks matches without making low-priority topics harder
+        to match; feeds with no matching topic score -inf.
+        """
+        similarity = embeddings @ self.matrix.T
+        weighted = np.where(similarity >= self.threshold, similarity * self.priorities, -np.inf)
+        return np.maximum.reduceat(weighted, self.feed_starts, axis=1)
+
+    async def purge_stale(self, db):
+        """Drop pooled posts of feeds that were removed or whose topics changed."""
+        changed, self.changed_feeds = self.changed_feeds, None
+        try:
+            result = await db.execute(PURGE_FEED_CANDIDATES_SQL, self.feed_uris, changed)
+        except Exception as e:
+            # Retried with the next post
+            self.changed_feeds = changed if self.changed_feeds is None else self.changed_feeds + changed
+            logger.error(f"Error purging stale feed candidates: {e}")
+            return
+        logger.info(f"Purged stale feed candidates ({result.split()[-1]} rows, {len(changed)} feeds with new topics)")
+
+    async def add(self, db, post_id: int, embedding, created_at):
+        """Queue one ingested post; scores and stores the batch when full or old."""
+        if self.changed_feeds is not None:
+            await self.purge_stale(db)
+        if not len(self.feed_uris):
+            return
+        if not self.pending:
+            self.pending_since = time.time()
+        self.pending.append((post_id, embedding, created_at))
+        if len(self.pending) >= MATCH_BATCH_SIZE or time.time() - self.pending_since >= MATCH_BATCH_TIMEOUT:
+            await self.flush(db)
+
+    async def flush(self, db):
+        """Score the pending micro-batch and append matches to feed_candidates."""
+        batch, self.pending = self.pending, []
+        if not batch or not len(self.feed_uris):
+            return
+
+        embeddings = np.asarray([item[1] for item in batch], dtype=np.float32)
+        embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        scores = self.score(embeddings)
+        post_idx, feed_idx = np.nonzero(scores > -np.inf)
+        if not len(post_idx):
+            return
+
+        await db.execute(
+            INSERT_FEED_CANDIDATES_SQL,
+            [self.feed_uris[f] for f in feed_idx],
+            [batch[p][0] for p in post_idx],
+            scores[post_idx, feed_idx].tolist(),
+            [batch[p][2] for p in post_idx],
+        )
+        logger.info(f"Matched {len(post_idx)} post/feed pairs from a batch of {len(batch)}")
+
+        self.batches += 1
+        if self.batches % TRIM_EVERY == 0:
+            await db.execute(TRIM_FEED_CANDIDATES_SQL, self.feed_uris, FEED_CANDIDATE_LIMIT)
+
+    async def run_timeouts(self, db):
+        """Flush partial batches when the firehose is quiet, until cancelled."""
+        while True:
+            await asyncio.sleep(MATCH_BATCH_TIMEOUT)
+            if self.pending and time.time() - self.pending_since >= MATCH_BATCH_TIMEOUT:
+                try:
+                    await self.flush(db)
+                except Exception as e:
+                    logger.error(f"Error flushing feed matches: {e}", exc_info=True)
@@ -0,0 +1,201 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DIM = 384
+TAIL_BATCH = 5000  # rows fetched per tail query
+TAIL_INTERVAL = 2.0  # seconds between tail queries once caught up
+COMPACT_EVERY = 600  # seconds between drops of rows older than the window
+
+TAIL_POSTS_SQL = """
+SELECT id, extract(epoch FROM created_at) AS created, embedding::real[] AS embedding
+FROM posts
+WHERE id > $1 AND embedding IS NOT NULL
+ORDER BY id
+LIMIT $2
+"""
+
+# First post inside the window, to start from when there is nothing on disk
+WINDOW_START_SQL = """
+SELECT coalesce(min(id), (SELECT max(id) FROM posts), 0) - 1
+FROM (SELECT id FROM posts WHERE created_at >= to_timestamp($1) AT TIME ZONE 'utc' ORDER BY id LIMIT 1) first
+"""
+
+
+class HotPostIndex:
+    """In-process exact vector search over the last `hours` of posts.
+
+    Embeddings, post ids and creation times live in memory-mapped files
+    under `path` (float32 matrix, int64 ids, float64 epoch seconds), so a
+    restart reopens them and only tails the posts added since `last_id`.
+    New rows are appended by polling `posts` for ids above `last_id`; rows
+    older than the window are dropped by rewriting the files into a new
+    generation, which searches already running keep reading from the old
+    one. Deletes and edits (re-embeddings) aren't tailed: the caller loads
+    the returned ids from Postgres, which drops deleted or pruned posts and
+    re-scores edited ones on their current embedding.
+
+    Environment overrides:
+        HOT_INDEX_HOURS=48          window kept in memory (0 disables the index)
+        HOT_INDEX_PATH=hot_index    directory for the memory-mapped files
+        HOT_INDEX_CAPACITY=1000000  max rows held (~1.5 KB each on disk)
+    """
+
+    def __init__(self):
+        self.hours = float(os.getenv("HOT_INDEX_HOURS", 0))
+        self.path = os.getenv("HOT_INDEX_PATH", "hot_index")
+        self.capacity = int(os.getenv("HOT_INDEX_CAPACITY", 1_000_000))
+        self.enabled = self.hours > 0
+        self.ready = False
+        self.last_id = None
+        self.generation = 0
+        # (embeddings, ids, created, count) swapped as a whole so readers see a consistent view
+        self.view = None
+        self.compacted_at = time.time()
+        self._lock = threading.Lock()  # serializes appends and compaction (not searches)
+
+    # Files
+    def _files(self, generation: int):
+        return {
+            "embeddings": os.path.join(self.path, f"embeddings.{generation}.f32"),
+            "ids": os.path.join(self.path, f"ids.{generation}.i64"),
+            "created": os.path.join(self.path, f"created.{generation}.f64"),
+        }
+
+    def _open(self, generation: int, mode: str):
+        files = self._files(generation)
+        return (
+            np.memmap(files["embeddings"], dtype=np.float32, mode=mode, shape=(self.capacity, DIM)),
+            np.memmap(files["ids"], dtype=np.int64, mode=mode, shape=(self.capacity,)),
+            np.memmap(files["created"], dtype=np.float64, mode=mode, shape=(self.capacity,)),
+        )
+
+    def _save_meta(self):
+        embeddings, ids, created, count = self.view
+        for array in (embeddings, ids, created):
+            array.flush()
+        meta_path = os.path.join(self.path, "meta.json")
+        with open(meta_path + ".tmp", "w") as f:
+            json.dump({"generation": self.generation, "count": count, "last_id": self.last_id,
+                       "capacity": self.capacity, "hours": self.hours}, f)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    def _remove_generation(self, generation: int):
+        for file in self._files(generation).values():
+            if os.path.exists(file):
+                os.remove(file)
+
+    def open(self) -> bool:
+        """Reopen the index from disk; returns False if it has to be rebuilt."""
+        os.makedirs(self.path, exist_ok=True)
+        meta_path = os.path.join(self.path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta["capacity"] == self.capacity:
+                self.generation = meta["generation"]
+                self.last_id = meta["last_id"]
+                self.view = (*self._open(self.generation, "r+"), meta["count"])
+                logger.info(f"Hot index: reopened {meta['count']} posts through id {self.last_id}")
+                return True
+            logger.info("Hot index: capacity changed; rebuilding")
+        self.view = (*self._open(self.generation, "w+"), 0)
+        return False
+
+    # Writes
+    def append(self, rows):
+        """Append (id, created epoch, embedding) rows fetched in id order."""
+        if not rows:
+            return
+        with self._lock:
+            embeddings, ids, created, count = self.view
+            if count + len(rows) > self.capacity:
+                self._compact(force=True)
+                embeddings, ids, created, count = self.view
+            rows = rows[:self.capacity - count]
+            end = count + len(rows)
+            matrix = np.array([row["embedding"] for row in rows], dtype=np.float32)
+            matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+            embeddings[count:end] = matrix
+            ids[count:end] = [row["id"] for row in rows]
+            created[count:end] = [row["created"] or 0 for row in rows]
+            self.view = (embeddings, ids, created, end)
+            self.last_id = rows[-1]["id"]
+            if time.time() - self.compacted_at >= COMPACT_EVERY:
+                self._compact()
+            self._save_meta()
+
+    def _compact(self, force: bool = False):
+        """Rewrite the rows still inside the window into a new generation of files."""
+        embeddings, ids, created, count = self.view
+        keep = np.flatnonzero(created[:count] >= time.time() - self.hours * 3600)
+        if force and len(keep) >= self.capacity * 0.9:
+            # Window doesn't fit: keep the newest 90% so appends can continue
+            keep = keep[-int(self.capacity * 0.9):]
+        self.compacted_at = time.time()
+        if len(keep) == count and not force:
+            return
+
+        old_generation = self.generation
+        self.generation += 1
+        new = self._open(self.generation, "w+")
+        new[0][:len(keep)] = embeddings[keep]
+        new[1][:len(keep)] = ids[keep]
+        new[2][:len(keep)] = created[keep]
+        self.view = (*new, len(keep))
+        self._save_meta()
+        # Searches still holding the old arrays keep working after the unlink
+        self._remove_generation(old_generation)
+        logger.info(f"Hot index: compacted {count} -> {len(keep)} posts")
+
+    # Reads
+    def covers(self, hours: float) -> bool:
+        return self.ready and hours is not None and 0 < hours <= self.hours
+
+    def search(self, vector, limit: int, hours: float):
+        """Top `limit` (post id, cosine similarity) among posts newer than `hours`."""
+        embeddings, ids, created, count = self.view
+        query = np.asarray(vector, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+
+        similarities = embeddings[:count] @ query
+        similarities[created[:count] < time.time() - hours * 3600] = -np.inf
+        limit = min(limit, count)
+        if limit == 0:
+            return []
+        top = np.argpartition(-similarities, limit - 1)[:limit]
+        top = top[np.argsort(-similarities[top])]
+        return [(int(ids[i]), float(similarities[i])) for i in top if similarities[i] > -np.inf]
+
+    # Feeding
+    async def run(self, pool):
+        """Load (or resume) the index and keep tailing new posts, until cancelled."""
+        resumed = await asyncio.to_thread(self.open)
+        if not resumed:
+            async with pool.acquire() as conn:
+                self.last_id = await conn.fetchval(WINDOW_START_SQL, time.time() - self.hours * 3600)
+            logger.info(f"Hot index: loading the last {self.hours:g}h of posts from id {self.last_id}")
+
+        while True:
+            try:
+                async with pool.acquire() as conn:
+                    rows = await conn.fetch(TAIL_POSTS_SQL, self.last_id, TAIL_BATCH)
+                if rows:
+                    await asyncio.to_thread(self.append, rows)
+                if len(rows) < TAIL_BATCH:
+                    if not self.ready:
+                        logger.info(f"Hot index: caught up with {self.view[3]} posts through id {self.last_id}")
+                    self.ready = True
+                    await asyncio.sleep(TAIL_INTERVAL)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Hot index: tail failed: {e}", exc_info=True)
+                await asyncio.sleep(TAIL_INTERVAL)
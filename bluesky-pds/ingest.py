@@ -4,12 +4,17 @@ import json
 import asyncpg
 import aiohttp
 import os
-import numpy as np
+import time
 from datetime import datetime
 from dotenv import load_dotenv
-import onnxruntime as ort
-from transformers import AutoTokenizer
+from bluesky_shared.embedding import Embedder
+from bluesky_shared.upstream import UpstreamClient, UpstreamError
 import logging
+from feed_matching import FeedMatcher, CREATE_FEED_CANDIDATES_TABLE_SQL
+from post_record import compress_record, extract_fields
+from ingest_filter import IngestFilter
+from embedding_cache import EmbeddingCache
+from post_changes import PostChanges, CREATE_POST_TOMBSTONES_TABLE_SQL
 
 # Logging setup
 logging.basicConfig(
@@ -29,15 +34,33 @@ DB_PASSWORD = os.getenv("DB_PASSWORD")
 
 # ONNX model setup
 MODEL_PATH = os.path.join(os.path.dirname(__file__), "all-MiniLM-L6-v2.onnx")
-TOKENIZER_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 
-tokenizer = AutoTokenizer.from_pretrained(TOKENIZER_NAME)
-session = ort.InferenceSession(MODEL_PATH, providers=["CPUExecutionProvider"])
+embedder = Embedder(MODEL_PATH)
+
+# Duplicate texts (spam waves, repeated alt texts, handles) are embedded once
+embedding_cache = EmbeddingCache(embedder)
+
+# Profiles of new authors come from the public AppView; when it throttles or
+# stalls, lookups fail fast (the firehose loop waits at most a second for the
+# rate limiter) and the author is stored with defaults instead
+appview = UpstreamClient(max_wait=1.0)
 
 FIREHOSE_URL = "wss://jetstream2.us-east.bsky.network/subscribe?wantedCollections=app.bsky.feed.post"
 
+# Storage type of posts.embedding for new tables: "vector" (float32) or "halfvec"
+# (float16, half the size). Existing tables are converted with migrate_embeddings.py.
+POST_EMBEDDING_TYPE = os.getenv("POST_EMBEDDING_TYPE", "vector")
+if POST_EMBEDDING_TYPE not in ("vector", "halfvec"):
+    raise ValueError(f"POST_EMBEDDING_TYPE must be 'vector' or 'halfvec', not {POST_EMBEDDING_TYPE!r}")
+
+# Where the full post record goes: "inline" (posts.raw JSONB), "compressed"
+# (zlib in the post_raw side table) or "none" (only the extracted columns are kept)
+POST_RAW_STORAGE = os.getenv("POST_RAW_STORAGE", "inline")
+if POST_RAW_STORAGE not in ("inline", "compressed", "none"):
+    raise ValueError(f"POST_RAW_STORAGE must be 'inline', 'compressed' or 'none', not {POST_RAW_STORAGE!r}")
+
 # SQL Definitions
-CREATE_POSTS_TABLE_SQL = """
+CREATE_POSTS_TABLE_SQL = f"""
 CREATE TABLE IF NOT EXISTS posts (
     id SERIAL PRIMARY KEY,
     repo TEXT,
@@ -45,8 +68,32 @@ CREATE TABLE IF NOT EXISTS posts (
     cid TEXT,
     text TEXT,
     created_at TIMESTAMP,
-    embedding VECTOR(384),
-    raw JSONB
+    embedding {POST_EMBEDDING_TYPE.upper()}(384),
+    raw JSONB,
+    langs TEXT[],
+    reply_parent TEXT,
+    reply_root TEXT,
+    embed_type TEXT,
+    mentions TEXT[],
+    links TEXT[]
+);
+"""
+
+# Typed columns added after the table was first created (for existing databases)
+ADD_POST_FIELDS_SQL = """
+ALTER TABLE posts
+    ADD COLUMN IF NOT EXISTS langs TEXT[],
+    ADD COLUMN IF NOT EXISTS reply_parent TEXT,
+    ADD COLUMN IF NOT EXISTS reply_root TEXT,
+    ADD COLUMN IF NOT EXISTS embed_type TEXT,
+    ADD COLUMN IF NOT EXISTS mentions TEXT[],
+    ADD COLUMN IF NOT EXISTS links TEXT[];
+"""
+
+CREATE_POST_RAW_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS post_raw (
+    post_id INTEGER PRIMARY KEY REFERENCES posts (id) ON DELETE CASCADE,
+    raw BYTEA NOT NULL
 );
 """
 
@@ -64,22 +111,43 @@ CREATE TABLE IF NOT EXISTS authors (
     followers_count INTEGER DEFAULT 0,
     follows_count INTEGER DEFAULT 0,
     posts_count INTEGER DEFAULT 0,
-    updated_at TIMESTAMP
+    updated_at TIMESTAMP,
+    embedding_updated_at TIMESTAMP
 );
 """
 
+# When posts_embedding last changed, so author_clusters.py can refresh incrementally
+ADD_AUTHOR_FIELDS_SQL = """
+ALTER TABLE authors ADD COLUMN IF NOT EXISTS embedding_updated_at TIMESTAMP;
+CREATE INDEX IF NOT EXISTS authors_embedding_updated_at_idx ON authors (embedding_updated_at);
+"""
+
+CREATE_POSTS_REPO_INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS posts_repo_created_at_idx
+    ON posts (repo, created_at DESC);
+"""
+
+# $6 is always sent as a vector; Postgres casts it if the column is halfvec
 INSERT_POST_SQL = """
-INSERT INTO posts (repo, rkey, cid, text, created_at, embedding, raw)
-VALUES ($1, $2, $3, $4, $5, $6, $7);
+INSERT INTO posts (
+    repo, rkey, cid, text, created_at, embedding, raw,
+    langs, reply_parent, reply_root, embed_type, mentions, links
+)
+VALUES ($1, $2, $3, $4, $5, $6::vector, $7, $8, $9, $10, $11, $12, $13)
+RETURNING id;
+"""
+
+INSERT_POST_RAW_SQL = """
+INSERT INTO post_raw (post_id, raw) VALUES ($1, $2);
 """
 
 UPSERT_AUTHOR_SQL = """
 INSERT INTO authors (
     id, handle, display_name, description, posts_text,
     display_name_embedding, handle_embedding, description_embedding, posts_embedding,
-    followers_count, follows_count, posts_count, updated_at
+    followers_count, follows_count, posts_count, updated_at, embedding_updated_at
 )
-VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13)
+VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, now() AT TIME ZONE 'utc')
 ON CONFLICT (id) DO UPDATE
 SET
     handle = EXCLUDED.handle,
@@ -93,7 +161,8 @@ SET
     followers_count = EXCLUDED.followers_count,
     follows_count = EXCLUDED.follows_count,
     posts_count = EXCLUDED.posts_count,
-    updated_at = GREATEST(EXCLUDED.updated_at, authors.updated_at);
+    updated_at = GREATEST(EXCLUDED.updated_at, authors.updated_at),
+    embedding_updated_at = EXCLUDED.embedding_updated_at;
 """
 
 
@@ -110,23 +179,21 @@ async def init_db():
     )
     await conn.execute("CREATE EXTENSION IF NOT EXISTS vector;")
     await conn.execute(CREATE_POSTS_TABLE_SQL)
+    await conn.execute(ADD_POST_FIELDS_SQL)
+    await conn.execute(CREATE_POST_RAW_TABLE_SQL)
+    await conn.execute(CREATE_POSTS_REPO_INDEX_SQL)
     await conn.execute(CREATE_AUTHORS_TABLE_SQL)
+    await conn.execute(ADD_AUTHOR_FIELDS_SQL)
+    await conn.execute(CREATE_FEED_CANDIDATES_TABLE_SQL)
+    await conn.execute(CREATE_POST_TOMBSTONES_TABLE_SQL)
     await conn.close()
     logger.info("Database initialized and tables ensured.")
 
 
 # Helper functions
-def encode_onnx(texts):
-    """Return embedding vectors using the ONNX model."""
-    if isinstance(texts, str):
-        texts = [texts]
-    inputs = tokenizer(texts, padding=True, truncation=True, return_tensors="np")
-    outputs = session.run(None, dict(inputs))
-    embeddings = outputs[0]
-    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
-    norms[norms == 0] = 1
-    embeddings = embeddings / norms
-    return embeddings
+def encode_vector(text):
+    """Return a single unit-length embedding for text."""
+    return embedding_cache.encode(text)[0]
 
 def extract_text(record):
     """Extract post text + alt text from embedded images."""
@@ -141,24 +208,26 @@ def extract_text(record):
     combined_text = text + " " + " ".join(alt_texts)
     return combined_text.strip()
 
-async def fetch_profile(session, did):
+async def fetch_profile(did):
     """Fetch profile info for a DID from Bluesky API."""
-    url = f"https://public.api.bsky.app/xrpc/app.bsky.actor.getProfile?actor={did}"
     try:
-        async with session.get(url, timeout=10) as resp:
-            if resp.status == 200:
-                data = await resp.json()
-                return {
-                    "handle": data.get("handle"),
-                    "display_name": data.get("displayName", ""),
-                    "description": data.get("description", ""),
-                    "followers_count": data.get("followersCount", 0),
-                    "follows_count": data.get("followsCount", 0),
-                    "posts_count": data.get("postsCount", 0),
-                }
-            else:
-                logger.warning(f"Failed to fetch profile for {did}: {resp.status}")
-                return None
+        resp = await appview.get("/xrpc/app.bsky.actor.getProfile", params={"actor": did})
+        if resp.status_code == 200:
+            data = resp.json()
+            return {
+                "handle": data.get("handle"),
+                "display_name": data.get("displayName", ""),
+                "description": data.get("description", ""),
+                "followers_count": data.get("followersCount", 0),
+                "follows_count": data.get("followsCount", 0),
+                "posts_count": data.get("postsCount", 0),
+            }
+        else:
+            logger.warning(f"Failed to fetch profile for {did}: {resp.status_code}")
+            return None
+    except UpstreamError as e:
+        logger.warning(f"Skipped profile for {did}: {e}")
+        return None
     except Exception as e:
         logger.error(f"Error fetching profile for {did}: {e}")
         return None
@@ -183,6 +252,17 @@ async def handle_firehose():
         )
     )
 
+    # Rules that drop posts before embedding (see ingest_filter.py)
+    ingest_filter = IngestFilter()
+
+    # Streams every embedded post against all feeds' topics
+    matcher = FeedMatcher(encode_vector)
+    asyncio.create_task(matcher.run_timeouts(db))
+
+    # Deletes and updates are applied in batches
+    post_changes = PostChanges(embedding_cache.encode)
+    asyncio.create_task(post_changes.run_timeouts(db))
+
     async with aiohttp.ClientSession() as session:
         while True:
             try:
@@ -196,14 +276,20 @@ async def handle_firehose():
                             collection = commit.get("collection")
                             operation = commit.get("operation")
 
-                            if collection != "app.bsky.feed.post" or operation != "create":
+                            if collection != "app.bsky.feed.post":
                                 continue
 
                             repo = evt.get("did")
                             rkey = commit.get("rkey")
+
+                            if operation == "delete":
+                                await post_changes.delete(db, repo, rkey)
+                                continue
+                            if operation not in ("create", "update"):
+                                continue
+
                             cid = commit.get("cid")
                             record = commit.get("record", {})
-                            record_json = json.dumps(record)
 
                             # Combine text + alt texts
                             combined_text = extract_text(record)
@@ -215,20 +301,49 @@ async def handle_firehose():
                                 dt = datetime.fromisoformat(created_at_str.replace("Z", "+00:00"))
                                 created_at = dt.replace(tzinfo=None)
 
+                            if operation == "update":
+                                await post_changes.update(
+                                    db, repo, rkey, cid, combined_text,
+                                    json.dumps(record) if POST_RAW_STORAGE == "inline" else None,
+                                    extract_fields(record),
+                                    compress_record(record) if POST_RAW_STORAGE == "compressed" else None,
+                                )
+                                continue
+
+                            # Skip posts no feed can use before paying for inference and storage
+                            event_time = evt["time_us"] / 1e6 if evt.get("time_us") else None
+                            ingest_filter.log_stats()
+                            if ingest_filter.check(repo, record, combined_text, created_at, event_time):
+                                continue
+
+                            fields = extract_fields(record)
+                            record_json = json.dumps(record) if POST_RAW_STORAGE == "inline" else None
+                            record_blob = compress_record(record) if POST_RAW_STORAGE == "compressed" else None
+
                             # Generate post embedding
-                            post_embedding = encode_onnx(combined_text).tolist()[0][0]
+                            inference_start = time.perf_counter()
+                            post_embedding = encode_vector(combined_text).tolist()
+                            inference_seconds = time.perf_counter() - inference_start
 
                             # Insert post
-                            await db.execute(
+                            post_id = await db.fetchval(
                                 INSERT_POST_SQL,
-                                repo, rkey, cid, combined_text, created_at, post_embedding, record_json
+                                repo, rkey, cid, combined_text, created_at, post_embedding, record_json,
+                                fields["langs"], fields["reply_parent"], fields["reply_root"],
+                                fields["embed_type"], fields["mentions"], fields["links"]
                             )
+                            if record_blob is not None:
+                                await db.execute(INSERT_POST_RAW_SQL, post_id, record_blob)
                             logger.info(f"Inserted post from {repo}")
 
+                            # Match against active feeds (scored in micro-batches)
+                            await matcher.refresh_topics(session)
+                            await matcher.add(db, post_id, post_embedding, created_at)
+
                             # Check if author exists
                             existing_author = await db.fetchrow("SELECT id FROM authors WHERE id = $1", repo)
                             if not existing_author:
-                                profile = await fetch_profile(session, repo) or {}
+                                profile = await fetch_profile(repo) or {}
                                 handle = profile.get("handle", repo)
                                 display_name = profile.get("display_name", "")
                                 description = profile.get("description", "")
@@ -239,11 +354,12 @@ async def handle_firehose():
                                 posts_text = combined_text[:500]
                                 updated_at = created_at
 
-                                # Embeddings
-                                display_name_emb = encode_onnx(display_name).tolist()[0][0]
-                                handle_emb = encode_onnx(handle).tolist()[0][0]
-                                desc_emb = encode_onnx(description).tolist()[0][0]
-                                posts_emb = encode_onnx(posts_text).tolist()[0][0]
+                                # Embeddings (one batched run)
+                                inference_start = time.perf_counter()
+                                display_name_emb, handle_emb, desc_emb, posts_emb = embedding_cache.encode(
+                                    [display_name, handle, description, posts_text]
+                                ).tolist()
+                                inference_seconds += time.perf_counter() - inference_start
 
                                 await db.execute(
                                     UPSERT_AUTHOR_SQL,
@@ -255,16 +371,25 @@ async def handle_firehose():
                             else:
                                 # Update existing author’s recent posts
                                 posts_text = combined_text[:500]
-                                posts_emb = encode_onnx(posts_text).tolist()[0][0]
+                                inference_start = time.perf_counter()
+                                posts_emb = encode_vector(posts_text).tolist()
+                                inference_seconds += time.perf_counter() - inference_start
                                 await db.execute("""
                                     UPDATE authors
                                     SET posts_text = LEFT($1 || posts_text, 500),
                                         posts_embedding = $2,
-                                        updated_at = GREATEST($3, updated_at)
+                                        updated_at = GREATEST($3, updated_at),
+                                        embedding_updated_at = now() AT TIME ZONE 'utc'
                                     WHERE id = $4
                                 """, posts_text, posts_emb, created_at, repo)
                                 logger.info(f"Updated author {repo}")
 
+                            # Approximate stored size: text + raw record (inline or compressed) + embedding
+                            embedding_bytes = 768 if POST_EMBEDDING_TYPE == "halfvec" else 1536
+                            stored_bytes = (len(combined_text.encode()) + len(record_json or "")
+                                            + len(record_blob or b"") + embedding_bytes)
+                            ingest_filter.observe(inference_seconds, stored_bytes)
+
                         except Exception as e:
                             logger.error(f"Error processing message: {e}", exc_info=True)
 
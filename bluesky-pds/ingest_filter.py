@@ -0,0 +1,126 @@
+import logging
+import os
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+STATS_INTERVAL = 60  # seconds between filter stats log lines
+QUOTE_EMBED_TYPES = ("app.bsky.embed.record", "app.bsky.embed.recordWithMedia")
+
+
+def _env_bool(name: str) -> bool:
+    value = os.getenv(name)
+    return value is not None and value.strip().lower() in {"1", "true", "t", "yes", "y"}
+
+
+class IngestFilter:
+    """Cheap per-post rules applied before a post is embedded or stored.
+
+    Each rule is switched on by an environment variable (all off by default):
+
+        INGEST_LANGS=en,es         keep only posts tagged with one of these languages
+        INGEST_KEEP_UNTAGGED=false also drop posts without a language tag (default: keep)
+        IGNORE_REPLY_POSTS=true    drop replies
+        IGNORE_QUOTE_POSTS=true    drop quote posts
+        IGNORE_ARCHIVED_POSTS=true drop posts whose createdAt is older than ARCHIVED_POST_AGE
+        ARCHIVED_POST_AGE=86400    seconds of backdating tolerated (default: one day)
+        MIN_TEXT_LENGTH=10         drop posts whose text (with alt text) is shorter
+        MAX_POSTS_PER_DID=30       cap on posts kept per author per DID_RATE_WINDOW
+        DID_RATE_WINDOW=3600       rate cap window in seconds (default: one hour)
+
+    Counts per rule are logged every STATS_INTERVAL seconds, together with
+    the inference time and storage those skipped posts would have cost,
+    estimated from the posts that were kept.
+    """
+
+    def __init__(self):
+        langs = os.getenv("INGEST_LANGS", "")
+        self.langs = {lang.strip().lower() for lang in langs.split(",") if lang.strip()}
+        self.keep_untagged = os.getenv("INGEST_KEEP_UNTAGGED", "true").strip().lower() not in {"0", "false", "f", "no", "n"}
+        self.ignore_replies = _env_bool("IGNORE_REPLY_POSTS")
+        self.ignore_quotes = _env_bool("IGNORE_QUOTE_POSTS")
+        self.ignore_archived = _env_bool("IGNORE_ARCHIVED_POSTS")
+        self.archived_age = float(os.getenv("ARCHIVED_POST_AGE", 86400))
+        self.min_text_length = int(os.getenv("MIN_TEXT_LENGTH", 0))
+        self.max_posts_per_did = int(os.getenv("MAX_POSTS_PER_DID", 0))
+        self.rate_window = float(os.getenv("DID_RATE_WINDOW", 3600))
+
+        self.window = None
+        self.did_counts = Counter()
+
+        self.seen = 0
+        self.skipped = Counter()
+        self.kept = 0
+        self.inference_seconds = 0.0
+        self.stored_bytes = 0
+        self.logged_at = time.time()
+
+    def check(self, did: str, record: dict, text: str, created_at: datetime = None, event_time: float = None):
+        """Return the name of the rule that rejects this post, or None to keep it."""
+        self.seen += 1
+        rule = self._rule(did, record, text, created_at, event_time)
+        if rule:
+            self.skipped[rule] += 1
+        return rule
+
+    def _rule(self, did, record, text, created_at, event_time):
+        if self.ignore_replies and record.get("reply"):
+            return "reply"
+
+        if self.ignore_quotes and (record.get("embed") or {}).get("$type") in QUOTE_EMBED_TYPES:
+            return "quote"
+
+        if self.langs:
+            langs = record.get("langs") or []
+            if not langs:
+                if not self.keep_untagged:
+                    return "language"
+            elif not any(lang.lower().split("-")[0] in self.langs or lang.lower() in self.langs for lang in langs):
+                return "language"
+
+        if self.ignore_archived and created_at is not None:
+            now = event_time or time.time()
+            if now - created_at.replace(tzinfo=timezone.utc).timestamp() > self.archived_age:
+                return "archived"
+
+        if len(text) < self.min_text_length:
+            return "min_length"
+
+        # Rate cap last, so only posts that would otherwise be kept count toward it
+        if self.max_posts_per_did:
+            window = int(time.time() // self.rate_window)
+            if window != self.window:
+                self.window = window
+                self.did_counts.clear()
+            self.did_counts[did] += 1
+            if self.did_counts[did] > self.max_posts_per_did:
+                return "did_rate"
+
+        return None
+
+    def observe(self, inference_seconds: float, stored_bytes: int):
+        """Record what a kept post cost, to estimate what skipped posts saved."""
+        self.kept += 1
+        self.inference_seconds += inference_seconds
+        self.stored_bytes += stored_bytes
+
+    def log_stats(self, force: bool = False):
+        """Log per-rule counts and estimated savings every STATS_INTERVAL seconds."""
+        if not force and time.time() - self.logged_at < STATS_INTERVAL:
+            return
+        self.logged_at = time.time()
+        total_skipped = sum(self.skipped.values())
+        if not self.seen:
+            return
+        per_post_seconds = self.inference_seconds / self.kept if self.kept else 0.0
+        per_post_bytes = self.stored_bytes / self.kept if self.kept else 0.0
+        rules = ", ".join(
+            f"{rule}={count} (~{count * per_post_seconds:.1f}s, ~{count * per_post_bytes / 1024 / 1024:.1f} MB)"
+            for rule, count in self.skipped.most_common()
+        ) or "none"
+        logger.info(
+            f"Ingest filter: {self.seen} seen, {total_skipped} skipped ({total_skipped / self.seen:.1%}); "
+            f"per rule: {rules}"
+        )
@@ -0,0 +1,122 @@
+"""Change how post embeddings are stored.
+
+Usage:
+    python migrate_embeddings.py --type halfvec             # float32 -> float16 (half the bytes)
+    python migrate_embeddings.py --binary-index create      # HNSW index on binary_quantize(embedding)
+    python migrate_embeddings.py --type vector --binary-index drop
+
+Changing the type rewrites the posts table under an exclusive lock (ingest
+inserts wait until it finishes) and rebuilds the embedding indexes with the
+matching operator class. Afterwards set POST_EMBEDDING_TYPE for ingest.py and
+api.py, and POST_SEARCH_BINARY=true for api.py once the bit index exists.
+Requires pgvector >= 0.7.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import re
+
+import asyncpg
+from dotenv import load_dotenv
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+DB_HOST = os.getenv("DB_HOST")
+DB_PORT = int(os.getenv("DB_PORT", 5432))
+DB_NAME = os.getenv("DB_NAME")
+DB_USER = os.getenv("DB_USER")
+DB_PASSWORD = os.getenv("DB_PASSWORD")
+
+DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+BINARY_INDEX_NAME = "posts_embedding_bit_idx"
+
+CREATE_BINARY_INDEX_SQL = f"""
+CREATE INDEX CONCURRENTLY IF NOT EXISTS {BINARY_INDEX_NAME}
+    ON posts USING hnsw ((binary_quantize(embedding)::bit(384)) bit_hamming_ops);
+"""
+
+# Indexes whose operator class is tied to the column type (e.g. vector_l2_ops)
+TYPED_INDEXES_SQL = """
+SELECT indexname, indexdef
+FROM pg_indexes
+WHERE tablename = 'posts' AND indexdef ~ '(vector|halfvec)_\\w+_ops'
+"""
+
+SIZES_SQL = """
+SELECT pg_table_size('posts') AS table_bytes,
+       pg_indexes_size('posts') AS index_bytes,
+       (SELECT avg(pg_column_size(embedding)) FROM (SELECT embedding FROM posts LIMIT 10000) s) AS embedding_bytes
+"""
+
+
+async def current_type(conn) -> str:
+    return await conn.fetchval("""
+        SELECT format_type(atttypid, atttypmod)
+        FROM pg_attribute
+        WHERE attrelid = 'posts'::regclass AND attname = 'embedding'
+    """)
+
+
+async def log_sizes(conn, label: str):
+    row = await conn.fetchrow(SIZES_SQL)
+    logger.info(
+        f"{label}: table {row['table_bytes'] / 1024 ** 2:.1f} MB, "
+        f"indexes {row['index_bytes'] / 1024 ** 2:.1f} MB, "
+        f"embedding {float(row['embedding_bytes'] or 0):.0f} B/post"
+    )
+
+
+async def change_type(conn, target: str):
+    column_type = await current_type(conn)
+    if column_type == f"{target}(384)":
+        logger.info(f"posts.embedding is already {column_type}")
+        return
+
+    indexes = await conn.fetch(TYPED_INDEXES_SQL)
+    async with conn.transaction():
+        for index in indexes:
+            logger.info(f"Dropping {index['indexname']} (recreated for {target})")
+            await conn.execute(f'DROP INDEX "{index["indexname"]}"')
+        logger.info(f"Converting posts.embedding from {column_type} to {target}(384)...")
+        await conn.execute(
+            f"ALTER TABLE posts ALTER COLUMN embedding TYPE {target}(384) USING embedding::{target}(384)"
+        )
+        for index in indexes:
+            definition = re.sub(r"\b(vector|halfvec)_(\w+_ops)", rf"{target}_\2", index["indexdef"])
+            logger.info(f"Recreating: {definition}")
+            await conn.execute(definition)
+    await conn.execute("ANALYZE posts")
+
+
+async def main(args):
+    conn = await asyncpg.connect(DATABASE_URL, command_timeout=None)
+    try:
+        await log_sizes(conn, "Before")
+        if args.type:
+            await change_type(conn, args.type)
+        if args.binary_index == "create":
+            logger.info(f"Building {BINARY_INDEX_NAME} (concurrently, ingest keeps running)...")
+            await conn.execute(CREATE_BINARY_INDEX_SQL)
+        elif args.binary_index == "drop":
+            await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {BINARY_INDEX_NAME}")
+        await log_sizes(conn, "After")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--type", choices=["vector", "halfvec"], help="storage type for posts.embedding")
+    parser.add_argument("--binary-index", choices=["create", "drop"], help="bit(384) Hamming index for over-fetch search")
+    args = parser.parse_args()
+    if not args.type and not args.binary_index:
+        parser.error("nothing to do: pass --type and/or --binary-index")
+    asyncio.run(main(args))
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+CHANGE_BATCH_SIZE = 200  # deletes/updates applied per statement
+CHANGE_BATCH_TIMEOUT = 2.0  # seconds a partial batch may wait before being applied
+TOMBSTONE_RETENTION_HOURS = 48  # how long deleted post URIs are remembered
+TRIM_EVERY = 100  # flushes between trims of old tombstones
+
+CREATE_POST_TOMBSTONES_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS post_tombstones (
+    uri TEXT PRIMARY KEY,
+    deleted_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc')
+);
+CREATE INDEX IF NOT EXISTS post_tombstones_deleted_at_idx
+    ON post_tombstones (deleted_at);
+"""
+
+# Delete stored posts, their feed matches, and remember their URIs
+DELETE_POSTS_SQL = """
+WITH deleted AS (
+    DELETE FROM posts p
+    USING unnest($1::text[], $2::text[]) AS d(repo, rkey)
+    WHERE p.repo = d.repo AND p.rkey = d.rkey
+    RETURNING p.id, p.repo, p.rkey
+), unmatched AS (
+    DELETE FROM feed_candidates WHERE post_id IN (SELECT id FROM deleted)
+)
+INSERT INTO post_tombstones (uri)
+SELECT 'at://' || repo || '/app.bsky.feed.post/' || rkey FROM deleted
+ON CONFLICT (uri) DO NOTHING;
+"""
+
+UPDATE_POST_SQL = """
+UPDATE posts
+SET cid = $3, text = $4, embedding = $5::vector, raw = $6,
+    langs = $7, reply_parent = $8, reply_root = $9, embed_type = $10, mentions = $11, links = $12
+WHERE repo = $1 AND rkey = $2;
+"""
+
+UPSERT_POST_RAW_SQL = """
+INSERT INTO post_raw (post_id, raw)
+SELECT id, $3 FROM posts WHERE repo = $1 AND rkey = $2
+ON CONFLICT (post_id) DO UPDATE SET raw = EXCLUDED.raw;
+"""
+
+TRIM_TOMBSTONES_SQL = f"""
+DELETE FROM post_tombstones
+WHERE deleted_at < (now() AT TIME ZONE 'utc') - interval '{TOMBSTONE_RETENTION_HOURS} hours';
+"""
+
+
+class PostChanges:
+    """Applies firehose deletes and updates of posts in batches.
+
+    Deletes become one DELETE per batch (which also drops the posts' feed
+    matches and records tombstones the API serves as a Bloom filter).
+    Updates are re-embedded in one batched model run and written with a
+    single pipelined executemany.
+    """
+
+    def __init__(self, encode_batch):
+        self.encode_batch = encode_batch  # texts -> (n, 384) unit-length embeddings
+        self.deletes = {}  # (repo, rkey) -> None, keeps order and dedupes
+        self.updates = {}  # (repo, rkey) -> latest (cid, text, raw_json, fields, raw_blob)
+        self.pending_since = None
+        self.failed_at = 0.0  # last failed flush; size-triggered retries wait CHANGE_BATCH_TIMEOUT after it
+        self.flushes = 0
+
+    def _queued(self):
+        if self.pending_since is None:
+            self.pending_since = time.time()
+
+    async def _maybe_flush(self, db):
+        if time.time() - self.failed_at < CHANGE_BATCH_TIMEOUT:
+            return
+        if len(self.deletes) + len(self.updates) >= CHANGE_BATCH_SIZE or \
+                time.time() - self.pending_since >= CHANGE_BATCH_TIMEOUT:
+            await self.flush(db)
+
+    def _requeue(self, deletes, updates):
+        """Put a batch that failed to apply back in front of anything queued since."""
+        for key in deletes:
+            if key not in self.updates:  # re-created and updated meanwhile: keep the newer state
+                self.deletes.setdefault(key, None)
+        for key, item in updates.items():
+            if key not in self.deletes:
+                self.updates.setdefault(key, item)
+        self._queued()
+        self.failed_at = time.time()
+
+    async def delete(self, db, repo: str, rkey: str):
+        self._queued()
+        self.updates.pop((repo, rkey), None)
+        self.deletes[(repo, rkey)] = None
+        await self._maybe_flush(db)
+
+    async def update(self, db, repo: str, rkey: str, cid: str, text: str, raw_json, fields: dict, raw_blob=None):
+        self._queued()
+        self.updates[(repo, rkey)] = (cid, text, raw_json, fields, raw_blob)
+        await self._maybe_flush(db)
+
+    async def flush(self, db):
+        deletes, self.deletes = list(self.deletes), {}
+        updates, self.updates = self.updates, {}
+        self.pending_since = None
+
+        if deletes:
+            try:
+                await db.execute(DELETE_POSTS_SQL, [repo for repo, _ in deletes], [rkey for _, rkey in deletes])
+            except Exception:
+                logger.warning(f"Requeued {len(deletes)} post deletes and {len(updates)} updates after a failed flush")
+                self._requeue(deletes, updates)
+                raise
+            logger.info(f"Applied {len(deletes)} post deletes")
+
+        if updates:
+            keys = list(updates)
+            embeddings = self.encode_batch([updates[key][1] for key in keys]).tolist()
+            rows = []
+            for (repo, rkey), embedding in zip(keys, embeddings):
+                cid, text, raw_json, fields, _ = updates[(repo, rkey)]
+                rows.append((
+                    repo, rkey, cid, text, embedding, raw_json,
+                    fields["langs"], fields["reply_parent"], fields["reply_root"],
+                    fields["embed_type"], fields["mentions"], fields["links"],
+                ))
+            try:
+                async with db.acquire() as conn, conn.transaction():
+                    await conn.executemany(UPDATE_POST_SQL, rows)
+                    raw_rows = [(repo, rkey, item[4]) for (repo, rkey), item in updates.items() if item[4] is not None]
+                    if raw_rows:
+                        await conn.executemany(UPSERT_POST_RAW_SQL, raw_rows)
+            except Exception:
+                logger.warning(f"Requeued {len(updates)} post updates after a failed flush")
+                self._requeue([], updates)
+                raise
+            logger.info(f"Applied {len(rows)} post updates")
+
+        if deletes or updates:
+            self.flushes += 1
+            if self.flushes % TRIM_EVERY == 0:
+                await db.execute(TRIM_TOMBSTONES_SQL)
+
+    async def run_timeouts(self, db):
+        """Apply partial batches when the firehose is quiet, until cancelled."""
+        while True:
+            await asyncio.sleep(CHANGE_BATCH_TIMEOUT)
+            if self.pending_since is not None and time.time() - self.pending_since >= CHANGE_BATCH_TIMEOUT:
+                try:
+                    await self.flush(db)
+                except Exception as e:
+                    logger.error(f"Error applying post changes: {e}", exc_info=True)
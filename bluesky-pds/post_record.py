@@ -0,0 +1,48 @@
+import json
+import zlib
+
+COMPRESSION_LEVEL = 6
+
+MENTION_FEATURE = "app.bsky.richtext.facet#mention"
+LINK_FEATURE = "app.bsky.richtext.facet#link"
+
+
+def extract_fields(record: dict) -> dict:
+    """Pull the parts of an app.bsky.feed.post record we query on into flat values.
+
+    Matches the typed columns of `posts`: langs, reply_parent, reply_root,
+    embed_type, mentions (DIDs) and links (facet links plus an external embed's URL).
+    """
+    reply = record.get("reply") or {}
+    embed = record.get("embed") or {}
+
+    mentions, links = [], []
+    for facet in record.get("facets") or []:
+        for feature in facet.get("features") or []:
+            kind = feature.get("$type")
+            if kind == MENTION_FEATURE and feature.get("did"):
+                mentions.append(feature["did"])
+            elif kind == LINK_FEATURE and feature.get("uri"):
+                links.append(feature["uri"])
+
+    external = embed.get("external") or (embed.get("media") or {}).get("external") or {}
+    if external.get("uri"):
+        links.append(external["uri"])
+
+    return {
+        "langs": list(record.get("langs") or []) or None,
+        "reply_parent": (reply.get("parent") or {}).get("uri"),
+        "reply_root": (reply.get("root") or {}).get("uri"),
+        "embed_type": embed.get("$type"),
+        "mentions": list(dict.fromkeys(mentions)) or None,
+        "links": list(dict.fromkeys(links)) or None,
+    }
+
+
+def compress_record(record: dict) -> bytes:
+    """zlib-compressed compact JSON, as stored in post_raw."""
+    return zlib.compress(json.dumps(record, separators=(",", ":")).encode(), COMPRESSION_LEVEL)
+
+
+def decompress_record(data: bytes) -> dict:
+    return json.loads(zlib.decompress(data))
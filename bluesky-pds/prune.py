@@ -27,8 +27,10 @@ DB_PASSWORD = os.getenv("DB_PASSWORD")
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
 async def get_table_size(conn):
+    # Compressed raw records (post_raw) are pruned with their posts, so they count too
     row = await conn.fetchrow("""
-        SELECT pg_total_relation_size($1) AS size
+        SELECT pg_total_relation_size($1)
+               + coalesce(pg_total_relation_size(to_regclass('post_raw')), 0) AS size
     """, TABLE_NAME)
     return row["size"]
 
@@ -0,0 +1,265 @@
+"""Recompute stored embeddings for posts or authors (e.g. after a model change).
+
+Usage:
+    python reembed.py posts   [--workers 4] [--batch 2048] [--max-rows-per-sec 2000]
+    python reembed.py authors [--model path/to/model.onnx] [--restart]
+
+Rows are read in keyset pages (`WHERE id > last ORDER BY id`), embedded by a
+pool of worker processes (one ONNX session each), and written back by COPY
+into a temporary staging table followed by one set-based UPDATE per page.
+An embedding whose text changed after it was read (ingest edited the post
+or the author's recent posts) is left alone, so the backfill never
+overwrites a fresher embedding.
+
+Progress is checkpointed to `reembed_<table>.json` after every page, so an
+interrupted run resumes where it stopped; `--restart` starts over.
+
+To keep live ingest and API latency in bounds, writes are paced to
+`--max-rows-per-sec`, and before every write a small probe query is timed:
+while it takes longer than `--max-probe-ms` the backfill backs off.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import asyncpg
+from dotenv import load_dotenv
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+DB_HOST = os.getenv("DB_HOST")
+DB_PORT = int(os.getenv("DB_PORT", 5432))
+DB_NAME = os.getenv("DB_NAME")
+DB_USER = os.getenv("DB_USER")
+DB_PASSWORD = os.getenv("DB_PASSWORD")
+
+DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+MODEL_PATH = os.path.join(os.path.dirname(__file__), "all-MiniLM-L6-v2.onnx")
+
+BACKOFF_MAX = 30  # seconds slept at most between probes while the database is busy
+LOCK_TIMEOUT = "2s"  # give up a page's UPDATE rather than queue behind live writes
+
+# Per table: the text columns that are embedded, in order, and the embedding column each fills
+TABLES = {
+    "posts": {
+        "first_id": 0,  # keyset start: below every SERIAL id
+        "texts": ["text"],
+        "embeddings": ["embedding"],
+    },
+    "authors": {
+        "first_id": "",  # below every DID
+        "texts": ["display_name", "handle", "description", "posts_text"],
+        "embeddings": ["display_name_embedding", "handle_embedding", "description_embedding", "posts_embedding"],
+        # Lets author_clusters.py's incremental refresh pick up the new vectors
+        "touch": "embedding_updated_at = now() AT TIME ZONE 'utc'",
+    },
+}
+
+
+def page_sql(table: str) -> str:
+    return f"""
+        SELECT id, {", ".join(TABLES[table]["texts"])}
+        FROM {table}
+        WHERE id > $1
+        ORDER BY id
+        LIMIT $2
+    """
+
+
+def staging_sql(table: str) -> str:
+    spec = TABLES[table]
+    columns = [f"{column} TEXT" for column in spec["texts"]] + [f"{column} TEXT" for column in spec["embeddings"]]
+    id_type = "INTEGER" if table == "posts" else "TEXT"
+    return f"CREATE TEMP TABLE reembed_staging (id {id_type} PRIMARY KEY, {', '.join(columns)})"
+
+
+def update_sql(table: str) -> str:
+    spec = TABLES[table]
+    # Each embedding is only replaced if its text is still the one that was embedded;
+    # assignment casts turn ::vector into halfvec where the column is halfvec
+    assignments = ",\n            ".join(
+        f"{column} = CASE WHEN t.{text} IS NOT DISTINCT FROM s.{text} THEN s.{column}::vector ELSE t.{column} END"
+        for text, column in zip(spec["texts"], spec["embeddings"])
+    )
+    if "touch" in spec:
+        assignments += f",\n            {spec['touch']}"
+    unchanged = " OR ".join(f"t.{text} IS NOT DISTINCT FROM s.{text}" for text in spec["texts"])
+    return f"""
+        UPDATE {table} t
+        SET {assignments}
+        FROM reembed_staging s
+        WHERE t.id = s.id AND ({unchanged})
+    """
+
+
+# Worker processes
+_embedder = None
+
+
+def init_worker(model_path: str, threads: int):
+    global _embedder
+    from bluesky_shared.embedding import Embedder
+    _embedder = Embedder(model_path, intra_op_threads=threads)
+    _embedder.load()
+
+
+def embed_page(texts: list[str]) -> list[str]:
+    """Embed a flat list of texts; returns pgvector text literals."""
+    vectors = _embedder.encode(texts)
+    return [f"[{','.join(map(str, vector))}]" for vector in vectors.tolist()]
+
+
+# Checkpoints
+def load_checkpoint(path: str, table: str, model_identity: str, restart: bool) -> dict:
+    """Saved progress, unless it was made by a different model (file contents,
+    quantization or pooling, see Embedder.identity) or `restart` is set."""
+    fresh = {"table": table, "model": model_identity, "last_id": None, "rows": 0, "updated": 0}
+    if restart or not os.path.exists(path):
+        return fresh
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("model") != model_identity:
+        logger.warning(f"Checkpoint was made with {checkpoint.get('model')}, not {model_identity}; starting over")
+        return fresh
+    logger.info(f"Resuming {table} after id {checkpoint['last_id']} ({checkpoint['rows']} rows done)")
+    return checkpoint
+
+
+def save_checkpoint(path: str, checkpoint: dict):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+# Throttling
+async def wait_for_headroom(conn, table: str, max_probe_ms: float):
+    """Back off while a cheap index lookup on the live table is slower than max_probe_ms."""
+    delay = 0.5
+    while True:
+        start = time.perf_counter()
+        await conn.fetchval(f"SELECT id FROM {table} ORDER BY id DESC LIMIT 1")
+        probe_ms = (time.perf_counter() - start) * 1000
+        if probe_ms <= max_probe_ms:
+            return
+        logger.info(f"Probe took {probe_ms:.0f} ms (> {max_probe_ms:.0f} ms); backing off {delay:.1f}s")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, BACKOFF_MAX)
+
+
+async def write_page(conn, table: str, rows, vectors: list[str]):
+    spec = TABLES[table]
+    width = len(spec["texts"])
+    records = [
+        (row["id"], *(row[column] for column in spec["texts"]), *vectors[i * width:(i + 1) * width])
+        for i, row in enumerate(rows)
+    ]
+    while True:
+        try:
+            async with conn.transaction():
+                await conn.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+                await conn.copy_records_to_table("reembed_staging", records=records)
+                result = await conn.execute(update_sql(table))
+                await conn.execute("TRUNCATE reembed_staging")
+            return int(result.split()[-1])
+        except asyncpg.LockNotAvailableError:
+            logger.info("Rows locked by live writes; retrying page")
+            await asyncio.sleep(1)
+
+
+async def main(args):
+    spec = TABLES[args.table]
+    checkpoint_path = args.checkpoint or f"reembed_{args.table}.json"
+    from bluesky_shared.embedding import Embedder
+    model_identity = Embedder(args.model).identity()
+    checkpoint = load_checkpoint(checkpoint_path, args.table, model_identity, args.restart)
+
+    reader = await asyncpg.connect(DATABASE_URL, command_timeout=None)
+    writer = await asyncpg.connect(DATABASE_URL, command_timeout=None)
+    await writer.execute(staging_sql(args.table))
+
+    loop = asyncio.get_running_loop()
+    # spawn: workers start clean instead of inheriting this process's event loop and connections
+    pool = ProcessPoolExecutor(
+        max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker, initargs=(args.model, args.threads),
+    )
+    inflight = deque()  # (rows, future) in id order, so checkpoints only move past written pages
+    last_read = spec["first_id"] if checkpoint["last_id"] is None else checkpoint["last_id"]
+    exhausted = False
+    started = time.time()
+    written_since_start = 0
+
+    try:
+        while True:
+            # Keep every worker busy, with one page queued behind each
+            while len(inflight) < args.workers * 2 and not exhausted:
+                rows = await reader.fetch(page_sql(args.table), last_read, args.batch)
+                if not rows:
+                    exhausted = True
+                    break
+                last_read = rows[-1]["id"]
+                texts = [row[column] or "" for row in rows for column in spec["texts"]]
+                inflight.append((rows, loop.run_in_executor(pool, embed_page, texts)))
+
+            if not inflight:
+                break
+
+            rows, future = inflight.popleft()
+            vectors = await future
+
+            await wait_for_headroom(writer, args.table, args.max_probe_ms)
+            updated = await write_page(writer, args.table, rows, vectors)
+
+            checkpoint["last_id"] = rows[-1]["id"]
+            checkpoint["rows"] += len(rows)
+            checkpoint["updated"] += updated
+            save_checkpoint(checkpoint_path, checkpoint)
+
+            written_since_start += len(rows)
+            elapsed = time.time() - started
+            logger.info(
+                f"{args.table}: {checkpoint['rows']} rows re-embedded ({checkpoint['updated']} updated), "
+                f"through id {checkpoint['last_id']}, {written_since_start / max(elapsed, 1e-9):.0f} rows/s"
+            )
+
+            # Pace to max_rows_per_sec averaged over the run
+            if args.max_rows_per_sec:
+                ahead = written_since_start / args.max_rows_per_sec - elapsed
+                if ahead > 0:
+                    await asyncio.sleep(ahead)
+
+        logger.info(f"Done: {checkpoint['rows']} {args.table} rows re-embedded in {time.time() - started:.0f}s")
+    finally:
+        for _, future in inflight:
+            future.cancel()
+        pool.shutdown(cancel_futures=True)
+        await reader.close()
+        await writer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("table", choices=list(TABLES))
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--workers", type=int, default=max((os.cpu_count() or 2) // 2, 1), help="embedding processes")
+    parser.add_argument("--threads", type=int, default=2, help="ONNX threads per worker")
+    parser.add_argument("--batch", type=int, default=2048, help="rows per page")
+    parser.add_argument("--max-rows-per-sec", type=float, default=0, help="write pacing; 0 means unpaced")
+    parser.add_argument("--max-probe-ms", type=float, default=50, help="back off while a live probe query is slower")
+    parser.add_argument("--checkpoint", help="checkpoint file (default reembed_<table>.json)")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start from the first row")
+    asyncio.run(main(parser.parse_args()))
@@ -14,6 +14,12 @@ start() {
     exit 1
   fi
 
+  # The embedder reads tokenizer.json next to the model and never downloads it at runtime
+  TOKENIZER="${EMBEDDING_TOKENIZER_PATH:-tokenizer.json}"
+  if [ ! -f "$TOKENIZER" ]; then
+    python3 -m bluesky_shared.embedding export-tokenizer "$TOKENIZER" || exit 1
+  fi
+
   nohup python3 "$SCRIPT" > "$LOG_FILE" 2>&1 &
   echo $! > "$PID_FILE"
   echo "Started $SCRIPT with PID $(cat "$PID_FILE")"
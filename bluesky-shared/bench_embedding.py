@@ -0,0 +1,77 @@
+"""Benchmark fp32 vs int8 embedding throughput and their cosine agreement.
+
+Usage:
+    python bench_embedding.py path/to/all-MiniLM-L6-v2.onnx [--texts posts.txt] [--threads 2]
+
+`--texts` is a file with one text per line (e.g. exported post texts);
+without it a synthetic mix of short and long posts is used. The int8 model
+is created next to the fp32 one if it doesn't exist yet.
+"""
+import argparse
+import os
+import random
+import time
+
+import numpy as np
+
+from bluesky_shared.embedding import Embedder, quantize_model, quantized_path
+
+WORDS = (
+    "bluesky feed crypto markets lebron game tonight webcomic artist new chapter "
+    "politics election weather storm cats dogs puppies science space launch music album "
+    "release photo sunset coffee morning code python release bug fix paper research"
+).split()
+
+
+def synthetic_texts(count: int) -> list[str]:
+    rng = random.Random(0)
+    return [" ".join(rng.choices(WORDS, k=rng.choice([3, 8, 20, 45, 90]))) for _ in range(count)]
+
+
+def throughput(embedder: Embedder, texts: list[str], rounds: int) -> tuple[float, np.ndarray]:
+    embedder.encode(texts[:32])  # warm up
+    start = time.perf_counter()
+    for _ in range(rounds):
+        embeddings = embedder.encode(texts)
+    elapsed = time.perf_counter() - start
+    return len(texts) * rounds / elapsed, embeddings
+
+
+def main(args):
+    if args.texts:
+        with open(args.texts) as f:
+            texts = [line.strip() for line in f if line.strip()][:args.count]
+    else:
+        texts = synthetic_texts(args.count)
+
+    int8_path = quantized_path(args.model)
+    if not os.path.exists(int8_path):
+        print("Quantizing model ->", quantize_model(args.model))
+
+    results = {}
+    for name, quantized in (("fp32", False), ("int8", True)):
+        embedder = Embedder(args.model, quantized=quantized, intra_op_threads=args.threads, inter_op_threads=1)
+        rate, embeddings = throughput(embedder, texts, args.rounds)
+        results[name] = embeddings
+        size_mb = os.path.getsize(embedder.model_path) / 1024 / 1024
+        print(f"{name}: {rate:8.1f} texts/s  (model {size_mb:.1f} MB, {len(texts)} texts x {args.rounds} rounds)")
+
+    agreement = np.sum(results["fp32"] * results["int8"], axis=1)
+    print(f"cosine(fp32, int8): mean={agreement.mean():.4f} p1={np.percentile(agreement, 1):.4f} min={agreement.min():.4f}")
+
+    # Does int8 change who the nearest neighbours are?
+    queries = results["fp32"][: min(100, len(texts))]
+    top_fp32 = np.argsort(-(queries @ results["fp32"].T), axis=1)[:, 1:11]
+    top_int8 = np.argsort(-(results["int8"][: len(queries)] @ results["int8"].T), axis=1)[:, 1:11]
+    overlap = np.mean([len(set(a) & set(b)) / 10 for a, b in zip(top_fp32, top_int8)])
+    print(f"top-10 neighbour overlap: {overlap:.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("model", help="path to the fp32 all-MiniLM-L6-v2.onnx")
+    parser.add_argument("--texts", help="file with one text per line")
+    parser.add_argument("--count", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=None, help="intra-op threads")
+    main(parser.parse_args())
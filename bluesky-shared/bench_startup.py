@@ -0,0 +1,112 @@
+"""Measure how long a service takes to start and to produce its first embedding.
+
+Usage:
+    python bench_startup.py --cwd ../bluesky-feed-manager server.app:app --path /
+    python bench_startup.py --cwd ../bluesky-feed-ruleset-generator main:app \\
+        --path /api/health --header x-api-key:$API_KEY
+    python bench_startup.py --model ../bluesky-pds/all-MiniLM-L6-v2.onnx
+
+For an app it reports, over `--runs` fresh processes, the time to import the
+app module and the time from launching uvicorn until `--path` first answers.
+With `--model` it also times loading the embedder (tokenizer + ONNX session)
+and its first `encode`.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import importlib
+importlib.import_module({module!r})
+print(time.perf_counter() - start)
+"""
+
+EMBEDDER_SNIPPET = """
+import time
+start = time.perf_counter()
+from bluesky_shared.embedding import Embedder
+embedder = Embedder({model!r})
+created = time.perf_counter()
+embedder.load()
+loaded = time.perf_counter()
+embedder.encode("hello world")
+encoded = time.perf_counter()
+print(created - start, loaded - created, encoded - loaded)
+"""
+
+
+def run_python(snippet: str, cwd: str) -> str:
+    result = subprocess.run([sys.executable, "-c", snippet], cwd=cwd, capture_output=True, text=True)
+    if result.returncode:
+        sys.exit(result.stderr)
+    return result.stdout.strip().splitlines()[-1]
+
+
+def time_to_first_response(app: str, cwd: str, port: int, path: str, headers: dict, timeout: float) -> float:
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--port", str(port), "--log-level", "warning"],
+        cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        request = urllib.request.Request(f"http://127.0.0.1:{port}{path}", headers=headers)
+        while time.perf_counter() - start < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {server.returncode}")
+            try:
+                urllib.request.urlopen(request, timeout=1).read()
+                return time.perf_counter() - start
+            except urllib.error.HTTPError:
+                # Any HTTP answer (even 401/404) means the app is serving
+                return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.01)
+        raise TimeoutError(f"{app} did not answer within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def summary(name: str, values: list[float]):
+    print(f"{name:<28} median={statistics.median(values) * 1000:8.1f} ms  "
+          f"min={min(values) * 1000:8.1f} ms  max={max(values) * 1000:8.1f} ms")
+
+
+def main(args):
+    cwd = os.path.abspath(args.cwd)
+    headers = dict(h.split(":", 1) for h in args.header)
+
+    if args.app:
+        module = args.app.split(":")[0]
+        summary("import app module", [float(run_python(IMPORT_SNIPPET.format(module=module), cwd)) for _ in range(args.runs)])
+        summary("launch -> first response", [
+            time_to_first_response(args.app, cwd, args.port, args.path, headers, args.timeout)
+            for _ in range(args.runs)
+        ])
+
+    if args.model:
+        model = os.path.abspath(args.model)
+        rows = [run_python(EMBEDDER_SNIPPET.format(model=model), cwd).split() for _ in range(args.runs)]
+        summary("import + Embedder()", [float(r[0]) for r in rows])
+        summary("Embedder.load()", [float(r[1]) for r in rows])
+        summary("first encode", [float(r[2]) for r in rows])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("app", nargs="?", help="uvicorn app, e.g. server.app:app")
+    parser.add_argument("--cwd", default=".", help="service directory to run from")
+    parser.add_argument("--path", default="/", help="URL path polled until it answers")
+    parser.add_argument("--header", action="append", default=[], help="extra request header, name:value")
+    parser.add_argument("--model", help="ONNX model to time embedder loading with")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    main(parser.parse_args())
@@ -0,0 +1,87 @@
+"""Compare a plain httpx client with UpstreamClient against a throttling, stalling upstream.
+
+Usage:
+    python stub_upstream.py --limit 200 --window 10 --slow 0.05 --slow-seconds 15 &
+    python bench_upstream.py --url http://localhost:8790 --requests 1000 --concurrency 50
+
+Both clients fetch getProfile `--requests` times with `--concurrency`
+callers. `plain` is what the services did before: one attempt with a fixed
+`--timeout`. `upstream` is bluesky_shared.upstream.UpstreamClient with its
+defaults (override them through the UPSTREAM_* variables). For each it
+prints how many calls succeeded, failed after waiting, or failed fast, and
+the p50/p95/max time a caller spent per call, followed by the client's own
+stats and the stub's counters.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import urllib.request
+
+import httpx
+
+from bluesky_shared.upstream import UpstreamClient, UpstreamError, UpstreamUnavailable
+
+PATH = "/xrpc/app.bsky.actor.getProfile"
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+async def run(call, requests: int, concurrency: int):
+    outcomes = {"ok": 0, "failed": 0, "failed_fast": 0}
+    times = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                r = await call(f"did:plc:bench{i}")
+                outcomes["ok" if r.status_code == 200 else "failed"] += 1
+            except UpstreamUnavailable:
+                outcomes["failed_fast"] += 1
+            except (UpstreamError, httpx.HTTPError):
+                outcomes["failed"] += 1
+            times.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return outcomes, times, time.perf_counter() - start
+
+
+async def main(args):
+    print(f"{'client':<10} {'ok':>6} {'failed':>7} {'fast':>6} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'wall s':>7}")
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as plain:
+        results = {"plain": await run(lambda did: plain.get(PATH, params={"actor": did}), args.requests, args.concurrency)}
+
+    client = UpstreamClient(args.url)
+    try:
+        results["upstream"] = await run(lambda did: client.get(PATH, params={"actor": did}), args.requests, args.concurrency)
+    finally:
+        await client.aclose()
+
+    for name, (outcomes, times, wall) in results.items():
+        print(f"{name:<10} {outcomes['ok']:6} {outcomes['failed']:7} {outcomes['failed_fast']:6} "
+              f"{statistics.median(times) * 1000:8.0f} {percentile(times, 0.95) * 1000:8.0f} "
+              f"{max(times) * 1000:8.0f} {wall:7.1f}")
+
+    print("\nUpstreamClient stats:", json.dumps(client.stats()))
+    try:
+        with urllib.request.urlopen(f"{args.url}/stats", timeout=5) as response:
+            print("Stub counters:", response.read().decode())
+    except OSError:
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8790")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--timeout", type=float, default=10.0, help="plain client's fixed timeout")
+    asyncio.run(main(parser.parse_args()))
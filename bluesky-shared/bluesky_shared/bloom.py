@@ -0,0 +1,62 @@
+import base64
+import hashlib
+import math
+
+import numpy as np
+
+
+class BloomFilter:
+    """Compact set membership test with false positives but no false negatives.
+
+    Used to ship "recently deleted post URIs" from the PDS API to the feed
+    manager: a few bits per URI instead of the URIs themselves. Positions use
+    double hashing over one blake2b digest, so both sides agree as long as
+    they share this module.
+    """
+
+    def __init__(self, size_bits: int, hash_count: int, bits: np.ndarray = None):
+        self.size_bits = max(int(size_bits), 8)
+        self.hash_count = max(int(hash_count), 1)
+        self.bits = bits if bits is not None else np.zeros((self.size_bits + 7) // 8, dtype=np.uint8)
+        self.count = 0
+
+    @classmethod
+    def for_capacity(cls, capacity: int, error_rate: float = 0.01) -> "BloomFilter":
+        """Size a filter to hold `capacity` items at roughly `error_rate` false positives."""
+        capacity = max(capacity, 1)
+        size_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        hash_count = round(size_bits / capacity * math.log(2))
+        return cls(size_bits, hash_count)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size_bits for i in range(self.hash_count)]
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def update(self, items):
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def to_dict(self) -> dict:
+        return {
+            "size_bits": self.size_bits,
+            "hash_count": self.hash_count,
+            "count": self.count,
+            "bits": base64.b64encode(self.bits.tobytes()).decode(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "BloomFilter":
+        bits = np.frombuffer(base64.b64decode(data["bits"]), dtype=np.uint8).copy()
+        bloom = cls(data["size_bits"], data["hash_count"], bits)
+        bloom.count = data.get("count", 0)
+        return bloom
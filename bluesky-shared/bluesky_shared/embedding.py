@@ -0,0 +1,206 @@
+import hashlib
+import os
+import sys
+import threading
+
+import numpy as np
+
+TOKENIZER_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_DIM = 384
+MAX_BATCH_SIZE = 64  # texts per ONNX run
+MAX_SEQ_LENGTH = 256  # all-MiniLM-L6-v2 was trained with 256-token inputs
+POOLING = "mean-l2"  # how _run/encode turn token outputs into a vector; change it when they change
+
+
+def _env_int(name: str):
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+def _env_bool(name: str) -> bool:
+    value = os.getenv(name)
+    return value is not None and value.strip().lower() in {"1", "true", "t", "yes", "y"}
+
+
+def quantized_path(model_path: str) -> str:
+    """Path of the int8 variant that sits next to an fp32 model file."""
+    root, ext = os.path.splitext(model_path)
+    return f"{root}.int8{ext}"
+
+
+def tokenizer_path(model_path: str) -> str:
+    """Path of the local `tokenizer.json` that sits next to a model file."""
+    return os.getenv("EMBEDDING_TOKENIZER_PATH") or os.path.join(os.path.dirname(model_path), "tokenizer.json")
+
+
+def quantize_model(model_path: str, output_path: str = None) -> str:
+    """Write a dynamically int8-quantized copy of an ONNX model and return its path."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    output_path = output_path or quantized_path(model_path)
+    quantize_dynamic(model_path, output_path, weight_type=QuantType.QInt8)
+    return output_path
+
+
+def export_tokenizer(output_path: str, tokenizer_name: str = TOKENIZER_NAME) -> str:
+    """Save the model's fast tokenizer as a standalone `tokenizer.json` (needs the `export` extra: transformers)."""
+    from transformers import AutoTokenizer
+
+    AutoTokenizer.from_pretrained(tokenizer_name).backend_tokenizer.save(output_path)
+    return output_path
+
+
+class Embedder:
+    """Sentence embeddings from the all-MiniLM-L6-v2 ONNX model.
+
+    Token embeddings are mean-pooled over the attention mask (what
+    sentence-transformers does for this model) and L2-normalized, so dot
+    products are cosine similarities. Texts are sorted by token length and
+    run in batches to keep padding, and therefore wasted compute, low.
+
+    Nothing is loaded until the first `encode` (or an explicit `load`, e.g.
+    from a lifespan warm-up), so importing a service stays fast. The tokenizer
+    is read from a `tokenizer.json` next to the model with the lightweight
+    `tokenizers` package, so neither `transformers` nor the network is touched;
+    export it once with `python -m bluesky_shared.embedding export-tokenizer`.
+
+    Environment overrides:
+        EMBEDDING_QUANTIZED=true       use the int8 model (`<model>.int8.onnx`)
+        EMBEDDING_TOKENIZER_PATH=path  local tokenizer.json (default: next to the model)
+        EMBEDDING_INTRA_OP_THREADS=N   threads used inside one operator
+        EMBEDDING_INTER_OP_THREADS=N   operators run in parallel
+    """
+
+    def __init__(self, model_path: str, tokenizer_name: str = TOKENIZER_NAME, quantized: bool = None,
+                 intra_op_threads: int = None, inter_op_threads: int = None,
+                 max_batch_size: int = MAX_BATCH_SIZE):
+        if quantized is None:
+            quantized = _env_bool("EMBEDDING_QUANTIZED")
+        self.model_path = quantized_path(model_path) if quantized else model_path
+        self.tokenizer_path = tokenizer_path(model_path)
+        self.tokenizer_name = tokenizer_name
+        self.intra_op_threads = intra_op_threads or _env_int("EMBEDDING_INTRA_OP_THREADS")
+        self.inter_op_threads = inter_op_threads or _env_int("EMBEDDING_INTER_OP_THREADS")
+        self.max_batch_size = max_batch_size
+
+        self.session = None
+        self._tokenize = None
+        # Guards loading, and fast tokenizers are not safe to call from several threads at once
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self.session is not None
+
+    def identity(self) -> str:
+        """Fingerprint of everything that decides the vectors: the model file's
+        contents (so also the int8 toggle), the pooling and the input length.
+
+        Caches that outlive the process check it, so a swapped model never
+        serves vectors computed by the previous one.
+        """
+        digest = hashlib.sha256()
+        with open(self.model_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return (f"{os.path.basename(self.model_path)}:{digest.hexdigest()[:16]}:"
+                f"{POOLING}:{MAX_SEQ_LENGTH}:{self.tokenizer_name}")
+
+    def load(self):
+        """Load the tokenizer and ONNX session (idempotent, thread-safe)."""
+        with self._lock:
+            self._load()
+
+    def _load(self):
+        if self.session is not None:
+            return
+
+        if not os.path.exists(self.tokenizer_path):
+            raise FileNotFoundError(
+                f"Tokenizer file {self.tokenizer_path} not found. Export it once with "
+                f"`python -m bluesky_shared.embedding export-tokenizer {self.tokenizer_path}` "
+                f"(or point EMBEDDING_TOKENIZER_PATH at an existing tokenizer.json)"
+            )
+
+        from tokenizers import Tokenizer
+
+        tokenizer = Tokenizer.from_file(self.tokenizer_path)
+        tokenizer.enable_truncation(MAX_SEQ_LENGTH)
+        tokenizer.no_padding()
+
+        def tokenize(texts):
+            encodings = tokenizer.encode_batch(texts)
+            return [e.ids for e in encodings], [e.type_ids for e in encodings]
+
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.intra_op_threads:
+            options.intra_op_num_threads = self.intra_op_threads
+        if self.inter_op_threads:
+            options.inter_op_num_threads = self.inter_op_threads
+
+        session = ort.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in session.get_inputs()}
+        self._tokenize = tokenize
+        self.session = session
+
+    def _run(self, ids: list[list[int]], type_ids: list[list[int]]) -> np.ndarray:
+        width = max(len(row) for row in ids)
+        input_ids = np.zeros((len(ids), width), dtype=np.int64)
+        token_type_ids = np.zeros((len(ids), width), dtype=np.int64)
+        attention_mask = np.zeros((len(ids), width), dtype=np.int64)
+        for i, (row, types) in enumerate(zip(ids, type_ids)):
+            input_ids[i, :len(row)] = row
+            token_type_ids[i, :len(types)] = types
+            attention_mask[i, :len(row)] = 1
+
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask, "token_type_ids": token_type_ids}
+        feeds = {k: v for k, v in inputs.items() if k in self.input_names}
+        token_embeddings = self.session.run(None, feeds)[0]
+
+        # Mean pooling over real (non-padding) tokens
+        mask = attention_mask[..., None].astype(np.float32)
+        summed = (token_embeddings * mask).sum(axis=1)
+        counts = np.clip(mask.sum(axis=1), 1e-9, None)
+        return summed / counts
+
+    def encode(self, texts) -> np.ndarray:
+        """Return an (n, 384) float32 array of unit-length embeddings."""
+        if isinstance(texts, str):
+            texts = [texts]
+        texts = [text or "" for text in texts]
+        if not texts:
+            return np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+
+        with self._lock:
+            self._load()
+            ids, type_ids = self._tokenize(texts)
+
+            # Group similar lengths together so each batch pads as little as possible
+            order = np.argsort([len(row) for row in ids], kind="stable")
+
+            embeddings = np.empty((len(texts), EMBEDDING_DIM), dtype=np.float32)
+            for start in range(0, len(texts), self.max_batch_size):
+                idx = order[start:start + self.max_batch_size]
+                embeddings[idx] = self._run([ids[i] for i in idx], [type_ids[i] for i in idx])
+
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return embeddings / norms
+
+
+USAGE = """Usage:
+    python -m bluesky_shared.embedding quantize <model.onnx>
+    python -m bluesky_shared.embedding export-tokenizer <output/tokenizer.json>"""
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit(USAGE)
+    if sys.argv[1] == "quantize":
+        print("Wrote", quantize_model(sys.argv[2]))
+    elif sys.argv[1] == "export-tokenizer":
+        print("Wrote", export_tokenizer(sys.argv[2]))
+    else:
+        sys.exit(USAGE)
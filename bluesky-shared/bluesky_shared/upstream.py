@@ -0,0 +1,349 @@
+import asyncio
+import email.utils
+import os
+import random
+import time
+from collections import Counter, deque
+
+import httpx
+
+DEFAULT_BASE_URL = "https://public.api.bsky.app"
+RETRY_STATUSES = {429, 502, 503, 504}
+LATENCY_WINDOW = 512  # recent latencies kept for percentiles and the hedge delay
+HEDGE_MIN_SAMPLES = 50  # latencies needed before the hedge delay is derived from them
+HEDGE_MIN_DELAY = 0.05  # never hedge sooner than this (seconds)
+MIN_RATE_FRACTION = 0.05  # header-driven pacing never drops below this share of `rate`
+BACKOFF_BASE = 0.25  # seconds; retry n sleeps up to BACKOFF_BASE * 2**n (full jitter)
+BACKOFF_MAX = 5.0
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _seconds_until(value: str):
+    """Delay encoded in Retry-After / RateLimit-Reset: delta seconds, epoch seconds or an HTTP date."""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        try:
+            return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return None
+    # Bluesky sends an epoch timestamp, the IETF draft a number of seconds
+    return max(number - time.time(), 0.0) if number > 1e9 else max(number, 0.0)
+
+
+class UpstreamError(Exception):
+    """The upstream could not be reached, even after retries."""
+
+
+class UpstreamUnavailable(UpstreamError):
+    """Failed fast without a request: the circuit is open or the rate limit resets too late."""
+
+
+class TokenBucket:
+    """Paces requests to `rate` per second, allowing bursts of up to `burst`.
+
+    Not thread-safe: meant to be used from one event loop.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0  # monotonic time before which nothing is sent (server-announced reset)
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Seconds until a token is available (0 if one is available now)."""
+        now = time.monotonic()
+        self._refill(now)
+        wait = max(self.paused_until - now, 0.0)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def try_take(self) -> bool:
+        if self.delay() > 0:
+            return False
+        self.tokens -= 1
+        return True
+
+    async def take(self, max_wait: float):
+        """Wait for a token; raises UpstreamUnavailable if that would take longer than `max_wait`."""
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait = self.delay()
+            if wait == 0:
+                self.tokens -= 1
+                return
+            if time.monotonic() + wait > deadline:
+                raise UpstreamUnavailable(f"rate limited for another {wait:.1f}s")
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = min(self.tokens, 0.0)
+
+
+class CircuitBreaker:
+    """Opens after `failures` consecutive failures and rejects calls for `reset_after` seconds.
+
+    After that one trial call is let through (half-open): success closes
+    the circuit, failure opens it again.
+    """
+
+    def __init__(self, failures: int, reset_after: float):
+        self.threshold = max(failures, 1)
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.opens = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_after:
+            return "open"
+        return "half-open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "open" or self.trial:
+            return False
+        self.trial = True
+        return True
+
+    def release(self):
+        """The trial call ended without an outcome (cancelled or never sent)."""
+        self.trial = False
+
+    def record(self, ok: bool):
+        if ok:
+            self.failures = 0
+            self.opened_at = None
+        else:
+            self.failures += 1
+            if self.trial or (self.opened_at is None and self.failures >= self.threshold):
+                self.opens += self.opened_at is None
+                self.opened_at = time.monotonic()
+        self.trial = False
+
+
+class UpstreamClient:
+    """Shared HTTP client for a rate-limited upstream (by default Bluesky's public AppView).
+
+    - Pacing: a token bucket sends at most `rate` requests/second. When a
+      response's RateLimit-Remaining/RateLimit-Reset headers show the window
+      running out, the rate drops to spread what's left over the rest of it;
+      a 429 (or RateLimit-Remaining: 0) pauses every request until the reset.
+    - Failing fast: an attempt that would wait more than `max_wait` for the
+      bucket, or that arrives while the circuit breaker is open (after
+      `breaker_failures` consecutive timeouts/5xx), raises
+      UpstreamUnavailable immediately instead of waiting out a timeout.
+    - Retries: 429/502/503/504 and transport errors are retried up to
+      `retries` times with jittered exponential backoff (POSTs only when the
+      upstream said it didn't process the request).
+    - Hedging: a GET still unanswered after `hedge_after` seconds (default:
+      the recent p95 latency) is sent a second time if the bucket has a token
+      to spare; the first usable response wins.
+
+    Final HTTP responses are returned whatever their status, so callers keep
+    checking `status_code`; UpstreamError is raised when there is none.
+    `stats()` reports counters, latency percentiles and breaker state.
+
+    Environment overrides:
+        UPSTREAM_RATE=10              requests/second (per process)
+        UPSTREAM_BURST=20             bucket size
+        UPSTREAM_TIMEOUT=10           seconds per attempt
+        UPSTREAM_MAX_WAIT=10          longest wait for the bucket before failing fast
+        UPSTREAM_HEDGE_AFTER=         fixed hedge delay in seconds (0 disables hedging)
+        UPSTREAM_BREAKER_FAILURES=5   consecutive failures that open the circuit
+        UPSTREAM_BREAKER_RESET=30     seconds the circuit stays open
+    """
+
+    def __init__(self, base_url: str = None, name: str = "appview", rate: float = None, burst: float = None,
+                 timeout: float = None, max_wait: float = None, hedge_after: float = None, retries: int = 2,
+                 breaker_failures: int = None, breaker_reset: float = None):
+        self.base_url = (base_url or os.getenv("BSKY_PUBLIC_API_URL") or DEFAULT_BASE_URL).rstrip("/")
+        self.name = name
+        self.rate = rate or _env_float("UPSTREAM_RATE", 10)
+        self.timeout = timeout or _env_float("UPSTREAM_TIMEOUT", 10)
+        self.max_wait = max_wait if max_wait is not None else _env_float("UPSTREAM_MAX_WAIT", self.timeout)
+        self.hedge_after = hedge_after if hedge_after is not None else _env_float("UPSTREAM_HEDGE_AFTER", None)
+        self.retries = retries
+        self.bucket = TokenBucket(self.rate, burst or _env_float("UPSTREAM_BURST", 2 * self.rate))
+        self.breaker = CircuitBreaker(
+            int(breaker_failures or _env_float("UPSTREAM_BREAKER_FAILURES", 5)),
+            breaker_reset or _env_float("UPSTREAM_BREAKER_RESET", 30),
+        )
+        self.metrics = Counter()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self._http = None
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        # Created on first use, inside the event loop that will use it
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 5.0)),
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            )
+        return self._http
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    # Rate limits
+    def _observe_rate_limit(self, response: httpx.Response):
+        headers = response.headers
+        reset = _seconds_until(headers.get("ratelimit-reset"))
+        remaining = headers.get("ratelimit-remaining")
+        if response.status_code == 429:
+            self.metrics["throttled"] += 1
+            retry_after = _seconds_until(headers.get("retry-after"))
+            pause = retry_after if retry_after is not None else reset
+            self.bucket.pause(pause if pause is not None else BACKOFF_MAX)
+        elif remaining is not None and reset is not None and remaining.isdigit():
+            if int(remaining) <= 0:
+                self.bucket.pause(reset)
+            # Spread what's left of the window over the time left in it
+            self.bucket.rate = max(min(self.rate, int(remaining) / max(reset, 1.0)), self.rate * MIN_RATE_FRACTION)
+
+    def _hedge_delay(self):
+        if self.hedge_after is not None:
+            return self.hedge_after or None
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        p95 = sorted(self.latencies)[int(len(self.latencies) * 0.95)]
+        return max(p95, HEDGE_MIN_DELAY)
+
+    # Sending
+    async def _attempt(self, method: str, url: str, **kwargs) -> httpx.Response:
+        start = time.perf_counter()
+        try:
+            response = await self.http.request(method, url, **kwargs)
+        except httpx.TimeoutException:
+            self.metrics["timeouts"] += 1
+            self.breaker.record(False)
+            raise
+        except httpx.TransportError:
+            self.metrics["errors"] += 1
+            self.breaker.record(False)
+            raise
+        except (asyncio.CancelledError, Exception):
+            self.breaker.release()
+            raise
+        self.latencies.append(time.perf_counter() - start)
+        self.metrics[f"status_{response.status_code // 100}xx"] += 1
+        self._observe_rate_limit(response)
+        self.breaker.record(response.status_code < 500)
+        return response
+
+    async def _send(self, method: str, url: str, hedge: bool, **kwargs) -> httpx.Response:
+        first = asyncio.ensure_future(self._attempt(method, url, **kwargs))
+        tasks = [first]
+        try:
+            delay = self._hedge_delay() if hedge else None
+            if delay is None:
+                return await first
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or self.breaker.state != "closed" or not self.bucket.try_take():
+                return await first
+
+            self.metrics["hedges"] += 1
+            tasks.append(asyncio.ensure_future(self._attempt(method, url, **kwargs)))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and task.result().status_code not in RETRY_STATUSES:
+                        if task is not first:
+                            self.metrics["hedge_wins"] += 1
+                        return task.result()
+            # Neither was usable: prefer a response over an exception
+            for task in reversed(tasks):
+                if task.exception() is None:
+                    return task.result()
+            return first.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Send a request (`url` relative to base_url, or absolute) with pacing, retries and hedging."""
+        method = method.upper()
+        idempotent = method in ("GET", "HEAD")
+        self.metrics["requests"] += 1
+        response = error = None
+
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                self.metrics["rejected"] += 1
+                raise UpstreamUnavailable(f"{self.name}: circuit open")
+            try:
+                await self.bucket.take(self.max_wait)
+            except UpstreamUnavailable:
+                self.breaker.release()
+                self.metrics["rejected"] += 1
+                raise
+
+            try:
+                response, error = await self._send(method, url, idempotent, **kwargs), None
+            except httpx.TransportError as e:
+                response, error = None, e
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                return response
+
+            retryable = idempotent or (response is not None and response.status_code in (429, 503))
+            if not retryable or attempt == self.retries:
+                break
+            # 429s wait in the bucket until the announced reset; everything else backs off
+            backoff = 0.0 if response is not None and response.status_code == 429 else \
+                random.uniform(0, min(BACKOFF_BASE * 2 ** attempt, BACKOFF_MAX))
+            if max(backoff, self.bucket.delay()) > self.max_wait:
+                break
+            self.metrics["retries"] += 1
+            await asyncio.sleep(backoff)
+
+        if response is not None:
+            return response
+        raise UpstreamError(f"{self.name}: {method} {url} failed: {error!r}") from error
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    def stats(self) -> dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(fraction):
+            return round(latencies[min(int(len(latencies) * fraction), len(latencies) - 1)] * 1000, 1) if latencies else None
+
+        return {
+            "upstream": self.base_url,
+            **self.metrics,
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "breaker": self.breaker.state,
+            "breaker_opens": self.breaker.opens,
+            "rate": round(self.bucket.rate, 2),
+            "paused_for": round(max(self.bucket.paused_until - time.monotonic(), 0.0), 1),
+        }
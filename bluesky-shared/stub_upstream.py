@@ -0,0 +1,136 @@
+"""Local stand-in for the Bluesky AppView that throttles, stalls and fails on demand.
+
+Usage:
+    python stub_upstream.py --port 8790 --limit 100 --window 10 --slow 0.05 --slow-seconds 15
+    export BSKY_PUBLIC_API_URL=http://localhost:8790
+
+Answers getPosts, getAuthorFeed, getProfile and searchActors with made-up
+data. Requests beyond `--limit` per fixed `--window` get a 429 with
+Retry-After, and every response carries RateLimit-Limit/Remaining/Reset
+headers the way the AppView sends them (reset as an epoch timestamp). A
+`--slow` fraction of requests stalls for `--slow-seconds`, a `--fail`
+fraction returns 503, and `--outage-every N --outage-for M` makes every
+request hang for M seconds out of each N. Counts are served at `/stats`.
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+calls = Counter()
+window = {"start": time.time(), "used": 0}
+lock = threading.Lock()
+
+
+def fake_did(seed: str) -> str:
+    return f"did:plc:stub{hashlib.sha1(seed.encode()).hexdigest()[:12]}"
+
+
+def fake_post(uri: str) -> dict:
+    return {
+        "uri": uri,
+        "cid": "bafystub",
+        "author": {"did": uri.split("/")[2] if uri.count("/") >= 2 else fake_did(uri), "handle": "stub.bsky.social"},
+        "record": {"$type": "app.bsky.feed.post", "text": f"stub post {uri[-6:]}", "createdAt": "2026-01-01T00:00:00Z"},
+        "likeCount": 0, "repostCount": 0, "replyCount": 0,
+        "indexedAt": "2026-01-01T00:00:00Z",
+    }
+
+
+def respond(method: str, params: dict) -> dict:
+    if method == "app.bsky.feed.getPosts":
+        return {"posts": [fake_post(uri) for uri in params.get("uris", [])]}
+    if method == "app.bsky.feed.getAuthorFeed":
+        actor = params.get("actor", [""])[0]
+        limit = int(params.get("limit", ["20"])[0])
+        return {"feed": [{"post": fake_post(f"at://{actor}/app.bsky.feed.post/stub{i}")} for i in range(limit)]}
+    if method == "app.bsky.actor.getProfile":
+        actor = params.get("actor", [""])[0]
+        return {"did": actor, "handle": "stub.bsky.social", "displayName": "Stub", "description": "",
+                "followersCount": 10, "followsCount": 10, "postsCount": 10}
+    if method == "app.bsky.actor.searchActors":
+        q = params.get("q", [""])[0]
+        return {"actors": [{"did": fake_did(f"{q}{i}")} for i in range(int(params.get("limit", ["4"])[0]))]}
+    return {}
+
+
+def make_handler(args):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *_):
+            pass
+
+        def send_json(self, status: int, body: dict, headers: dict = None):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            try:
+                self.wfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                calls["abandoned"] += 1  # client gave up (timeout or lost hedge)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/stats":
+                return self.send_json(200, dict(calls))
+            calls["requests"] += 1
+
+            now = time.time()
+            with lock:
+                if now - window["start"] >= args.window:
+                    window["start"], window["used"] = now, 0
+                window["used"] += 1
+                used, reset = window["used"], window["start"] + args.window
+            rate_headers = {
+                "RateLimit-Limit": str(args.limit),
+                "RateLimit-Remaining": str(max(args.limit - used, 0)),
+                "RateLimit-Reset": str(int(reset)),
+                "RateLimit-Policy": f"{args.limit};w={args.window}",
+            }
+            if used > args.limit:
+                calls["429"] += 1
+                return self.send_json(429, {"error": "RateLimitExceeded"},
+                                      {**rate_headers, "Retry-After": str(max(int(reset - now), 1))})
+
+            if args.outage_every and now % args.outage_every < args.outage_for:
+                calls["outage"] += 1
+                time.sleep(args.outage_for - now % args.outage_every)
+            elif random.random() < args.slow:
+                calls["slow"] += 1
+                time.sleep(args.slow_seconds)
+            else:
+                time.sleep(args.latency * random.uniform(0.5, 1.5))
+
+            if random.random() < args.fail:
+                calls["503"] += 1
+                return self.send_json(503, {"error": "Unavailable"}, rate_headers)
+            calls["200"] += 1
+            self.send_json(200, respond(url.path.rsplit("/", 1)[-1], parse_qs(url.query)), rate_headers)
+
+    return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8790)
+    parser.add_argument("--limit", type=int, default=3000, help="requests allowed per window")
+    parser.add_argument("--window", type=int, default=300, help="rate-limit window in seconds")
+    parser.add_argument("--latency", type=float, default=0.05, help="typical response time in seconds")
+    parser.add_argument("--slow", type=float, default=0.0, help="fraction of requests that stall")
+    parser.add_argument("--slow-seconds", type=float, default=15.0)
+    parser.add_argument("--fail", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--outage-every", type=float, default=0, help="seconds between outages (0 = none)")
+    parser.add_argument("--outage-for", type=float, default=10, help="length of each outage in seconds")
+    args = parser.parse_args()
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args))
+    server.daemon_threads = True
+    print(f"Stub AppView on http://127.0.0.1:{args.port}")
+    server.serve_forever()